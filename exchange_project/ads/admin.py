@@ -1,6 +1,85 @@
 from django.contrib import admin
+from django.db.models import F
+from django.utils import timezone
 
-from .models import Ad,ExchangeProposal
+from . import cycles, inbox, services
+from .models import Ad,ExchangeProposal,Task
 
-admin.site.register(Ad)
-admin.site.register(ExchangeProposal)
\ No newline at end of file
+
+@admin.register(Ad)
+class AdAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'category', 'condition', 'created_at')
+    list_filter = ('category', 'condition')
+    list_select_related = ('user',)
+    search_fields = ('title',)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Как и в edit_ad: новая версия сбрасывает кэш карточки
+            obj.version = F('version') + 1
+        super().save_model(request, obj, form, change)
+        if change and 'user' in form.changed_data:
+            # Полученные предложения переходят к новому автору вместе с объявлением
+            ExchangeProposal.objects.filter(ad_receiver=obj).update(receiver_user=obj.user)
+            inbox.rebuild({form.initial['user'], obj.user_id})
+
+    def delete_model(self, request, obj):
+        services.remove_ad(obj)
+
+    def delete_queryset(self, request, queryset):
+        # Модерация: массовое удаление без загрузки объявлений и предложений
+        services.remove_ads(queryset)
+
+
+@admin.register(ExchangeProposal)
+class ExchangeProposalAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'user', 'status', 'created_at')
+    list_filter = ('status',)
+    raw_id_fields = ('user', 'ad_sender', 'ad_receiver')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_listing()
+
+    # Правки в админке меняют предложения напрямую; счетчики затронутых
+    # объявлений и сводки их авторов пересчитываются целиком
+
+    def _reconcile(self, ads, users):
+        ads = Ad.objects.filter(pk__in=ads)
+        services.reconcile_counters(ads)
+        inbox.rebuild(set(users) | set(ads.values_list('user_id', flat=True)))
+
+    def save_model(self, request, obj, form, change):
+        ads = {obj.ad_sender_id, obj.ad_receiver_id}
+        for field in ('ad_sender', 'ad_receiver'):
+            if form.initial.get(field):
+                ads.add(form.initial[field])
+        users = {obj.user_id, form.initial.get('user')}
+        if change:
+            cycles.proposals_closed([obj.pk])
+        super().save_model(request, obj, form, change)
+        self._reconcile(ads, users - {None})
+        cycles.proposal_created(obj)
+
+    def delete_model(self, request, obj):
+        services.remove_proposal(obj)
+
+    def delete_queryset(self, request, queryset):
+        ads, users = set(), set()
+        for sender_id, receiver_id, user_id in queryset.values_list('ad_sender_id', 'ad_receiver_id', 'user_id'):
+            ads.update((sender_id, receiver_id))
+            users.add(user_id)
+        cycles.proposals_closed(queryset)
+        super().delete_queryset(request, queryset)
+        self._reconcile(ads, users)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key', 'status', 'attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('key',)
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        queryset.exclude(status='R').update(status='Q', attempts=0, run_at=timezone.now())
@@ -0,0 +1,159 @@
+"""
+JSON API только для чтения, версия 1 (``/api/v1/``).
+
+Строки выбираются через ``.values()`` — без создания экземпляров моделей —
+и листаются курсором, как HTML-страницы. Ответы несут сильный ETag из
+максимального ``created_at``/``updated_at`` строк ответа, их id и курсоров;
+запрос с совпадающим ``If-None-Match`` получает 304 без сериализации тела.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_GET
+
+from .decorators import api_login_required, query_budget
+from .models import Ad, ExchangeProposal
+from .pagination import CursorPaginator, InvalidCursor, DEFAULT_ORDERING
+
+API_VERSION = 'v1'
+PAGE_SIZE = 20
+
+AD_FIELDS = (
+    'id', 'title', 'description', 'image_url', 'category', 'condition',
+    'created_at', 'updated_at', 'user_id',
+)
+PROPOSAL_FIELDS = (
+    'id', 'status', 'comment', 'created_at', 'updated_at', 'user_id',
+    'ad_sender_id', 'ad_receiver_id', 'receiver_user_id',
+)
+
+
+def _ad(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'image_url': row['image_url'],
+        'category': row['category'],
+        'condition': row['condition'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'user': {'id': row['user_id'], 'username': row['username']},
+    }
+
+
+def _proposal(row):
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'comment': row['comment'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'sender_id': row['user_id'],
+        'ad_sender': {'id': row['ad_sender_id'], 'title': row['ad_sender_title']},
+        'ad_receiver': {
+            'id': row['ad_receiver_id'],
+            'title': row['ad_receiver_title'],
+            'user_id': row['receiver_user_id'],
+        },
+    }
+
+
+def etag(*parts):
+    """Сильный ETag (в кавычках) по JSON-представлению частей"""
+    payload = json.dumps([API_VERSION, *parts], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return '"%s"' % hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _last_modified(rows, fields=('created_at', 'updated_at')):
+    return max((row[field] for row in rows for field in fields if row[field] is not None), default=None)
+
+
+def _respond(request, tag, build):
+    """304 при совпадении If-None-Match, иначе JSON из build()"""
+    response = get_conditional_response(request, etag=tag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = tag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _page(request, queryset, serialize, modified_fields=('created_at', 'updated_at')):
+    paginator = CursorPaginator(queryset, PAGE_SIZE, queryset.query.order_by or DEFAULT_ORDERING)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return _error('Некорректный курсор.', 400)
+
+    rows = page.object_list
+    tag = etag(
+        _last_modified(rows, modified_fields),
+        [row['id'] for row in rows],
+        page.next_cursor,
+        page.previous_cursor,
+    )
+    return _respond(request, tag, lambda: {
+        'results': [serialize(row) for row in rows],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_GET
+@api_login_required
+@query_budget(5, max_time_ms=250)
+def ad_list(request):
+    """Лента объявлений; фильтры search, category, condition — как на главной"""
+    search_query = request.GET.get('search', '')
+    ads = Ad.objects.feed(
+        search=search_query,
+        category=request.GET.get('category', ''),
+        condition=request.GET.get('condition', ''),
+    )
+
+    fields = AD_FIELDS + (('search_rank',) if search_query else ())
+    rows = ads.values(*fields, username=F('user__username'))
+    return _page(request, rows, _ad)
+
+
+@require_GET
+@api_login_required
+@query_budget(5)
+def ad_detail(request, pk):
+    """Объявление по id"""
+    row = Ad.objects.filter(pk=pk).values(*AD_FIELDS, username=F('user__username')).first()
+    if row is None:
+        return _error('Объявление не найдено.', 404)
+
+    return _respond(request, etag(row['id'], row['created_at'], row['updated_at']), lambda: _ad(row))
+
+
+@require_GET
+@api_login_required
+@query_budget(5, max_time_ms=250)
+def proposal_list(request):
+    """Предложения текущего пользователя; фильтры type (sent/received) и status"""
+    proposals = ExchangeProposal.objects.for_user(request.user, request.GET.get('type', ''))
+    status_filter = request.GET.get('status', '')
+    if status_filter:
+        proposals = proposals.filter(status=status_filter)
+
+    rows = proposals.values(
+        *PROPOSAL_FIELDS,
+        ad_sender_title=F('ad_sender__title'),
+        ad_sender_updated_at=F('ad_sender__updated_at'),
+        ad_receiver_title=F('ad_receiver__title'),
+        ad_receiver_updated_at=F('ad_receiver__updated_at'),
+    )
+    # Переименование объявления тоже меняет ответ, поэтому его updated_at входит в ETag
+    modified_fields = ('created_at', 'updated_at', 'ad_sender_updated_at', 'ad_receiver_updated_at')
+    return _page(request, rows, _proposal, modified_fields)
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class AdsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ads'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+        from .dbpool import check_pool_size
+
+        checks.register(check_pool_size)
+
+        post_migrate.connect(_ensure_search_backend, sender=self)
+
+
+def _ensure_search_backend(sender, using, **kwargs):
+    from django.db import connections
+    from .search import ensure_search_backend
+
+    ensure_search_backend(connections[using])
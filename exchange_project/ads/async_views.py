@@ -0,0 +1,147 @@
+"""
+Асинхронные версии представлений для чтения: index, ad_detail, my_proposals
+и proposal_detail.
+
+Подключаются вместо синхронных в ads/urls.py, когда включен ``ADS_ASYNC_VIEWS``
+(его выставляет config/asgi.py). Запросы идут через асинхронный ORM Django
+(``afirst``, ``acount``, ``async for``), кэш — через ``aget_many``/``aset_many``.
+Пользователь берется из ``request.auser()``: шаблоны обращаются к ``user``,
+и ленивая синхронная загрузка в event loop недопустима.
+
+Изменяющие запросы (POST в ad_detail) передаются синхронным представлениям
+из ads/views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, render
+
+from . import fragments, inbox, streams, views
+from .counts import acount_ads
+from .decorators import proposal_role_required, query_budget
+from .forms import ProposalForm
+from .models import Ad, ExchangeProposal
+from .pagination import apaginate, page_total
+
+
+async def _resolve_user(request):
+    """
+    Загружает пользователя и сводку его предложений асинхронно, чтобы шаблоны
+    не трогали ленивые request.user и контекстный процессор proposal_inbox
+    """
+    request.user = await request.auser()
+    request.inbox = await inbox.aget_summary(request.user.pk)
+    return request.user
+
+
+@login_required
+@query_budget(7, max_time_ms=250)
+async def index(request):
+    """
+    Главная страница с поиском, фильтрацией и пагинацией объявлений
+    """
+    await _resolve_user(request)
+    search_query = request.GET.get('search', '')
+    category_filter = request.GET.get('category', '')
+    condition_filter = request.GET.get('condition', '')
+
+    ads = Ad.objects.feed(search_query, category_filter, condition_filter)
+    total_results = await acount_ads(search_query, category_filter, condition_filter)
+    ads_page = await apaginate(request, ads, 10, count=lambda: total_results)
+
+    context = {
+        'ads': ads_page,
+        'ad_cards': await fragments.arender_cards(ads_page),
+        'search_query': search_query,
+        'category_filter': category_filter,
+        'condition_filter': condition_filter,
+        'categories': Ad.CATEGORIES,
+        'conditions': Ad.CONDITIONS,
+        'total_results': total_results,
+        'has_filters': bool(search_query or category_filter or condition_filter)
+    }
+
+    return render(request, 'ads/index.html', context)
+
+
+@login_required
+@query_budget(14, max_time_ms=250)
+async def ad_detail(request, pk):
+    """
+    Просмотр объявления; отправка предложения (POST) выполняется синхронным представлением
+    """
+    if request.method != 'GET':
+        return await sync_to_async(views.ad_detail)(request, pk)
+
+    user = await _resolve_user(request)
+    ad = await aget_object_or_404(Ad.objects.select_related('user').defer('search_vector'), pk=pk)
+
+    # Варианты выбора читаются заранее: шаблон не может выполнять запросы в event loop
+    form = ProposalForm()
+    field = form.fields['ad_sender']
+    field.choices = [('', field.empty_label)] + [
+        (choice.pk, str(choice)) async for choice in Ad.objects.filter(user=user).only('pk', 'title')
+    ]
+
+    return render(request, 'ads/ad_detail.html', {
+        'ad': ad,
+        'form': form,
+        'is_author': ad.user_id == user.pk,
+    })
+
+
+@login_required
+@query_budget(7, max_time_ms=250)
+async def my_proposals(request):
+    """
+    Просмотр предложений обмена пользователя
+    """
+    user = await _resolve_user(request)
+    status_filter = request.GET.get('status', '')
+    proposal_type = request.GET.get('type', '')
+
+    proposals = ExchangeProposal.objects.for_user(user, proposal_type).for_listing()
+    if proposal_type == 'sent':
+        title = "Мои отправленные предложения"
+    elif proposal_type == 'received':
+        title = "Полученные предложения"
+    else:
+        title = "Все предложения обмена"
+
+    if status_filter:
+        proposals = proposals.filter(status=status_filter)
+
+    proposals_page = await apaginate(
+        request, proposals, 10, count=lambda: inbox.count(request.inbox, proposal_type, status_filter),
+    )
+
+    context = {
+        'proposals': proposals_page,
+        'title': title,
+        'status_filter': status_filter,
+        'proposal_type': proposal_type,
+        'status_choices': ExchangeProposal.STATUS_CHOICES,
+        'total_proposals': page_total(proposals_page),
+        'events_url': streams.events_url(),
+    }
+
+    return render(request, 'ads/my_proposals.html', context)
+
+
+@login_required
+@query_budget(7, max_time_ms=250)
+@proposal_role_required(
+    'participant', "У вас нет прав для просмотра этого предложения.", redirect_to='my_proposals',
+    queryset=ExchangeProposal.objects.for_listing(with_text=True),
+)
+async def proposal_detail(request, pk):
+    """
+    Детальный просмотр предложения обмена
+    """
+    user = await _resolve_user(request)
+    proposal = request.proposal
+
+    return render(request, 'ads/proposal_detail.html', {
+        'proposal': proposal,
+        'is_sender': proposal.user_id == user.pk,
+        'is_receiver': proposal.receiver_user_id == user.pk,
+    })
@@ -0,0 +1,27 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import inbox
+
+
+def proposal_inbox(request):
+    """
+    Сводка предложений пользователя для шапки (base.html): ``inbox`` — все
+    количества, ``total_pending_proposals`` — полученные и ожидающие ответа.
+
+    Значения ленивые: сводка читается (из кэша) только если шаблон ее выводит.
+    Асинхронные представления загружают ее заранее в ``request.inbox``.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+
+    def load():
+        if getattr(request, 'inbox', None) is None:
+            request.inbox = inbox.get_summary(user.pk)
+        return request.inbox
+
+    summary = SimpleLazyObject(load)
+    return {
+        'inbox': summary,
+        'total_pending_proposals': SimpleLazyObject(lambda: summary['received_pending']),
+    }
@@ -0,0 +1,161 @@
+"""
+Кэшируемые и приблизительные количества результатов ленты объявлений.
+
+Количество для набора фильтров (search, category, condition) хранится в кэше.
+Ключи включают номер поколения, который увеличивается сигналами сохранения
+и удаления Ad, — так весь кэш количеств сбрасывается одной операцией. Поколение
+увеличивается сразу и еще раз после коммита: иначе параллельный запрос мог бы
+сохранить количество до коммита под новым поколением. Пропавшее из кэша
+поколение начинается заново со значения времени, а не с 1, — старые ключи
+не оживают.
+
+Для ленты без фильтров и с фильтром только по категории на PostgreSQL
+при большой таблице используется оценка планировщика (``pg_class.reltuples``
+и ``EXPLAIN``) вместо ``COUNT(*)``.
+"""
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from . import metrics
+from .models import Ad
+
+GENERATION_KEY = 'ads:count:generation'
+
+
+class ResultCount:
+    """Количество результатов; ``estimated`` — оценка планировщика, а не точный COUNT"""
+
+    def __init__(self, value, estimated=False):
+        self.value = value
+        self.estimated = estimated
+
+    def __repr__(self):
+        return f'<ResultCount {self}>'
+
+    def __str__(self):
+        return f'~{self.value}' if self.estimated else str(self.value)
+
+    def __int__(self):
+        return self.value
+
+    def __eq__(self, other):
+        if isinstance(other, ResultCount):
+            return (self.value, self.estimated) == (other.value, other.estimated)
+        return self.value == other
+
+    def __hash__(self):
+        return hash((self.value, self.estimated))
+
+
+def _cache():
+    return caches[getattr(settings, 'ADS_COUNT_CACHE', 'default')]
+
+
+def _fresh_generation():
+    # Больше любого поколения, выданного до вытеснения ключа из кэша
+    return time.time_ns()
+
+
+def _generation(cache):
+    return cache.get_or_set(GENERATION_KEY, _fresh_generation, timeout=None)
+
+
+def _bump():
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _fresh_generation(), timeout=None)
+
+
+def invalidate():
+    """Сбрасывает все закэшированные количества (новое поколение ключей): сейчас и после коммита"""
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def normalize_filters(search='', category='', condition=''):
+    return (' '.join((search or '').lower().split()), category or '', condition or '')
+
+
+def _cache_key(generation, filters):
+    digest = hashlib.md5(json.dumps(filters, ensure_ascii=False).encode()).hexdigest()
+    return f'ads:count:{generation}:{digest}'
+
+
+def count_ads(search='', category='', condition=''):
+    """Количество объявлений ленты для набора фильтров"""
+    filters = normalize_filters(search, category, condition)
+    cache = _cache()
+    key = _cache_key(_generation(cache), filters)
+
+    cached = cache.get(key)
+    metrics.cache_result('counts', hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return ResultCount(*cached)
+
+    queryset = Ad.objects.feed(*filters).order_by()
+    result = None
+    if not filters[0] and not filters[2]:
+        result = estimate_count(queryset, filtered=bool(filters[1]))
+    if result is None:
+        result = ResultCount(queryset.count())
+
+    cache.set(key, (result.value, result.estimated), getattr(settings, 'ADS_COUNT_CACHE_TIMEOUT', 300))
+    return result
+
+
+async def acount_ads(search='', category='', condition=''):
+    """Асинхронный вариант count_ads(): кэш и COUNT через async API Django"""
+    filters = normalize_filters(search, category, condition)
+    cache = _cache()
+    key = _cache_key(await cache.aget_or_set(GENERATION_KEY, _fresh_generation, timeout=None), filters)
+
+    cached = await cache.aget(key)
+    metrics.cache_result('counts', hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return ResultCount(*cached)
+
+    queryset = Ad.objects.feed(*filters).order_by()
+    result = None
+    if not filters[0] and not filters[2]:
+        result = await sync_to_async(estimate_count)(queryset, filtered=bool(filters[1]))
+    if result is None:
+        result = ResultCount(await queryset.acount())
+
+    await cache.aset(key, (result.value, result.estimated), getattr(settings, 'ADS_COUNT_CACHE_TIMEOUT', 300))
+    return result
+
+
+def estimate_count(queryset, filtered):
+    """
+    Оценка количества строк планировщиком PostgreSQL.
+
+    Возвращает None, если СУБД не PostgreSQL или таблица меньше
+    ``ADS_COUNT_ESTIMATE_THRESHOLD`` строк (тогда точный COUNT дешев).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    total = row[0] if row else -1
+
+    if total < getattr(settings, 'ADS_COUNT_ESTIMATE_THRESHOLD', 100_000):
+        return None
+    if not filtered:
+        return ResultCount(total, estimated=True)
+
+    plan = json.loads(queryset.explain(format='json'))
+    return ResultCount(int(plan[0]['Plan']['Plan Rows']), estimated=True)
@@ -0,0 +1,283 @@
+"""
+Поиск цепочек обмена нескольких участников (BarterCycle).
+
+Граф "хочет" строится по ожидающим предложениям: вершины — объявления,
+ребро ``a → b`` — предложение обменять a на b (автор a хочет b). Цикл
+``a → b → c → a`` длиной от 3 до ``ADS_CYCLE_MAX_LENGTH`` с разными авторами
+объявлений — обмен, в котором каждый отдает свое объявление и получает
+желаемое. Циклы длины 2 — обычные встречные предложения, их не ищем.
+
+Пересчет инкрементальный:
+
+- новое предложение ``a → b`` — ищутся только циклы через это ребро, то есть
+  пути ``b ⇝ a``. Окрестность загружается двусторонним поиском: вперед от b
+  и назад от a на половину длины пути, по одному запросу на уровень
+  (индексы ожидающих предложений по отправителю и получателю);
+- предложение принято, отклонено или удалено — удаляются содержащие его циклы.
+
+Полный пересчет (``rebuild``, команда find_barter_cycles) нужен после правок
+в обход ads.services и для циклов, которые параллельные транзакции не увидели
+(каждая видит только свое новое ребро).
+
+Поиск путей в памяти (``WantsGraph``) ограничен длиной: обход в глубину от b
+идет только через вершины, из которых a достижима за оставшееся число шагов
+(расстояния до a считаются обратным обходом в ширину).
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Prefetch
+
+from .models import BarterCycle, ExchangeProposal
+
+MIN_LENGTH = 3
+# Сколько циклов сохранять за одно событие: у популярных объявлений их может быть много
+EVENT_LIMIT = 20
+# Сколько рёбер загружать на одном уровне поиска окрестности
+FRONTIER_LIMIT = 5000
+REBUILD_BATCH_SIZE = 1000
+# Сколько цепочек показывать пользователю (новые первыми)
+SHOWN_LIMIT = 50
+
+
+def max_length():
+    return getattr(settings, 'ADS_CYCLE_MAX_LENGTH', 4)
+
+
+class WantsGraph:
+    """Граф ожидающих предложений в памяти: рёбра объявление → объявление с id предложений"""
+
+    def __init__(self):
+        self.outgoing = defaultdict(dict)
+        self.incoming = defaultdict(dict)
+        self.owners = {}
+
+    def __len__(self):
+        return sum(len(targets) for targets in self.outgoing.values())
+
+    def add(self, proposal_id, sender_ad, receiver_ad, sender_user=None, receiver_user=None):
+        self.outgoing[sender_ad].setdefault(receiver_ad, set()).add(proposal_id)
+        self.incoming[receiver_ad].setdefault(sender_ad, set()).add(proposal_id)
+        if sender_user is not None:
+            self.owners[sender_ad] = sender_user
+        if receiver_user is not None:
+            self.owners[receiver_ad] = receiver_user
+
+    def remove(self, proposal_id, sender_ad, receiver_ad):
+        proposals = self.outgoing.get(sender_ad, {}).get(receiver_ad)
+        if not proposals:
+            return
+        proposals.discard(proposal_id)
+        if not proposals:
+            del self.outgoing[sender_ad][receiver_ad]
+            del self.incoming[receiver_ad][sender_ad]
+
+    def proposal(self, sender_ad, receiver_ad):
+        """Предложение ребра (наименьший id, если их несколько)"""
+        return min(self.outgoing[sender_ad][receiver_ad])
+
+    def cycles_through(self, sender_ad, receiver_ad, length=None, limit=None, above=None):
+        """
+        Циклы, содержащие ребро sender_ad → receiver_ad, списками объявлений
+        начиная с sender_ad. ``above`` — рассматривать только объявления
+        с большим id (полный перебор, см. cycles()).
+        """
+        length = length or max_length()
+        start, first = sender_ad, receiver_ad
+        if first == start or first not in self.outgoing.get(start, {}):
+            return []
+        distance = self._distances_to(start, length - 1, above)
+        if distance.get(first, length) + 1 > length:
+            return []
+        if not self._distinct_owner(first, {self.owners.get(start)}):
+            return []
+
+        cycles = []
+        path = [start, first]
+        on_path = {start, first}
+        owners = {self.owners.get(start), self.owners.get(first)}
+        # Итеративный обход в глубину: стек итераторов по соседям
+        stack = [iter(self.outgoing.get(first, ()))]
+        while stack:
+            if limit is not None and len(cycles) >= limit:
+                break
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                removed = path.pop()
+                on_path.discard(removed)
+                owners.discard(self.owners.get(removed))
+                continue
+            if node == start:
+                if len(path) >= MIN_LENGTH:
+                    cycles.append(list(path))
+                continue
+            if node in on_path or (above is not None and node <= above):
+                continue
+            if len(path) + distance.get(node, length) > length:
+                continue
+            if not self._distinct_owner(node, owners):
+                continue
+            path.append(node)
+            on_path.add(node)
+            owners.add(self.owners.get(node))
+            stack.append(iter(self.outgoing.get(node, ())))
+        return cycles
+
+    def cycles(self, length=None):
+        """
+        Все циклы графа. Каждый цикл находится один раз — из наименьшего
+        объявления, через вершины с большими id.
+        """
+        for start in sorted(self.outgoing):
+            for first in sorted(self.outgoing[start]):
+                if first > start:
+                    yield from self.cycles_through(start, first, length, above=start)
+
+    def _distances_to(self, target, depth, above):
+        """Число рёбер от вершин до target (не больше depth): обход в ширину по входящим рёбрам"""
+        distance = {target: 0}
+        frontier = [target]
+        for level in range(1, depth + 1):
+            following = []
+            for node in frontier:
+                for previous in self.incoming.get(node, ()):
+                    if previous not in distance and (above is None or previous > above):
+                        distance[previous] = level
+                        following.append(previous)
+            frontier = following
+        return distance
+
+    def _distinct_owner(self, node, owners):
+        owner = self.owners.get(node)
+        return owner is None or owner not in owners
+
+
+def cycle_key(ads):
+    """Ключ цикла: поворот, начинающийся с наименьшего id объявления"""
+    start = ads.index(min(ads))
+    return '-'.join(str(pk) for pk in ads[start:] + ads[:start])
+
+
+def _pending():
+    return ExchangeProposal.objects.filter(status='P').order_by().values_list(
+        'pk', 'ad_sender_id', 'ad_receiver_id', 'user_id', 'receiver_user_id'
+    )
+
+
+def neighbourhood(sender_ad, receiver_ad, length=None):
+    """
+    Граф ожидающих предложений, в котором есть все пути receiver_ad ⇝ sender_ad
+    длиной до length - 1 рёбер: первая половина пути — из обхода вперед
+    от receiver_ad, вторая — из обхода назад от sender_ad.
+    """
+    length = length or max_length()
+    steps = length - 1
+    forward, backward = math.ceil(steps / 2), steps // 2
+    graph = WantsGraph()
+
+    # Сначала обход назад от sender_ad: у большинства объявлений нет входящих
+    # ожидающих предложений, и тогда цикл невозможен после первого же запроса
+    for field, start, depth in (
+        ('ad_receiver_id', sender_ad, backward),
+        ('ad_sender_id', receiver_ad, forward),
+    ):
+        seen = {start}
+        frontier = {start}
+        for _ in range(depth):
+            if not frontier:
+                break
+            rows = list(_pending().filter(**{f'{field}__in': frontier})[:FRONTIER_LIMIT])
+            if not rows and frontier == {start}:
+                return graph
+            frontier = set()
+            for row in rows:
+                graph.add(*row)
+                following = row[2] if field == 'ad_sender_id' else row[1]
+                if following not in seen:
+                    seen.add(following)
+                    frontier.add(following)
+    return graph
+
+
+def proposal_created(proposal):
+    """Ищет и сохраняет циклы через новое ожидающее предложение"""
+    if proposal.status != 'P':
+        return []
+    graph = neighbourhood(proposal.ad_sender_id, proposal.ad_receiver_id)
+    graph.add(proposal.pk, proposal.ad_sender_id, proposal.ad_receiver_id, proposal.user_id, proposal.receiver_user_id)
+    cycles = graph.cycles_through(proposal.ad_sender_id, proposal.ad_receiver_id, limit=EVENT_LIMIT)
+    return save(graph, cycles)
+
+
+def proposals_closed(proposals, using=None):
+    """
+    Удаляет циклы с предложениями, которые больше не ожидают ответа.
+    ``proposals`` — id или QuerySet предложений.
+    """
+    using = using or router.db_for_write(BarterCycle)
+    BarterCycle.objects.using(using).filter(proposals__in=proposals).delete()
+
+
+def save(graph, cycles):
+    """
+    Сохраняет циклы графа, которых еще нет: четыре запроса на любое число
+    циклов. Возвращает ключи новых циклов.
+    """
+    cycles = {cycle_key(ads): ads for ads in cycles}
+    if not cycles:
+        return []
+    existing = set(BarterCycle.objects.filter(key__in=cycles).values_list('key', flat=True))
+    new = {key: ads for key, ads in cycles.items() if key not in existing}
+    if not new:
+        return []
+
+    BarterCycle.objects.bulk_create(
+        [BarterCycle(key=key, length=len(ads)) for key, ads in new.items()], ignore_conflicts=True
+    )
+    ids = dict(BarterCycle.objects.filter(key__in=new).values_list('key', 'pk'))
+    proposals, users = [], []
+    for key, ads in new.items():
+        for sender_ad, receiver_ad in zip(ads, ads[1:] + ads[:1]):
+            proposals.append(BarterCycle.proposals.through(
+                bartercycle_id=ids[key], exchangeproposal_id=graph.proposal(sender_ad, receiver_ad),
+            ))
+            users.append(BarterCycle.users.through(bartercycle_id=ids[key], user_id=graph.owners[sender_ad]))
+    BarterCycle.proposals.through.objects.bulk_create(proposals, ignore_conflicts=True)
+    BarterCycle.users.through.objects.bulk_create(users, ignore_conflicts=True)
+    return list(new)
+
+
+def rebuild(length=None, dry_run=False):
+    """
+    Полный пересчет: граф всех ожидающих предложений строится в памяти,
+    найденные циклы заменяют сохраненные. Возвращает число циклов.
+    """
+    graph = WantsGraph()
+    for row in _pending().iterator(chunk_size=REBUILD_BATCH_SIZE):
+        graph.add(*row)
+    cycles = list(graph.cycles(length))
+    if dry_run:
+        return len(cycles)
+
+    _delete_missing({cycle_key(ads) for ads in cycles})
+    for start in range(0, len(cycles), REBUILD_BATCH_SIZE):
+        save(graph, cycles[start:start + REBUILD_BATCH_SIZE])
+    return len(cycles)
+
+
+def _delete_missing(keys):
+    # Список ключей может быть слишком длинным для одного NOT IN, поэтому сравнение в Python
+    stale = [pk for pk, key in BarterCycle.objects.values_list('pk', 'key').iterator() if key not in keys]
+    for start in range(0, len(stale), REBUILD_BATCH_SIZE):
+        BarterCycle.objects.filter(pk__in=stale[start:start + REBUILD_BATCH_SIZE]).delete()
+
+
+def for_user(user):
+    """Циклы с участием пользователя вместе с предложениями, объявлениями и их авторами"""
+    proposals = ExchangeProposal.objects.select_related('ad_sender__user', 'ad_receiver').defer(
+        'comment', 'ad_sender__description', 'ad_receiver__description',
+    )
+    return BarterCycle.objects.filter(users=user).prefetch_related(Prefetch('proposals', queryset=proposals))
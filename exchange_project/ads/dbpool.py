@@ -0,0 +1,57 @@
+"""
+Пул соединений PostgreSQL (psycopg_pool через OPTIONS['pool'] в DATABASES).
+
+``pool_stats`` возвращает счетчики пула текущего процесса, в том числе
+время ожидания свободного соединения: ``requests_queued`` — сколько запросов
+соединения ждали, ``requests_wait_ms`` — сколько всего ждали, ``wait_ms_avg`` —
+среднее ожидание. Рост ожиданий означает, что пул меньше реальной нагрузки.
+
+Системная проверка ``check_pool_size`` предупреждает при запуске, если пул
+меньше числа одновременных запросов процесса (WORKER_CONCURRENCY).
+"""
+from django.conf import settings
+from django.core import checks
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def pool_options(alias=DEFAULT_DB_ALIAS):
+    """Параметры пула из настроек или None, если пул не включен"""
+    options = settings.DATABASES.get(alias, {}).get('OPTIONS', {}).get('pool')
+    if not options:
+        return None
+    return {} if options is True else options
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS, reset=False):
+    """
+    Статистика пула соединения alias или None без пула.
+    reset=True обнуляет накопленные счетчики (pop_stats).
+    """
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+
+    stats = pool.pop_stats() if reset else pool.get_stats()
+    queued = stats.get('requests_queued', 0)
+    stats['wait_ms_avg'] = round(stats.get('requests_wait_ms', 0) / queued, 2) if queued else 0.0
+    return stats
+
+
+def check_pool_size(app_configs=None, **kwargs):
+    """Пул меньше числа одновременных запросов процесса — запросы будут ждать соединение"""
+    concurrency = getattr(settings, 'WORKER_CONCURRENCY', 1)
+    problems = []
+    for alias in settings.DATABASES:
+        options = pool_options(alias)
+        if options is None:
+            continue
+
+        # Значение по умолчанию psycopg_pool: max_size = min_size = 4
+        max_size = options.get('max_size') or options.get('min_size', 4)
+        if max_size < concurrency:
+            problems.append(checks.Warning(
+                f'Пул соединений базы "{alias}" ({max_size}) меньше WORKER_CONCURRENCY ({concurrency}).',
+                hint='Увеличьте DB_POOL_MAX_SIZE или уменьшите число потоков воркера.',
+                id='ads.W001',
+            ))
+    return problems
@@ -1,28 +1,151 @@
-from django.shortcuts import redirect
+from asgiref.sync import iscoroutinefunction
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from functools import wraps
-from .models import Ad
+from django.http import JsonResponse
+from .models import Ad, ExchangeProposal
+from .middleware import QueryBudget
 
 
 def ad_author_required(view_func):
     """
-    Декоратор для проверки, является ли пользователь автором объявления
+    Декоратор для проверки, является ли пользователь автором объявления.
+
+    Объявление загружается одним запросом, владелец сравнивается по user_id
+    (без загрузки пользователя). Загруженный экземпляр передается
+    представлению в ``request.ad``. Работает и с async-представлениями
+    (асинхронный ORM и ``request.auser()``).
     """
+    ads = Ad.objects.defer('search_vector')
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, pk, *args, **kwargs):
+            ad = await ads.filter(pk=pk).afirst()
+            user = await request.auser()
+            denied = _check_ad_author(request, pk, ad, user)
+            if denied:
+                return denied
+            return await view_func(request, pk, *args, **kwargs)
+
+        return async_wrapper
 
     @wraps(view_func)
     def wrapper(request, pk, *args, **kwargs):
-        try:
-            ad = Ad.objects.get(pk=pk)
-        except Ad.DoesNotExist:
-            messages.error(request, "Объявление не найдено.")
-            return redirect('index')
+        ad = ads.filter(pk=pk).first()
+        denied = _check_ad_author(request, pk, ad, request.user)
+        if denied:
+            return denied
+        return view_func(request, pk, *args, **kwargs)
 
-        if ad.user != request.user:
-            messages.error(request,
-                           "У вас нет прав для редактирования этого объявления. Только автор может редактировать свои объявления.")
-            return redirect('ad_detail', pk=pk)
+    return wrapper
 
-        return view_func(request, pk, *args, **kwargs)
 
-    return wrapper
\ No newline at end of file
+def _check_ad_author(request, pk, ad, user):
+    """Ответ-отказ или None; при успехе кладет объявление в request.ad"""
+    if ad is None:
+        messages.error(request, "Объявление не найдено.")
+        return redirect('index')
+
+    if ad.user_id != getattr(user, 'pk', None):
+        messages.error(request,
+                       "У вас нет прав для редактирования этого объявления. Только автор может редактировать свои объявления.")
+        return redirect('ad_detail', pk=pk)
+
+    request.ad = ad
+    return None
+
+
+def proposal_role_required(role, message, redirect_to='proposal_detail', queryset=None):
+    """
+    Декоратор для проверки роли пользователя в предложении обмена:
+    'sender' — автор предложения, 'receiver' — автор объявления-получателя,
+    'participant' — любой из них.
+
+    Предложение загружается одним запросом из queryset (по умолчанию
+    ExchangeProposal.objects); автор объявления-получателя — поле
+    ``receiver_user_id``. Предложение передается представлению в ``request.proposal``.
+    Несуществующее предложение — 404; чужое — сообщение message и редирект
+    на redirect_to (с pk, если это proposal_detail). Работает и с
+    async-представлениями.
+    """
+    if role not in ('sender', 'receiver', 'participant'):
+        raise ValueError(f'Неизвестная роль: {role}')
+
+    def proposals():
+        base = queryset if queryset is not None else ExchangeProposal.objects
+        return base.all()
+
+    def check(request, pk, proposal, user):
+        user_id = getattr(user, 'pk', None)
+        is_sender = proposal.user_id == user_id
+        is_receiver = proposal.receiver_user_id == user_id
+        allowed = {
+            'sender': is_sender,
+            'receiver': is_receiver,
+            'participant': is_sender or is_receiver,
+        }[role]
+        if not allowed:
+            messages.error(request, message)
+            if redirect_to == 'proposal_detail':
+                return redirect(redirect_to, pk=pk)
+            return redirect(redirect_to)
+
+        request.proposal = proposal
+        return None
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, pk, *args, **kwargs):
+                proposal = await aget_object_or_404(proposals(), pk=pk)
+                denied = check(request, pk, proposal, await request.auser())
+                if denied:
+                    return denied
+                return await view_func(request, pk, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, pk, *args, **kwargs):
+            proposal = get_object_or_404(proposals(), pk=pk)
+            denied = check(request, pk, proposal, request.user)
+            if denied:
+                return denied
+            return view_func(request, pk, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def api_login_required(view_func):
+    """
+    Аналог login_required для JSON API: вместо редиректа на страницу входа
+    возвращает 401 с телом {"error": ...}
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Требуется авторизация.'}, status=401)
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def query_budget(max_queries, max_time_ms=None):
+    """
+    Декоратор, объявляющий бюджет SQL-запросов представления:
+    не больше max_queries запросов и max_time_ms миллисекунд SQL за запрос.
+    Проверяется middleware ads.middleware.QueryBudgetMiddleware.
+
+    Бюджет считается на весь HTTP-запрос, поэтому включает загрузку сессии
+    и пользователя, а также сохранение сессии с сообщениями (+2 запроса).
+    """
+
+    def decorator(view_func):
+        view_func.query_budget = QueryBudget(max_queries, max_time_ms)
+        return view_func
+
+    return decorator
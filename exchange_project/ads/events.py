@@ -0,0 +1,204 @@
+"""
+Публикация событий предложений для потоков SSE (ads.streams).
+
+Событие — изменение статуса предложения: ``{"proposal": id, "status": "P"|"A"|"R"|null}``
+(null — предложение удалено). Получатели — отправитель и получатель
+предложения. ``publish_proposals`` вызывается в транзакции изменения;
+публикация откладывается до COMMIT (``transaction.on_commit``), поэтому
+клиенты не видят откаченных изменений.
+
+Брокер выбирается настройкой ``ADS_EVENTS_BROKER``:
+
+- ``InProcessBroker`` — очереди подписчиков в памяти процесса. Подходит, когда
+  изменения и потоки обслуживает один процесс (runserver, один воркер ASGI);
+- ``PostgresBroker`` — ``NOTIFY`` в канал PostgreSQL; каждый ASGI-процесс
+  слушает канал одним соединением (``LISTEN``) и раздает события своим
+  подписчикам. Нужен при нескольких процессах и при изменениях из WSGI-процессов
+  и воркеров очереди.
+
+Подписчик — asyncio.Queue в event loop ASGI-сервера; ``publish`` можно
+вызывать из любого потока. Очередь ограничена: медленный клиент, не успевший
+забрать ``QUEUE_SIZE`` пачек, получает событие ``reset`` и перечитывает страницу.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('ads.events')
+
+QUEUE_SIZE = 100
+# Размер payload NOTIFY ограничен 8000 байтами
+NOTIFY_PAYLOAD_LIMIT = 7000
+RECONNECT_DELAY = 5
+
+
+class Subscription:
+    """Очередь событий одного потока SSE; читается в event loop подписчика"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, events):
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Подписчики в памяти процесса"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, messages):
+        """messages — {id пользователя: [события]}; вызывается из любого потока"""
+        self.deliver(messages)
+
+    def deliver(self, messages):
+        with self._lock:
+            targets = [
+                (subscription, events)
+                for user_id, events in messages.items()
+                for subscription in self._subscribers.get(int(user_id), ())
+            ]
+        for subscription, events in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, events)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+
+    async def start(self):
+        """Вызывается при запуске ASGI-приложения (lifespan)"""
+
+    async def stop(self):
+        """Вызывается при остановке ASGI-приложения (lifespan)"""
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    События через LISTEN/NOTIFY PostgreSQL: publish отправляет NOTIFY, а
+    слушатель каждого ASGI-процесса (start) раздает их локальным подписчикам
+    """
+
+    channel = 'ads_proposal_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, messages):
+        with connection.cursor() as cursor:
+            for payload in _chunks(messages, NOTIFY_PAYLOAD_LIMIT):
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def _listen(self):
+        import psycopg
+
+        database = settings.DATABASES['default']
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    dbname=database['NAME'], user=database.get('USER') or None,
+                    password=database.get('PASSWORD') or None, host=database.get('HOST') or None,
+                    port=database.get('PORT') or None, autocommit=True,
+                ) as listener:
+                    await listener.execute(f'LISTEN {self.channel}')
+                    async for notify in listener.notifies():
+                        self.deliver(json.loads(notify.payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Соединение LISTEN потеряно, повтор через %s с', RECONNECT_DELAY)
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+def _chunks(messages, limit):
+    """JSON-пачки {пользователь: события} не длиннее limit символов"""
+    chunk, size = {}, 2
+    for user_id, events in messages.items():
+        item = json.dumps({user_id: events})
+        if chunk and size + len(item) > limit:
+            yield json.dumps(chunk)
+            chunk, size = {}, 2
+        chunk[user_id] = events
+        size += len(item)
+    if chunk:
+        yield json.dumps(chunk)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    """Брокер процесса (ADS_EVENTS_BROKER)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'ADS_EVENTS_BROKER', 'ads.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_proposals(rows):
+    """
+    Публикует изменения предложений после COMMIT текущей транзакции.
+    rows — (id, статус или None, id отправителя, id получателя).
+    """
+    messages = defaultdict(list)
+    for pk, status, sender, receiver in rows:
+        event = {'proposal': pk, 'status': status}
+        for user_id in {sender, receiver} - {None}:
+            messages[user_id].append(event)
+    if messages:
+        transaction.on_commit(lambda: _publish(dict(messages)))
+
+
+def _publish(messages):
+    try:
+        broker().publish(messages)
+    except Exception:
+        # Поток событий — подсказка для страницы; изменение уже сохранено
+        logger.exception('Не удалось опубликовать события предложений')
@@ -29,4 +29,20 @@ class ProposalForm(forms.ModelForm):
             # Показываем только объявления пользователя
             self.fields['ad_sender'].queryset = Ad.objects.filter(user=user)
             self.fields['ad_sender'].label = "Мое объявление для обмена"
-            self.fields['ad_sender'].help_text = "Выберите ваше объявление, которое вы хотите обменять"
\ No newline at end of file
+            self.fields['ad_sender'].help_text = "Выберите ваше объявление, которое вы хотите обменять"
+
+class AdImportForm(forms.Form):
+    FORMAT_CHOICES = (
+        ('', 'По расширению файла'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSONL (объект JSON в каждой строке)'),
+    )
+    file = forms.FileField(
+        label="Файл с объявлениями",
+        help_text="Колонки (ключи): title, description, image_url, category, condition",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control'}),
+    )
+    format = forms.ChoiceField(
+        label="Формат", choices=FORMAT_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
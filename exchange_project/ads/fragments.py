@@ -0,0 +1,132 @@
+"""
+Кэш отрендеренных карточек объявлений.
+
+Ключ карточки — ``(ad.pk, ad.version)``: редактирование увеличивает версию,
+поэтому старые фрагменты просто перестают запрашиваться и вытесняются по TTL.
+Карточки страницы читаются и записываются пачкой (get_many/set_many), так что
+число обращений к кэшу не зависит от числа карточек.
+
+Бэкенд задается алиасом ``ADS_FRAGMENT_CACHE`` в CACHES: locmem в тестах,
+Redis в продакшене. Счетчики попаданий хранятся в том же кэше и общие
+для всех воркеров.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import metrics
+
+CARD_TEMPLATE = 'ads/_ad_card.html'
+HITS_KEY = 'ads:card:stats:hits'
+MISSES_KEY = 'ads:card:stats:misses'
+
+
+def _cache():
+    return caches[getattr(settings, 'ADS_FRAGMENT_CACHE', 'default')]
+
+
+def card_key(ad):
+    return _key(ad.pk, ad.version)
+
+
+def _key(pk, version):
+    return f'ads:card:{pk}:{version}'
+
+
+def render_cards(ads):
+    """Возвращает список пар (объявление, HTML карточки) для страницы ленты"""
+    ads = list(ads)
+    if not ads:
+        return []
+
+    cache = _cache()
+    keys = [card_key(ad) for ad in ads]
+    cached = cache.get_many(keys)
+    rendered = _render_missing(ads, keys, cached)
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'ADS_FRAGMENT_CACHE_TIMEOUT', 3600))
+
+    metrics.cache_result('cards', hits=len(ads) - len(rendered), misses=len(rendered))
+    _count(cache, HITS_KEY, len(ads) - len(rendered))
+    _count(cache, MISSES_KEY, len(rendered))
+    return _pairs(ads, keys, cached, rendered)
+
+
+async def arender_cards(ads):
+    """Асинхронный вариант render_cards() для async-представлений"""
+    ads = list(ads)
+    if not ads:
+        return []
+
+    cache = _cache()
+    keys = [card_key(ad) for ad in ads]
+    cached = await cache.aget_many(keys)
+    rendered = _render_missing(ads, keys, cached)
+    if rendered:
+        await cache.aset_many(rendered, getattr(settings, 'ADS_FRAGMENT_CACHE_TIMEOUT', 3600))
+
+    metrics.cache_result('cards', hits=len(ads) - len(rendered), misses=len(rendered))
+    await _acount(cache, HITS_KEY, len(ads) - len(rendered))
+    await _acount(cache, MISSES_KEY, len(rendered))
+    return _pairs(ads, keys, cached, rendered)
+
+
+def _render_missing(ads, keys, cached):
+    return {
+        key: render_to_string(CARD_TEMPLATE, {'ad': ad})
+        for ad, key in zip(ads, keys) if key not in cached
+    }
+
+
+def _pairs(ads, keys, cached, rendered):
+    return [(ad, mark_safe(cached.get(key) or rendered[key])) for ad, key in zip(ads, keys)]
+
+
+def invalidate(ad):
+    """Удаляет карточку текущей версии (при удалении объявления)"""
+    _cache().delete(card_key(ad))
+
+
+def invalidate_many(cards):
+    """Удаляет карточки по парам (pk, version) — при массовом удалении"""
+    _cache().delete_many([_key(pk, version) for pk, version in cards])
+
+
+def _count(cache, key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Ключа еще нет; add не затрет значение, если его успел создать другой воркер
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+async def _acount(cache, key, delta):
+    if not delta:
+        return
+    try:
+        await cache.aincr(key, delta)
+    except ValueError:
+        if not await cache.aadd(key, delta, timeout=None):
+            await cache.aincr(key, delta)
+
+
+def stats():
+    """Счетчики попаданий и промахов кэша карточек"""
+    cache = _cache()
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
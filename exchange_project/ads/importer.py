@@ -0,0 +1,158 @@
+"""
+Массовый импорт объявлений из CSV и JSONL.
+
+Файл читается построчно, каждая строка проверяется AdForm — теми же
+правилами, что и при создании объявления на сайте (выбор категории
+и состояния, проверка URL изображения). Корректные объявления вставляются
+пачками ``bulk_create``, каждая пачка в своей транзакции.
+
+В памяти одновременно находится не больше одной пачки объявлений
+и не больше ``MAX_ERRORS`` сообщений об ошибках, поэтому расход памяти
+не зависит от размера файла.
+
+``bulk_create`` не отправляет сигналы post_save, поэтому кэш количеств
+ленты сбрасывается явно после импорта, а миниатюры изображений
+(ads.thumbnails) ставятся в очередь одной задачей на пачку.
+"""
+import csv
+import json
+import os
+import time
+
+from django.db import transaction
+
+from . import counts, thumbnails
+from .forms import AdForm
+from .models import Ad
+
+FORMATS = ('csv', 'jsonl')
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}
+BATCH_SIZE = 1000
+MAX_ERRORS = 1000
+
+
+class InvalidImportFormat(ValueError):
+    """Формат файла не указан и не определяется по расширению"""
+
+
+class ImportResult:
+    """Итоги импорта: число строк, созданных объявлений, ошибки и скорость"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        # Список (номер строки, {поле: [сообщения]}), не длиннее MAX_ERRORS
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return f'<ImportResult rows={self.rows} created={self.created} failed={self.failed}>'
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def errors_truncated(self):
+        return self.failed > len(self.errors)
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, errors))
+
+    def tick(self):
+        self.elapsed = time.monotonic() - self.started
+
+
+def detect_format(filename, fmt=''):
+    """Формат из явного значения или по расширению файла"""
+    if fmt:
+        if fmt not in FORMATS:
+            raise InvalidImportFormat(fmt)
+        return fmt
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in EXTENSIONS:
+        raise InvalidImportFormat(filename)
+    return EXTENSIONS[extension]
+
+
+def read_rows(stream, fmt):
+    """
+    Построчно читает текстовый поток. Возвращает пары (номер строки, словарь);
+    вместо словаря — исключение, если строку не удалось разобрать.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        if not isinstance(data, dict):
+            yield line_number, ValueError('ожидается объект JSON')
+            continue
+        yield line_number, data
+
+
+def count_rows(stream, fmt):
+    """
+    Число строк файла без записи в базу. Поток читается целиком, поэтому
+    ошибка кодировки (UnicodeDecodeError) возникает до импорта.
+    """
+    return sum(1 for _ in read_rows(stream, fmt))
+
+
+def import_ads(stream, fmt, user, batch_size=BATCH_SIZE, progress=None):
+    """
+    Импортирует объявления пользователя user из потока stream.
+
+    progress — необязательная функция, вызываемая с ImportResult после каждой пачки.
+    """
+    result = ImportResult()
+    fields = AdForm._meta.fields
+    batch = []
+
+    for line, data in read_rows(stream, fmt):
+        result.rows += 1
+        if isinstance(data, Exception):
+            result.add_error(line, {'__all__': [f'Некорректная строка: {data}']})
+            continue
+
+        form = AdForm(data={name: '' if data.get(name) is None else str(data[name]) for name in fields})
+        if not form.is_valid():
+            result.add_error(line, {name: list(messages) for name, messages in form.errors.items()})
+            continue
+
+        ad = form.save(commit=False)
+        ad.user = user
+        batch.append(ad)
+        if len(batch) >= batch_size:
+            _flush(batch, result, progress)
+
+    _flush(batch, result, progress)
+    result.tick()
+    if result.created:
+        counts.invalidate()
+    return result
+
+
+def _flush(batch, result, progress):
+    if batch:
+        with transaction.atomic():
+            Ad.objects.bulk_create(batch)
+            thumbnails.saved(ad.image_url for ad in batch)
+        result.created += len(batch)
+        batch.clear()
+    result.tick()
+    if progress:
+        progress(result)
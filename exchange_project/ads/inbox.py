@@ -0,0 +1,118 @@
+"""
+Сводка предложений пользователя (ProposalSummary) для значков в шапке сайта.
+
+Строка сводки пересчитывается (``rebuild``) фоновой задачей после изменения
+предложений (ads.services), а читается через кэш ``ADS_INBOX_CACHE``:
+страница с шапкой не выполняет запросов, пока сводка пользователя не изменилась. Изменение сводки удаляет
+ключ только затронутых пользователей — сразу и еще раз после коммита, чтобы
+параллельный запрос не вернул в кэш значение из незавершенной транзакции.
+
+Строка сводки создается вместе с пользователем (ads.signals), для
+существующих пользователей — миграцией 0010; чтение (``get_summary``) ее не
+создает. Пересчет по таблице не зависит от очереди: команда
+reconcile_proposal_counters и правки в админке, выполненные до задачи,
+не учитывают событие дважды.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models import Count, Max
+
+from . import metrics
+from .models import ExchangeProposal, ProposalSummary
+
+SENT_FIELDS = {'P': 'sent_pending', 'A': 'sent_accepted', 'R': 'sent_rejected'}
+RECEIVED_FIELDS = {'P': 'received_pending', 'A': 'received_accepted', 'R': 'received_rejected'}
+FIELDS = (*SENT_FIELDS.values(), *RECEIVED_FIELDS.values(), 'last_activity_at')
+TIMEOUT = 60 * 60
+
+
+def _cache():
+    return caches[getattr(settings, 'ADS_INBOX_CACHE', 'default')]
+
+
+def _key(user_id):
+    return f'ads:inbox:{user_id}'
+
+
+def get_summary(user_id):
+    """
+    Сводка пользователя словарем полей FIELDS: из кэша или из таблицы; без
+    строки — пустая (запрос на чтение ничего не записывает). Таблица читается
+    из основной базы: значение с отстающей реплики попало бы в кэш на TIMEOUT секунд.
+    """
+    cache = _cache()
+    summary = cache.get(_key(user_id))
+    metrics.cache_result('inbox', hits=summary is not None, misses=summary is None)
+    if summary is None:
+        summaries = ProposalSummary.objects.using(router.db_for_write(ProposalSummary))
+        summary = summaries.filter(pk=user_id).values(*FIELDS).first() or empty()
+        cache.set(_key(user_id), summary, TIMEOUT)
+    return summary
+
+
+def empty():
+    summary = dict.fromkeys(FIELDS, 0)
+    summary['last_activity_at'] = None
+    return summary
+
+
+aget_summary = sync_to_async(get_summary)
+
+
+def invalidate(user_ids):
+    """Удаляет из кэша сводки пользователей: сейчас и после коммита транзакции"""
+    keys = [_key(user_id) for user_id in user_ids if user_id is not None]
+    if keys:
+        _cache().delete_many(keys)
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def count(summary, proposal_type='', status=''):
+    """Количество предложений списка my_proposals по сводке"""
+    groups = {'sent': [SENT_FIELDS], 'received': [RECEIVED_FIELDS]}.get(proposal_type, [SENT_FIELDS, RECEIVED_FIELDS])
+    statuses = [status] if status else list(SENT_FIELDS)
+    return sum(summary[fields[code]] for fields in groups for code in statuses if code in fields)
+
+
+def rebuild(user_ids):
+    """
+    Пересчитывает сводки пользователей по таблице предложений (три запроса
+    на любой список) и сохраняет их. Возвращает {id пользователя: сводка}.
+    """
+    summaries = {user_id: empty() for user_id in user_ids}
+
+    def collect(queryset, user_field, fields):
+        for user_id, status, number, latest in (
+            queryset.filter(**{f'{user_field}__in': user_ids}).order_by()
+            .values_list(user_field, 'status').annotate(number=Count('pk'), latest=Max('updated_at'))
+        ):
+            summary = summaries[user_id]
+            summary[fields[status]] = number
+            if summary['last_activity_at'] is None or latest > summary['last_activity_at']:
+                summary['last_activity_at'] = latest
+
+    collect(ExchangeProposal.objects.all(), 'user_id', SENT_FIELDS)
+    collect(ExchangeProposal.objects.all(), 'receiver_user_id', RECEIVED_FIELDS)
+
+    ProposalSummary.objects.bulk_create(
+        [ProposalSummary(user_id=user_id, **summary) for user_id, summary in summaries.items()],
+        update_conflicts=True, unique_fields=['user'], update_fields=list(FIELDS),
+    )
+    invalidate(user_ids)
+    return summaries
+
+
+def rebuild_all(batch_size=1000):
+    """Пересчитывает сводки всех пользователей пачками по id; возвращает число пользователей"""
+    total = 0
+    last = 0
+    while True:
+        ids = list(User.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        last = ids[-1]
+        rebuild(ids)
+        total += len(ids)
@@ -0,0 +1,87 @@
+"""
+Скорость поиска цепочек обмена (ads.cycles.WantsGraph) на синтетическом
+графе в памяти, без базы данных.
+
+    python manage.py benchmark_cycles --ads 50000 --edges 300000 --max-length 4
+
+Граф — случайные предложения между объявлениями случайных авторов; часть
+рёбер (``--events``) откладывается и затем добавляется по одному, как новые
+предложения. Команда измеряет:
+
+- полный перебор циклов (find_barter_cycles);
+- поиск циклов через каждое добавленное ребро (create_proposal), p50/p95/max.
+
+Для проверки инкрементальный поиск сверяется с полным: каждый цикл полного
+перебора, содержащий отложенное ребро, должен найтись и при его добавлении.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.cycles import WantsGraph, cycle_key, max_length
+
+
+class Command(BaseCommand):
+    help = 'Измеряет поиск цепочек обмена на синтетическом графе предложений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=50000, help='Сколько объявлений (вершин)')
+        parser.add_argument('--users', type=int, default=10000, help='Сколько авторов объявлений')
+        parser.add_argument('--edges', type=int, default=300000, help='Сколько ожидающих предложений (рёбер)')
+        parser.add_argument('--events', type=int, default=1000, help='Сколько рёбер добавлять по одному')
+        parser.add_argument('--max-length', type=int, default=None, help='Наибольшая длина цепочки')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['ads'] < 2 or options['users'] < 2:
+            raise CommandError('Нужно хотя бы два объявления и два автора')
+        length = options['max_length'] or max_length()
+        rnd = random.Random(options['seed'])
+        owners = [rnd.randrange(options['users']) for _ in range(options['ads'])]
+
+        edges = []
+        for pk in range(1, options['edges'] + 1):
+            sender, receiver = rnd.sample(range(options['ads']), 2)
+            edges.append((pk, sender, receiver, owners[sender], owners[receiver]))
+        events = edges[-options['events']:] if options['events'] else []
+
+        graph = WantsGraph()
+        started = time.perf_counter()
+        for edge in edges[:len(edges) - len(events)]:
+            graph.add(*edge)
+        self.stdout.write(f'Граф: {options["ads"]} объявлений, {len(graph)} рёбер за {time.perf_counter() - started:.2f} с')
+
+        timings = []
+        incremental = set()
+        for edge in events:
+            graph.add(*edge)
+            started = time.perf_counter()
+            found = graph.cycles_through(edge[1], edge[2], length)
+            timings.append(time.perf_counter() - started)
+            incremental.update(cycle_key(ads) for ads in found)
+        if timings:
+            timings.sort()
+            self.stdout.write(
+                f'incremental events={len(timings)} cycles={len(incremental)} '
+                f'p50={statistics.median(timings) * 1000:.3f}ms '
+                f'p95={timings[max(int(len(timings) * 0.95) - 1, 0)] * 1000:.3f}ms '
+                f'max={timings[-1] * 1000:.3f}ms'
+            )
+
+        started = time.perf_counter()
+        full = {cycle_key(ads) for ads in graph.cycles(length)}
+        self.stdout.write(f'full     cycles={len(full)} за {time.perf_counter() - started:.2f} с')
+
+        added = {(edge[1], edge[2]) for edge in events}
+        expected = {
+            key for key in full
+            if any(pair in added for pair in _edges([int(pk) for pk in key.split('-')]))
+        }
+        if expected != incremental:
+            raise CommandError(f'Инкрементальный поиск расходится с полным: {len(expected ^ incremental)} циклов')
+
+
+def _edges(ads):
+    return zip(ads, ads[1:] + ads[:1])
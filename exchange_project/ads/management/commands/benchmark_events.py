@@ -0,0 +1,201 @@
+"""
+Нагрузочная проверка потока SSE изменений предложений (ads.streams).
+
+    python manage.py benchmark_events --streams 5000 --events 200
+    python manage.py benchmark_events --streams 2000 --url http://127.0.0.1:8000/proposals/events/ --duration 60
+
+Для ``--users`` первых пользователей базы создаются сессии; потоки
+распределяются между ними по кругу и проходят обычную проверку сессии.
+
+Без ``--url`` потоки открываются в этом процессе: ASGI-приложение
+вызывается напрямую, как его вызывал бы сервер. Команда сообщает, сколько
+памяти и потоков ОС добавили открытые потоки SSE, и задержку доставки
+``--events`` событий от публикации до отправки клиенту (p50/p95/max).
+
+С ``--url`` — N настоящих соединений с запущенным ASGI-сервером
+(uvicorn config.asgi:application): сколько потоков открылось и сколько
+продержалось ``--duration`` секунд, получая пинги.
+
+Созданные сессии удаляются в конце.
+"""
+import asyncio
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ads import events, streams
+
+# Сколько ждать открытия всех потоков и доставки событий, секунды
+WAIT_TIMEOUT = 60
+
+
+class _Client:
+    """Клиент потока для прямого вызова ASGI-приложения"""
+
+    def __init__(self, cookie, arrivals):
+        self.scope = {
+            'type': 'http', 'method': 'GET', 'path': streams.EVENTS_PATH,
+            'headers': [(b'cookie', cookie.encode())],
+        }
+        self.arrivals = arrivals
+        self.status = None
+        self._disconnect = asyncio.Event()
+
+    async def receive(self):
+        await self._disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['body'].startswith(b'event: proposal'):
+            self.arrivals.append(time.perf_counter())
+
+    def disconnect(self):
+        self._disconnect.set()
+
+
+def _percentile(values, share):
+    return sorted(values)[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = 'Открывает N потоков SSE изменений предложений и измеряет память и задержку доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=1000, help='Сколько потоков открыть')
+        parser.add_argument('--users', type=int, default=100, help='Между сколькими пользователями их распределить')
+        parser.add_argument('--events', type=int, default=100, help='Сколько событий опубликовать (без --url)')
+        parser.add_argument('--url', help='Адрес потока на запущенном ASGI-сервере')
+        parser.add_argument('--duration', type=float, default=30, help='Сколько держать соединения (с --url), секунды')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['streams'] < 1:
+            raise CommandError('Нужен хотя бы один поток')
+        users = list(User.objects.filter(is_active=True).order_by('pk')[:options['users']])
+        if not users:
+            raise CommandError('В базе нет пользователей')
+
+        sessions = [self._session(user) for user in users]
+        try:
+            cookies = [f'{settings.SESSION_COOKIE_NAME}={session.session_key}' for session in sessions]
+            if options['url']:
+                async_to_sync(self._remote)(options['url'], cookies, options['streams'], options['duration'])
+            else:
+                async_to_sync(self._local)(
+                    cookies, [user.pk for user in users], options['streams'], options['events'],
+                    random.Random(options['seed']),
+                )
+        finally:
+            for session in sessions:
+                session.delete()
+
+    def _session(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    async def _local(self, cookies, user_ids, count, event_count, rnd):
+        broker = events.broker()
+        threads = threading.active_count()
+        tracemalloc.start()
+        memory = tracemalloc.get_traced_memory()[0]
+
+        arrivals = {user_id: [] for user_id in user_ids}
+        clients = [
+            _Client(cookies[number % len(cookies)], arrivals[user_ids[number % len(user_ids)]])
+            for number in range(count)
+        ]
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(streams.events_app(client.scope, client.receive, client.send)) for client in clients]
+        await self._wait(lambda: sum(client.status is not None for client in clients) == count)
+        opened = time.perf_counter() - started
+        per_stream = (tracemalloc.get_traced_memory()[0] - memory) / count
+        tracemalloc.stop()
+
+        refused = sum(client.status != 200 for client in clients)
+        self.stdout.write(f'Открыто потоков: {count - refused} за {opened:.2f} с, отказов: {refused}')
+        self.stdout.write(f'Память на поток: {per_stream / 1024:.1f} КБ')
+        self.stdout.write(f'Потоков ОС добавлено: {threading.active_count() - threads}')
+        self.stdout.write(f'Подписчиков у брокера: {broker.subscriber_count()}')
+
+        # Событие пользователя получает каждый его открытый поток
+        subscribers = dict.fromkeys(user_ids, 0)
+        for number, client in enumerate(clients):
+            if client.status == 200:
+                subscribers[user_ids[number % len(user_ids)]] += 1
+        latencies = []
+        for number in range(event_count):
+            user_id = rnd.choice(user_ids)
+            received = len(arrivals[user_id])
+            published = time.perf_counter()
+            broker.publish({user_id: [{'proposal': number, 'status': 'A'}]})
+            await self._wait(lambda: len(arrivals[user_id]) >= received + subscribers[user_id])
+            latencies.extend(arrived - published for arrived in arrivals[user_id][received:])
+
+        if latencies:
+            self.stdout.write(
+                f'Доставлено событий: {len(latencies)}, задержка p50 {statistics.median(latencies) * 1000:.2f} мс, '
+                f'p95 {_percentile(latencies, 0.95) * 1000:.2f} мс, max {max(latencies) * 1000:.2f} мс'
+            )
+
+        for client in clients:
+            client.disconnect()
+        await asyncio.gather(*tasks)
+        self.stdout.write(f'Подписчиков после закрытия: {broker.subscriber_count()}')
+
+    async def _wait(self, condition):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while not condition():
+            if time.monotonic() > deadline:
+                raise CommandError('Истекло время ожидания')
+            await asyncio.sleep(0.001)
+
+    async def _remote(self, url, cookies, count, duration):
+        parts = urlsplit(url)
+        pings = [0] * count
+
+        async def hold(number):
+            reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            try:
+                writer.write(
+                    f'GET {parts.path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+                    f'Cookie: {cookies[number % len(cookies)]}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+                )
+                await writer.drain()
+                status = await reader.readline()
+                if b' 200 ' not in status:
+                    return False
+                deadline = time.monotonic() + duration
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        line = await asyncio.wait_for(reader.readline(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if not line:
+                        return False
+                    if line.startswith(b': ping'):
+                        pings[number] += 1
+                return True
+            finally:
+                writer.close()
+
+        results = await asyncio.gather(*(hold(number) for number in range(count)), return_exceptions=True)
+        held = sum(result is True for result in results)
+        errors = sum(isinstance(result, Exception) for result in results)
+        self.stdout.write(f'Продержалось потоков: {held} из {count}, ошибок соединения: {errors}')
+        self.stdout.write(f'Получено пингов: {sum(pings)}')
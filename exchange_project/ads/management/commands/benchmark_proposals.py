@@ -0,0 +1,136 @@
+"""
+Сравнение стратегий выборки "всех предложений" пользователя (my_proposals)
+на синтетической таблице предложений.
+
+    python manage.py benchmark_proposals --proposals 1000000 --users 2000
+
+Команда создает пользователей, объявления и предложения пачками bulk_create
+в одной транзакции, листает курсорные страницы для выборки пользователей
+двумя способами и откатывает транзакцию (``--keep`` — оставить данные):
+
+- ``or_join`` — прежний запрос ``Q(user=u) | Q(ad_receiver__user=u)``
+  с соединением ads_ad;
+- ``or`` — то же условие по колонке receiver_user, без соединения.
+
+Страницы обоих способов сверяются между собой.
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from ads.models import Ad, ExchangeProposal
+from ads.pagination import CursorPaginator
+
+BATCH_SIZE = 10000
+ADS_PER_USER = 5
+PER_PAGE = 10
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с синтетическими данными"""
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стратегии выборки всех предложений пользователя на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proposals', type=int, default=1000000, help='Сколько предложений создать')
+        parser.add_argument('--users', type=int, default=2000, help='Сколько пользователей создать')
+        parser.add_argument('--sample', type=int, default=20, help='Для скольких пользователей листать страницы')
+        parser.add_argument('--pages', type=int, default=10, help='Сколько страниц листать')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Не откатывать созданные данные')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+        self.random = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                users = self.generate(options['users'], options['proposals'])
+                sample = self.random.sample(users, min(options['sample'], len(users)))
+                self.report(self.measure(sample, options['pages']))
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Синтетические данные удалены')
+
+    def generate(self, user_count, proposal_count):
+        prefix = f'bench{time.time_ns()}'
+        started = time.perf_counter()
+        User.objects.bulk_create(
+            [User(username=f'{prefix}_{i}') for i in range(user_count)], batch_size=BATCH_SIZE
+        )
+        users = list(User.objects.filter(username__startswith=f'{prefix}_').values_list('pk', flat=True))
+        Ad.objects.bulk_create(
+            [
+                Ad(user_id=user_id, title=f'Объявление {i}', description='Описание', category='E', condition='N')
+                for user_id in users for i in range(ADS_PER_USER)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        ads = list(Ad.objects.filter(user_id__in=users).values_list('pk', 'user_id'))
+
+        for start in range(0, proposal_count, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, proposal_count - start)):
+                (sender_ad, sender), (receiver_ad, receiver) = self.random.sample(ads, 2)
+                batch.append(ExchangeProposal(
+                    user_id=sender, ad_sender_id=sender_ad, ad_receiver_id=receiver_ad, receiver_user_id=receiver,
+                    status=self.random.choice('PAR'),
+                ))
+            # save() не вызывается, поэтому receiver_user задан явно
+            ExchangeProposal.objects.bulk_create(batch)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE ads_ad, ads_exchangeproposal')
+        self.stdout.write(
+            f'Создано: пользователей {len(users)}, объявлений {len(ads)}, предложений {proposal_count} '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+        return users
+
+    def strategies(self, user_id):
+        """{способ: queryset}"""
+        proposals = ExchangeProposal.objects.for_listing()
+        return {
+            'or_join': proposals.filter(Q(user_id=user_id) | Q(ad_receiver__user_id=user_id)),
+            'or': proposals.filter(Q(user_id=user_id) | Q(receiver_user_id=user_id)),
+        }
+
+    def measure(self, users, pages):
+        timings = {}
+        for user_id in users:
+            walked = {}
+            for name, queryset in self.strategies(user_id).items():
+                paginator = CursorPaginator(queryset, PER_PAGE)
+                cursor = None
+                ids = []
+                for _ in range(pages):
+                    started = time.perf_counter()
+                    page = paginator.page(cursor)
+                    timings.setdefault(name, []).append(time.perf_counter() - started)
+                    ids.extend(proposal.pk for proposal in page)
+                    if not page.has_next():
+                        break
+                    cursor = page.next_cursor
+                walked[name] = ids
+            if len({tuple(ids) for ids in walked.values()}) != 1:
+                raise CommandError(f'Стратегии вернули разные страницы для пользователя {user_id}')
+        return timings
+
+    def report(self, timings):
+        for name, values in timings.items():
+            values.sort()
+            self.stdout.write(
+                f'{name:8} pages={len(values)} '
+                f'p50={statistics.median(values) * 1000:.2f}ms '
+                f'p95={values[max(int(len(values) * 0.95) - 1, 0)] * 1000:.2f}ms '
+                f'max={values[-1] * 1000:.2f}ms'
+            )
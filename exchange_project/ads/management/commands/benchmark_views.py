@@ -0,0 +1,99 @@
+"""
+Нагрузочное сравнение синхронного (WSGI) и асинхронного (ASGI) обработчиков
+на одних и тех же данных текущей базы.
+
+Запросы проходят весь стек Django — middleware, URL, представления и шаблоны —
+без сетевого сервера: WSGI-обработчик вызывается из пула потоков, ASGI-обработчик —
+из asyncio с тем же числом одновременных запросов. Набор представлений задается
+настройкой ADS_ASYNC_VIEWS при запуске, поэтому режимы сравниваются двумя запусками:
+
+    ADS_ASYNC_VIEWS=0 python manage.py benchmark_views --mode wsgi --user alice
+    ADS_ASYNC_VIEWS=1 python manage.py benchmark_views --mode asgi --user alice
+"""
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+DEFAULT_PATHS = ['/', '/?category=E', '/proposals/', '/proposals/?type=received']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность страниц под WSGI и ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Имя пользователя, от которого идут запросы')
+        parser.add_argument('--mode', choices=('wsgi', 'asgi'), help='Обработчик; по умолчанию по ADS_ASYNC_VIEWS')
+        parser.add_argument('--requests', type=int, default=500, help='Всего запросов')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных запросов')
+        parser.add_argument('--path', action='append', dest='paths', help='Адрес страницы (можно несколько раз)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        mode = options['mode'] or ('asgi' if getattr(settings, 'ADS_ASYNC_VIEWS', False) else 'wsgi')
+        paths = options['paths'] or DEFAULT_PATHS
+        urls = [paths[i % len(paths)] for i in range(options['requests'])]
+
+        # Клиенты Django обращаются к хосту testserver; бюджеты запросов здесь только мешают
+        with override_settings(ALLOWED_HOSTS=['testserver'], QUERY_BUDGET_RAISE=False):
+            started = time.perf_counter()
+            if mode == 'wsgi':
+                latencies, errors = self.run_wsgi(user, urls, options['concurrency'])
+            else:
+                latencies, errors = asyncio.run(self.run_asgi(user, urls, options['concurrency']))
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"mode={mode} async_views={int(getattr(settings, 'ADS_ASYNC_VIEWS', False))} "
+            f"requests={len(urls)} concurrency={options['concurrency']} errors={errors}"
+        )
+        self.stdout.write(
+            f"rps={len(urls) / elapsed:.1f} "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms"
+        )
+
+    def run_wsgi(self, user, urls, concurrency):
+        local = threading.local()
+
+        def fetch(url):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(user)
+            started = time.perf_counter()
+            response = local.client.get(url)
+            return time.perf_counter() - started, response.status_code
+
+        def close(_):
+            connections.close_all()
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(fetch, urls))
+            list(pool.map(close, range(concurrency)))
+        return [latency for latency, _ in results], sum(status != 200 for _, status in results)
+
+    async def run_asgi(self, user, urls, concurrency):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - started, response.status_code
+
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        return [latency for latency, _ in results], sum(status != 200 for _, status in results)
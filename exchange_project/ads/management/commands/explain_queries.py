@@ -0,0 +1,107 @@
+"""
+Проверка планов запросов представлений.
+
+    python manage.py explain_queries [--user USERNAME] [--no-seqscan] [--fail-on-seqscan]
+
+Для каждого запроса, который выполняют представления ``ads.views``, печатает
+EXPLAIN и помечает последовательные сканирования таблиц. На небольших таблицах
+PostgreSQL честно выбирает Seq Scan, поэтому ``--no-seqscan`` выполняет EXPLAIN
+с ``SET LOCAL enable_seqscan = off`` — так видно, есть ли у запроса индексный путь.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ads.models import Ad, ExchangeProposal
+
+# PostgreSQL: "Seq Scan on ads_ad"; SQLite: "SCAN ads_ad" без "USING INDEX"
+POSTGRESQL_SEQ_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SEQ_SCAN_RE = re.compile(r'\bSCAN (\w+)\b(?! USING| VIRTUAL TABLE)')
+
+
+def view_queries(user):
+    """Запросы представлений в том виде, в котором их строят views.py"""
+    proposals = ExchangeProposal.objects
+    return [
+        ('index', Ad.objects.feed()),
+        ('index ?category', Ad.objects.feed(category='E')),
+        ('index ?condition', Ad.objects.feed(condition='N')),
+        ('index ?category&condition', Ad.objects.feed(category='E', condition='N')),
+        ('index ?search', Ad.objects.feed(search='велосипед')),
+        ('ad_detail: объявления пользователя', Ad.objects.filter(user=user)),
+        ('my_proposals', proposals.for_user(user).order_by('-created_at', '-id')),
+        ('my_proposals ?status', proposals.for_user(user).filter(status='P').order_by('-created_at', '-id')),
+        ('my_proposals ?type=sent', proposals.for_user(user, 'sent').order_by('-created_at', '-id')),
+        ('my_proposals ?type=sent&status',
+         proposals.for_user(user, 'sent').filter(status='P').order_by('-created_at', '-id')),
+        ('my_proposals ?type=received', proposals.for_user(user, 'received').order_by('-created_at', '-id')),
+        ('my_proposals ?type=received&status',
+         proposals.for_user(user, 'received').filter(status='P').order_by('-created_at', '-id')),
+        ('update_proposal_status: ожидающие по объявлению', proposals.filter(ad_receiver_id=0, status='P')),
+        ('ожидающие по объявлению-отправителю', proposals.filter(ad_sender_id=0, status='P')),
+    ]
+
+
+def sequential_scans(plan, vendor):
+    if vendor == 'postgresql':
+        return POSTGRESQL_SEQ_SCAN_RE.findall(plan)
+    if vendor == 'sqlite':
+        return SQLITE_SEQ_SCAN_RE.findall(plan)
+    return []
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN для запросов представлений и отмечает последовательные сканирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя для запросов my_proposals')
+        parser.add_argument(
+            '--no-seqscan',
+            action='store_true',
+            help='PostgreSQL: запретить планировщику Seq Scan, чтобы проверить наличие индексного пути',
+        )
+        parser.add_argument(
+            '--fail-on-seqscan',
+            action='store_true',
+            help='Завершиться с ошибкой, если найдено последовательное сканирование',
+        )
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['user'])
+        vendor = connection.vendor
+        flagged = []
+
+        for name, queryset in view_queries(user):
+            # Пагинатор всегда ограничивает выборку одной страницей
+            plan = self._explain(queryset[:11], options['no_seqscan'] and vendor == 'postgresql')
+            scans = sequential_scans(plan, vendor)
+
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f'[SEQ SCAN: {", ".join(scans)}] {name}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'[OK] {name}'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if flagged and options['fail_on_seqscan']:
+            raise CommandError(f'Последовательные сканирования в запросах: {", ".join(flagged)}')
+
+    def _get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        # Для EXPLAIN достаточно любого id
+        return User.objects.order_by('pk').first() or User(pk=0)
+
+    def _explain(self, queryset, no_seqscan):
+        if not no_seqscan:
+            return queryset.explain()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
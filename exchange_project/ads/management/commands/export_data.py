@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.exporter import (
+    CHUNK_SIZE, DATASETS, FORMATS, WATERMARK_FIELDS, Exporter, InvalidWatermark, parse_watermark,
+)
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает объявления или предложения обмена в CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS), help='Что выгружать')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--since', help='Выгрузить строки с полем отметки не раньше этого момента (ISO 8601)')
+        parser.add_argument('--field', choices=WATERMARK_FIELDS, default='updated_at', help='Поле отметки для --since')
+        parser.add_argument('--output', help='Файл для записи; по умолчанию стандартный вывод')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Строк за одно чтение курсора')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_watermark(options['since'])
+        except InvalidWatermark:
+            raise CommandError(f'Некорректное значение --since: {options["since"]}')
+
+        exporter = Exporter(
+            options['dataset'], options['format'], since, options['field'], options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(exporter)
+        else:
+            for line in exporter:
+                self.stdout.write(line, ending='')
+
+        # Отметка для следующей инкрементальной выгрузки
+        watermark = exporter.watermark.isoformat() if exporter.watermark else '-'
+        self.stderr.write(f'Выгружено строк: {exporter.rows}; {options["field"]} последней строки: {watermark}')
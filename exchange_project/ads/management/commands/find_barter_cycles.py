@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ads import cycles
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает цепочки обмена по всем ожидающим предложениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=None, help='Наибольшая длина цепочки (по умолчанию ADS_CYCLE_MAX_LENGTH)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать цепочки, не сохраняя')
+
+    def handle(self, *args, **options):
+        found = cycles.rebuild(length=options['max_length'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'Найдено цепочек: {found}')
+        else:
+            self.stdout.write(f'Сохранено цепочек: {found}')
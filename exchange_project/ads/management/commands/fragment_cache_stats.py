@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ads import fragments
+
+
+class Command(BaseCommand):
+    help = 'Показывает счетчики попаданий кэша карточек объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = fragments.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.2%}"
+        )
+        if options['reset']:
+            fragments.reset_stats()
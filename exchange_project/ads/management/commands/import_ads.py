@@ -0,0 +1,58 @@
+import io
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.importer import BATCH_SIZE, FORMATS, InvalidImportFormat, detect_format, import_ads
+
+
+class Command(BaseCommand):
+    help = 'Импортирует объявления пользователя из CSV или JSONL (построчно, пачками bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для стандартного ввода')
+        parser.add_argument('--user', required=True, help='Имя пользователя — автора объявлений')
+        parser.add_argument('--format', choices=FORMATS, default='', help='Формат; по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Размер пачки bulk_create')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        path = options['path']
+        try:
+            fmt = detect_format(path, options['format'])
+        except InvalidImportFormat:
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+            result = import_ads(stream, fmt, user, options['batch_size'], self._progress)
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    result = import_ads(stream, fmt, user, options['batch_size'], self._progress)
+            except OSError as e:
+                raise CommandError(f'Не удалось открыть {path}: {e}')
+
+        for line, errors in result.errors:
+            for field, messages in errors.items():
+                self.stderr.write(f'строка {line}: {field}: {"; ".join(messages)}')
+        if result.errors_truncated:
+            self.stderr.write(f'... показаны первые {len(result.errors)} ошибок из {result.failed}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {result.rows} строк, создано {result.created}, ошибок {result.failed}, '
+            f'{result.rows_per_second:.0f} строк/с'
+        ))
+
+    def _progress(self, result):
+        if self.verbosity > 1:
+            self.stdout.write(
+                f'{result.rows} строк, создано {result.created}, ошибок {result.failed}, '
+                f'{result.rows_per_second:.0f} строк/с'
+            )
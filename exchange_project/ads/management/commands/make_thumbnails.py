@@ -0,0 +1,41 @@
+"""
+Миниатюры изображений существующих объявлений (ads.thumbnails).
+
+    python manage.py make_thumbnails          # поставить задачи воркеру
+    python manage.py make_thumbnails --now    # обработать в этом процессе
+
+Новые и измененные объявления получают миниатюры сами; команда нужна для
+объявлений, созданных до включения миниатюр или при ADS_THUMBNAIL_ON_SAVE = False.
+Адреса с готовыми миниатюрами пропускаются.
+"""
+from django.core.management.base import BaseCommand
+
+from ads import thumbnails
+from ads.models import Ad
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь (или создает) миниатюры изображений объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--now', action='store_true', help='Обработать изображения сразу, без воркера')
+
+    def handle(self, *args, **options):
+        urls = (
+            Ad.objects.exclude(image_url__isnull=True).exclude(image_url='')
+            .order_by('image_url').values_list('image_url', flat=True).distinct()
+        )
+        pending = [url for url in urls.iterator(chunk_size=BATCH_SIZE) if not thumbnails.is_ready(url)]
+        if options['now']:
+            made = 0
+            for url in pending:
+                try:
+                    made += thumbnails.make([url])
+                except OSError as error:
+                    self.stderr.write(f'{url}: {error}')
+            self.stdout.write(f'Создано миниатюр изображений: {made} из {len(pending)}')
+        else:
+            thumbnails.schedule(pending)
+            self.stdout.write(f'Поставлено в очередь изображений: {len(pending)}')
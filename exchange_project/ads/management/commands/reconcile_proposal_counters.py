@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ads import inbox
+from ads.services import RECONCILE_BATCH_SIZE, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики предложений объявлений и сводки пользователей, исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE, help='Объявлений (пользователей) в одном запросе')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать объявления с расхождением')
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'Расхождения у {fixed} объявлений')
+        else:
+            self.stdout.write(f'Исправлено объявлений: {fixed}')
+            users = inbox.rebuild_all(batch_size=options['batch_size'])
+            self.stdout.write(f'Пересчитано сводок пользователей: {users}')
@@ -0,0 +1,107 @@
+"""
+Воркер фоновых задач (ads.taskqueue).
+
+    python manage.py run_task_worker --processes 4
+
+Каждый процесс в цикле забирает готовые задачи и выполняет их; когда очередь
+пуста, ждет ``--sleep`` секунд. SIGINT/SIGTERM главному процессу
+завершают воркеры после текущей задачи. ``--once`` — один проход и выход (cron, отладка),
+``--purge-days N`` — удалить выполненные задачи старше N дней и выйти.
+"""
+import logging
+import multiprocessing
+import signal
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger('ads.tasks')
+
+# Модуль импортируется в дочерних процессах (spawn) до django.setup(),
+# поэтому модели и ads.taskqueue загружаются внутри функций
+
+
+def _work(sleep, limit):
+    """Цикл одного процесса-воркера"""
+    from ads import taskqueue
+
+    stopping = []
+    for number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(number, lambda *args: stopping.append(True))
+    while not stopping:
+        try:
+            done, failed = taskqueue.run_pending(limit)
+        except DatabaseError:
+            # База недоступна (перезапуск, переключение): воркер ждет и переподключается
+            logger.exception('Ошибка базы данных в воркере задач')
+            done = failed = 0
+        if not done and not failed:
+            # Соединение не держится открытым, пока очередь пуста
+            connections.close_all()
+            time.sleep(sleep)
+
+
+def _spawned(sleep, limit):
+    import django
+
+    django.setup()
+    _work(sleep, limit)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Сколько процессов-воркеров запустить')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Пауза при пустой очереди, секунды')
+        parser.add_argument('--batch-size', type=int, help='Задач за один проход (по умолчанию taskqueue.CLAIM_BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--purge-days', type=int, help='Удалить выполненные задачи старше N дней и выйти')
+
+    def handle(self, *args, **options):
+        from ads import taskqueue
+
+        batch_size = options['batch_size'] or taskqueue.CLAIM_BATCH_SIZE
+        if options['purge_days'] is not None:
+            deleted = taskqueue.purge(timedelta(days=options['purge_days']))
+            self.stdout.write(f'Удалено задач: {deleted}')
+            return
+        if options['once']:
+            done = failed = 0
+            while True:
+                # Повторы откладываются в будущее, поэтому цикл конечен
+                batch = taskqueue.run_pending(batch_size)
+                if batch == (0, 0):
+                    break
+                done, failed = done + batch[0], failed + batch[1]
+            self.stdout.write(f'Выполнено задач: {done}, с ошибкой: {failed}')
+            return
+        if options['processes'] < 1:
+            raise CommandError('Нужен хотя бы один процесс')
+
+        if options['processes'] == 1:
+            _work(options['sleep'], batch_size)
+            return
+
+        # spawn, а не fork: дочерние процессы не наследуют соединения с базой
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=_spawned, args=(options['sleep'], batch_size), daemon=False)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено воркеров: {len(workers)}')
+
+        def stop(*args):
+            # Дочерние процессы получают SIGTERM и завершаются после текущей задачи
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        for number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(number, stop)
+        for worker in workers:
+            worker.join()
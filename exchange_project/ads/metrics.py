@@ -0,0 +1,262 @@
+"""
+Метрики запросов: время представления, SQL, рендеринг шаблонов, кэши.
+
+Значения одного запроса собирает ``RequestMetrics`` (его создает
+MetricsMiddleware и хранит в contextvar — он виден и в потоках
+sync_to_async). По завершении запроса они добавляются в реестр процесса
+и пишутся структурированной записью в логгер ``ads.metrics``.
+
+Реестр — счетчики и гистограммы в памяти процесса; ``exposition()`` отдает
+их в текстовом формате Prometheus (ops/metrics/). Каждый воркер считает
+свое, поэтому Prometheus опрашивает процессы по отдельности.
+
+Время шаблонов измеряет бэкенд ``ads.metrics.DjangoTemplates`` (TEMPLATES),
+попадания кэшей сообщают сами модули (``cache_result``).
+
+Профилирование: запрос с заголовком ``X-Ads-Profile``, равным
+``ADS_PROFILE_TOKEN``, или доля ``ADS_PROFILE_SAMPLE_RATE`` всех запросов
+выполняется под cProfile; результат пишется в ``ADS_PROFILE_DIR``: ``.prof``
+для pstats/snakeviz и ``.txt`` с самыми дорогими по cumulative функциями.
+"""
+import contextvars
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from . import dbpool
+
+PROFILE_HEADER = 'X-Ads-Profile'
+# Границы гистограммы времени запроса, секунды
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Сколько строк pstats сохранять в текстовом отчете профиля
+PROFILE_LINES = 40
+
+_current = contextvars.ContextVar('ads_request_metrics', default=None)
+_SLUG_RE = re.compile(r'[^\w.-]+')
+
+
+class RequestMetrics:
+    """Значения одного запроса; изменяется из любого потока этого запроса"""
+
+    def __init__(self):
+        self.template_seconds = 0.0
+        self.cache = Counter()
+        self._rendering = 0
+
+    @contextmanager
+    def rendering(self):
+        # Вложенный рендеринг (карточки внутри страницы) учитывается один раз
+        self._rendering += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._rendering -= 1
+            if not self._rendering:
+                self.template_seconds += time.perf_counter() - started
+
+
+@contextmanager
+def collect():
+    """Собирает метрики запроса в RequestMetrics, доступный через current()"""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def cache_result(cache, hits=0, misses=0):
+    """Обращения к кэшу cache в текущем запросе и в реестре процесса"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[cache, 'hit'] += hits
+        metrics.cache[cache, 'miss'] += misses
+    registry.add_cache(cache, hits, misses)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        with metrics.rendering():
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Стандартный бэкенд шаблонов, измеряющий время рендеринга"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class _ViewStats:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+class Registry:
+    """Счетчики процесса; методы потокобезопасны"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = defaultdict(_ViewStats)
+            self._responses = Counter()
+            self._cache = Counter()
+
+    def add_request(self, view, method, status, seconds, sql_queries, sql_seconds, template_seconds):
+        with self._lock:
+            stats = self._views[view]
+            stats.count += 1
+            stats.seconds += seconds
+            stats.sql_queries += sql_queries
+            stats.sql_seconds += sql_seconds
+            stats.template_seconds += template_seconds
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[index] += 1
+            self._responses[view, method, status] += 1
+
+    def add_cache(self, cache, hits, misses):
+        if not hits and not misses:
+            return
+        with self._lock:
+            self._cache[cache, 'hit'] += hits
+            self._cache[cache, 'miss'] += misses
+
+    def exposition(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        with self._lock:
+            views = {view: vars(stats).copy() for view, stats in self._views.items()}
+            responses = dict(self._responses)
+            cache = dict(self._cache)
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+        metric('ads_responses_total', 'counter', 'Ответы по представлению, методу и коду', [
+            ({'view': view, 'method': method, 'status': status}, value)
+            for (view, method, status), value in sorted(responses.items())
+        ])
+
+        duration = []
+        for view, stats in sorted(views.items()):
+            for bound, value in zip(DURATION_BUCKETS, stats['buckets']):
+                duration.append(({'view': view, 'le': bound}, value))
+            duration.append(({'view': view, 'le': '+Inf'}, stats['count']))
+        lines.append('# HELP ads_request_duration_seconds Время обработки запроса')
+        lines.append('# TYPE ads_request_duration_seconds histogram')
+        for labels, value in duration:
+            lines.append(f'ads_request_duration_seconds_bucket{_labels(labels)} {_number(value)}')
+        for view, stats in sorted(views.items()):
+            lines.append(f'ads_request_duration_seconds_sum{_labels({"view": view})} {_number(stats["seconds"])}')
+            lines.append(f'ads_request_duration_seconds_count{_labels({"view": view})} {stats["count"]}')
+
+        for name, field, help_text in (
+            ('ads_sql_queries_total', 'sql_queries', 'SQL-запросы представления'),
+            ('ads_sql_duration_seconds_total', 'sql_seconds', 'Время SQL-запросов представления'),
+            ('ads_template_render_seconds_total', 'template_seconds', 'Время рендеринга шаблонов'),
+        ):
+            metric(name, 'counter', help_text, [({'view': view}, stats[field]) for view, stats in sorted(views.items())])
+
+        metric('ads_cache_requests_total', 'counter', 'Обращения к кэшам приложения', [
+            ({'cache': name, 'result': result}, value) for (name, result), value in sorted(cache.items())
+        ])
+
+        pool = dbpool.pool_stats()
+        if pool is not None:
+            metric('ads_db_pool', 'gauge', 'Статистика пула соединений (psycopg_pool)', [
+                ({'stat': stat}, value) for stat, value in sorted(pool.items()) if isinstance(value, (int, float))
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def should_profile(request):
+    """Профилировать ли запрос: заголовок с токеном или случайная выборка"""
+    token = getattr(settings, 'ADS_PROFILE_TOKEN', '')
+    header = request.headers.get(PROFILE_HEADER)
+    if token and header and hmac.compare_digest(header, token):
+        return True
+    rate = getattr(settings, 'ADS_PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def start_profile():
+    """Включенный cProfile или None, если в потоке уже работает другой профилировщик"""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+
+def save_profile(profile, view, seconds):
+    """Сохраняет профиль в ADS_PROFILE_DIR; возвращает путь к .prof"""
+    profile.disable()
+    directory = Path(settings.ADS_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{_SLUG_RE.sub("_", view)}-{seconds * 1000:.0f}ms-{random.getrandbits(32):08x}'
+    path = directory / f'{name}.prof'
+    profile.dump_stats(path)
+
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    (directory / f'{name}.txt').write_text(report.getvalue(), encoding='utf-8')
+    return path
@@ -0,0 +1,295 @@
+"""
+Middleware приложения ads.
+
+QueryBudgetMiddleware считает SQL-запросы и их суммарное время за весь запрос
+(включая загрузку сессии и пользователя) и сверяет с бюджетом, объявленным
+у представления декоратором ``ads.decorators.query_budget``. Запросы фоновых
+задач, выполняемых сразу в eager-режиме (тесты), не учитываются: в продакшене
+их выполняет воркер, а запрос только ставит задачу.
+
+ReplicaRoutingMiddleware направляет чтение безопасных запросов на реплики
+(ads.routers) и закрепляет пользователя за основной базой после записи.
+
+MetricsMiddleware собирает метрики запроса (ads.metrics) и по запросу
+или по выборке профилирует его.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, taskqueue
+from .routers import replica_reads, watch_writes
+
+logger = logging.getLogger('ads.query_budget')
+metrics_logger = logging.getLogger('ads.metrics')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов (или дольше), чем объявлено"""
+
+
+def fingerprint(sql):
+    """
+    Нормализованный текст запроса: литералы заменены на ?, списки IN свернуты.
+    Одинаковые отпечатки, повторяющиеся много раз, — признак N+1.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper, запоминающий текст и длительность каждого запроса"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if taskqueue.running_eager():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def total_time_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def fingerprints(self, limit=5):
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return counts.most_common(limit)
+
+    def record(self):
+        """Контекстный менеджер, подключающий запись ко всем соединениям"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class QueryBudget:
+    def __init__(self, max_queries, max_time_ms=None):
+        self.max_queries = max_queries
+        self.max_time_ms = max_time_ms
+
+    def __repr__(self):
+        return f'<QueryBudget queries<={self.max_queries} time<={self.max_time_ms}ms>'
+
+    def violations(self, recorder):
+        problems = []
+        if len(recorder) > self.max_queries:
+            problems.append(f'{len(recorder)} запросов при бюджете {self.max_queries}')
+        if self.max_time_ms is not None and recorder.total_time_ms > self.max_time_ms:
+            problems.append(f'{recorder.total_time_ms:.1f} мс SQL при бюджете {self.max_time_ms} мс')
+        return problems
+
+
+class QueryBudgetMiddleware:
+    """
+    Проверяет бюджет SQL-запросов представления.
+
+    При ``QUERY_BUDGET_RAISE`` (по умолчанию равен DEBUG, включен в тестах)
+    превышение бросает QueryBudgetExceeded; иначе пишется структурированное
+    предупреждение в логгер ``ads.query_budget`` с отпечатками запросов.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # Асинхронный ORM выполняет запросы в потоке sync_to_async(thread_sensitive=True)
+        # этого запроса, поэтому запись подключается к соединениям того же потока
+        recorder = QueryRecorder()
+        recording = await sync_to_async(recorder.record)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None:
+            problems = budget.violations(recorder)
+            if problems:
+                self.report(request, budget, recorder, problems)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def report(self, request, budget, recorder, problems):
+        view = request.resolver_match.view_name if request.resolver_match else request.path
+        payload = {
+            'view': view,
+            'path': request.path,
+            'queries': len(recorder),
+            'max_queries': budget.max_queries,
+            'sql_time_ms': round(recorder.total_time_ms, 2),
+            'max_time_ms': budget.max_time_ms,
+            'fingerprints': [
+                {'sql': sql, 'count': count} for sql, count in recorder.fingerprints()
+            ],
+        }
+
+        if getattr(settings, 'QUERY_BUDGET_RAISE', settings.DEBUG):
+            raise QueryBudgetExceeded(
+                f'{view}: {"; ".join(problems)}\n{json.dumps(payload, ensure_ascii=False, indent=2)}'
+            )
+        logger.warning(
+            'Превышен бюджет SQL-запросов: %s',
+            json.dumps(payload, ensure_ascii=False),
+            extra={'query_budget': payload},
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET/HEAD без cookie закрепления читают с реплик. Если запрос что-то записал
+    в основную базу, ответ ставит cookie ``REPLICA_PIN_COOKIE`` на
+    ``REPLICA_PIN_SECONDS`` секунд: пока она есть, все запросы пользователя
+    читают основную базу и видят собственные изменения.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with replica_reads(self.use_replicas(request)) as state, watch_writes(state):
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        # Контекст копируется в потоки sync_to_async, а состояние — общий объект;
+        # наблюдение подключается к соединению потока, где выполняется ORM
+        with replica_reads(self.use_replicas(request)) as state:
+            watching = await sync_to_async(watch_writes)(state)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(watching.close)()
+        return self.pin(response, state)
+
+    def use_replicas(self, request):
+        return request.method in self.safe_methods and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Время запроса, SQL-запросы и их время, время шаблонов и обращения к кэшам:
+    в реестр процесса (ads.metrics.registry) и структурированной записью
+    уровня INFO в логгер ``ads.metrics``.
+
+    Время потоковых ответов (выгрузки) учитывается до начала отдачи тела.
+    Под ASGI профиль cProfile охватывает только поток event loop — запросы
+    ORM в потоках sync_to_async в него не попадают.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile = metrics.start_profile() if metrics.should_profile(request) else None
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with metrics.collect() as collected, recorder.record():
+            response = self.get_response(request)
+        return self.finish(request, response, collected, recorder, time.perf_counter() - started, profile)
+
+    async def __acall__(self, request):
+        profile = metrics.start_profile() if metrics.should_profile(request) else None
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with metrics.collect() as collected:
+            recording = await sync_to_async(recorder.record)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(recording.close)()
+        return self.finish(request, response, collected, recorder, time.perf_counter() - started, profile)
+
+    def finish(self, request, response, collected, recorder, seconds, profile):
+        # Имя маршрута, а не путь: у метрик должно быть ограниченное число меток
+        view = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        sql_seconds = recorder.total_time_ms / 1000
+        metrics.registry.add_request(
+            view, request.method, response.status_code, seconds, len(recorder), sql_seconds,
+            collected.template_seconds,
+        )
+
+        payload = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(seconds * 1000, 2),
+            'sql_queries': len(recorder),
+            'sql_time_ms': round(recorder.total_time_ms, 2),
+            'template_ms': round(collected.template_seconds * 1000, 2),
+            'cache': {f'{cache}_{result}': count for (cache, result), count in collected.cache.items() if count},
+        }
+        if profile is not None:
+            path = metrics.save_profile(profile, view, seconds)
+            payload['profile'] = str(path)
+            if metrics.PROFILE_HEADER in request.headers:
+                response[metrics.PROFILE_HEADER] = path.name
+        metrics_logger.info('Запрос: %s', json.dumps(payload, ensure_ascii=False), extra={'metrics': payload})
+        return response
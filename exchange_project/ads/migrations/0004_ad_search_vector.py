@@ -0,0 +1,28 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+from ads.search import install_search_backend, uninstall_search_backend
+
+
+def install(apps, schema_editor):
+    install_search_backend(schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_backend(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0003_alter_exchangeproposal_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
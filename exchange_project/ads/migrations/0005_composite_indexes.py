@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0004_ad_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['-created_at', '-id'], name='ads_ad_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='ads_ad_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['condition', '-created_at', '-id'], name='ads_ad_cond_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['category', 'condition', '-created_at', '-id'], name='ads_ad_cat_cond_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='ads_prop_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='ads_prop_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['ad_receiver', 'status', '-created_at', '-id'], name='ads_prop_recv_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['ad_receiver', '-created_at'], name='ads_prop_pending_recv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['ad_sender'], name='ads_prop_pending_sender_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0005_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
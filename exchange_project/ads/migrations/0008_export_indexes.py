@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_ad_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['updated_at', 'id'], name='ads_ad_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['created_at', 'id'], name='ads_prop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['updated_at', 'id'], name='ads_prop_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+
+    def count(field, **filters):
+        proposals = (
+            ExchangeProposal.objects.filter(**{field: OuterRef('pk')}, **filters)
+            .order_by().values(field).annotate(n=Count('pk')).values('n')
+        )
+        return Coalesce(Subquery(proposals), 0)
+
+    Ad.objects.using(schema_editor.connection.alias).update(
+        received_pending_count=count('ad_receiver', status='P'),
+        received_accepted_count=count('ad_receiver', status='A'),
+        received_rejected_count=count('ad_receiver', status='R'),
+        sent_count=count('ad_sender'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_export_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='received_accepted_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_pending_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_rejected_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='sent_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+BATCH_SIZE = 1000
+SENT_FIELDS = {'P': 'sent_pending', 'A': 'sent_accepted', 'R': 'sent_rejected'}
+RECEIVED_FIELDS = {'P': 'received_pending', 'A': 'received_accepted', 'R': 'received_rejected'}
+
+
+def fill_summaries(apps, schema_editor):
+    """Сводка каждого существующего пользователя по таблице предложений, пачками по id"""
+    alias = schema_editor.connection.alias
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    ProposalSummary = apps.get_model('ads', 'ProposalSummary')
+
+    last = 0
+    while True:
+        ids = list(User.objects.using(alias).filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        last = ids[-1]
+        summaries = {pk: ProposalSummary(user_id=pk) for pk in ids}
+        for user_field, fields in (('user_id', SENT_FIELDS), ('ad_receiver__user_id', RECEIVED_FIELDS)):
+            for user_id, status, number, latest in (
+                ExchangeProposal.objects.using(alias).filter(**{f'{user_field}__in': ids}).order_by()
+                .values_list(user_field, 'status').annotate(number=Count('pk'), latest=Max('updated_at'))
+            ):
+                summary = summaries[user_id]
+                setattr(summary, fields[status], number)
+                if summary.last_activity_at is None or latest > summary.last_activity_at:
+                    summary.last_activity_at = latest
+        ProposalSummary.objects.using(alias).bulk_create(summaries.values(), ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0009_ad_proposal_counters'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProposalSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='proposal_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sent_pending', models.IntegerField(default=0)),
+                ('sent_accepted', models.IntegerField(default=0)),
+                ('sent_rejected', models.IntegerField(default=0)),
+                ('received_pending', models.IntegerField(default=0)),
+                ('received_accepted', models.IntegerField(default=0)),
+                ('received_rejected', models.IntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_receiver_user(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    ExchangeProposal.objects.using(schema_editor.connection.alias).update(
+        receiver_user=Subquery(Ad.objects.filter(pk=OuterRef('ad_receiver_id')).values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0010_proposal_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='receiver_user',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_proposals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_receiver_user, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['receiver_user', '-created_at', '-id'], name='ads_prop_recv_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['receiver_user', 'status', '-created_at', '-id'], name='ads_prop_recv_user_status_idx'),
+        ),
+    ]
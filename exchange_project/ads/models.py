@@ -1,5 +1,72 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
+
+from .search import search_ads
+
+
+class AdQuerySet(models.QuerySet):
+    def search(self, query):
+        """Полнотекстовый поиск с ранжированием (см. ads.search)"""
+        return search_ads(self, query)
+
+    def feed(self, search='', category='', condition=''):
+        """Лента главной страницы: поиск, фильтры и сортировка"""
+        ads = self
+        ordering = ('-created_at', '-id')
+        if search:
+            ads = ads.search(search)
+            ordering = ('-search_rank',) + ordering
+        if category:
+            ads = ads.filter(category=category)
+        if condition:
+            ads = ads.filter(condition=condition)
+        # Автор выводится в карточке; поисковый вектор в ленте не нужен
+        return ads.select_related('user').defer('search_vector').order_by(*ordering)
+
+
+# Длина начала комментария, которого хватает для truncatewords в списке
+COMMENT_PREVIEW_LENGTH = 200
+
+
+class ExchangeProposalQuerySet(models.QuerySet):
+    def for_user(self, user, proposal_type=''):
+        """Предложения пользователя: отправленные (sent), полученные (received) или все"""
+        if proposal_type == 'sent':
+            return self.filter(user=user)
+        if proposal_type == 'received':
+            return self.filter(receiver_user=user)
+        return self.filter(Q(user=user) | Q(receiver_user=user))
+
+    def for_listing(self, with_text=False):
+        """
+        Предложения вместе с отправителем, объявлениями обеих сторон
+        и их авторами одним запросом.
+
+        По умолчанию не загружает большие текстовые колонки: вместо comment
+        доступно начало комментария ``comment_preview``. ``with_text=True``
+        загружает комментарий и описания полностью (страница предложения).
+        """
+        proposals = self.select_related('user', 'ad_sender__user', 'ad_receiver__user').defer(
+            'ad_sender__search_vector', 'ad_receiver__search_vector'
+        )
+        if with_text:
+            return proposals
+        return proposals.defer(
+            'comment', 'ad_sender__description', 'ad_receiver__description'
+        ).annotate(comment_preview=Substr('comment', 1, COMMENT_PREVIEW_LENGTH))
+
+
+# Поле счетчика полученных предложений для каждого статуса
+RECEIVED_COUNTERS = {
+    'P': 'received_pending_count',
+    'A': 'received_accepted_count',
+    'R': 'received_rejected_count',
+}
+COUNTER_FIELDS = (*RECEIVED_COUNTERS.values(), 'sent_count')
 
 
 class Ad(models.Model):
@@ -21,10 +88,51 @@ class Ad(models.Model):
     category = models.CharField(max_length=1, choices=CATEGORIES)
     condition = models.CharField(max_length=1, choices=CONDITIONS)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Время последнего изменения; из него строятся ETag JSON API (ads.api)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Увеличивается при редактировании; входит в ключ кэша карточки (ads.fragments)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Заполняется триггером PostgreSQL, GIN-индекс создается миграцией 0004
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Счетчики предложений обмена. Меняются только UPDATE ... SET x = x + n
+    # в ads.services вместе с самими предложениями; пересчет —
+    # команда reconcile_proposal_counters
+    received_pending_count = models.IntegerField(default=0, editable=False)
+    received_accepted_count = models.IntegerField(default=0, editable=False)
+    received_rejected_count = models.IntegerField(default=0, editable=False)
+    sent_count = models.IntegerField(default=0, editable=False)
+
+    objects = AdQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Лента без фильтров и с фильтрами по категории/состоянию, сортировка -created_at
+            models.Index(fields=['-created_at', '-id'], name='ads_ad_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='ads_ad_cat_created_idx'),
+            models.Index(fields=['condition', '-created_at', '-id'], name='ads_ad_cond_created_idx'),
+            models.Index(fields=['category', 'condition', '-created_at', '-id'], name='ads_ad_cat_cond_created_idx'),
+            # Инкрементальная выгрузка по updated_at (ads.exporter)
+            models.Index(fields=['updated_at', 'id'], name='ads_ad_updated_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Полное сохранение (форма, админка) не перезаписывает счетчики значениями,
+        # прочитанными до параллельного изменения предложений
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(COUNTER_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def received_count(self):
+        return self.received_pending_count + self.received_accepted_count + self.received_rejected_count
+
 class ExchangeProposal(models.Model):
     STATUS_CHOICES = (
         ('P', 'Pending'),
@@ -34,17 +142,62 @@ class ExchangeProposal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exchange_proposals', null=True, blank=True)
     ad_sender = models.ForeignKey(Ad, related_name='sent_proposals', on_delete=models.CASCADE)
     ad_receiver = models.ForeignKey(Ad, related_name='received_proposals', on_delete=models.CASCADE)
+    # Автор ad_receiver: полученные предложения пользователя выбираются
+    # по индексу без соединения с ads_ad. Заполняется в save()
+    receiver_user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='received_proposals', null=True, blank=True, editable=False,
+    )
     comment = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='P')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ExchangeProposalQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Отправленные предложения пользователя, в том числе с фильтром по статусу
+            models.Index(fields=['user', '-created_at', '-id'], name='ads_prop_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='ads_prop_user_status_idx'),
+            # Полученные предложения пользователя, в том числе с фильтром по статусу
+            models.Index(fields=['receiver_user', '-created_at', '-id'], name='ads_prop_recv_user_idx'),
+            models.Index(
+                fields=['receiver_user', 'status', '-created_at', '-id'], name='ads_prop_recv_user_status_idx',
+            ),
+            # Полученные предложения объявления и update_proposal_status
+            models.Index(fields=['ad_receiver', 'status', '-created_at', '-id'], name='ads_prop_recv_status_idx'),
+            # Ожидающие ответа — небольшая горячая часть таблицы
+            models.Index(
+                fields=['ad_receiver', '-created_at'],
+                condition=Q(status='P'),
+                name='ads_prop_pending_recv_idx',
+            ),
+            models.Index(
+                fields=['ad_sender'],
+                condition=Q(status='P'),
+                name='ads_prop_pending_sender_idx',
+            ),
+            # Инкрементальная выгрузка по created_at/updated_at (ads.exporter)
+            models.Index(fields=['created_at', 'id'], name='ads_prop_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='ads_prop_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Proposal from {self.ad_sender} to {self.ad_receiver}"
 
+    def save(self, *args, **kwargs):
+        # receiver_user повторяет автора объявления-получателя: загруженное
+        # объявление (форма, админка) берется как есть, иначе id читается запросом
+        if ExchangeProposal.ad_receiver.is_cached(self):
+            self.receiver_user_id = self.ad_receiver.user_id
+        elif self._state.adding or self.receiver_user_id is None:
+            self.receiver_user_id = Ad.objects.filter(pk=self.ad_receiver_id).values_list('user_id', flat=True).first()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'ad_receiver' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'receiver_user'}
+        super().save(*args, **kwargs)
+
     def get_status_display_ru(self):
         """Возвращает русское название статуса"""
         status_dict = {
@@ -52,4 +205,122 @@ class ExchangeProposal(models.Model):
             'A': 'Принято',
             'R': 'Отклонено'
         }
-        return status_dict.get(str(self.status), str(self.status))
\ No newline at end of file
+        return status_dict.get(str(self.status), str(self.status))
+
+class ProposalSummary(models.Model):
+    """
+    Сводка предложений пользователя для значков в шапке: количества отправленных
+    и полученных предложений по статусам и время последнего события.
+    Поддерживается ads.services в транзакциях изменения предложений,
+    читается через кэш (ads.inbox).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='proposal_summary')
+    sent_pending = models.IntegerField(default=0)
+    sent_accepted = models.IntegerField(default=0)
+    sent_rejected = models.IntegerField(default=0)
+    received_pending = models.IntegerField(default=0)
+    received_accepted = models.IntegerField(default=0)
+    received_rejected = models.IntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Proposal summary of {self.user_id}'
+
+
+class BarterCycle(models.Model):
+    """
+    Цепочка обмена нескольких участников: объявления ``A → B → C → A``, где
+    каждая стрелка — ожидающее предложение (автор A хочет B, автор B хочет C,
+    автор C хочет A). Находится ads.cycles по графу ожидающих предложений
+    и удаляется, как только одно из ее предложений перестает ожидать ответа.
+    """
+    # id объявлений цепочки через "-", начиная с наименьшего: одна цепочка — одна строка
+    key = models.CharField(max_length=255, unique=True)
+    length = models.PositiveSmallIntegerField()
+    proposals = models.ManyToManyField(ExchangeProposal, related_name='barter_cycles')
+    users = models.ManyToManyField(User, related_name='barter_cycles')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f'Barter cycle {self.key}'
+
+    @property
+    def ad_ids(self):
+        return [int(pk) for pk in self.key.split('-')]
+
+
+class Task(models.Model):
+    """
+    Фоновая задача (ads.taskqueue): имя обработчика и его аргументы в JSON.
+    Выполняется воркером run_task_worker; ключ идемпотентности не дает
+    поставить одну и ту же задачу дважды.
+    """
+    STATUS_CHOICES = [
+        ('Q', 'Queued'),
+        ('R', 'Running'),
+        ('D', 'Done'),
+        ('F', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='Q')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Выборка воркером: готовые к запуску задачи в порядке run_at
+            models.Index(fields=['status', 'run_at', 'id'], name='ads_task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} [{self.get_status_display()}]'
+
+
+class Notification(models.Model):
+    """
+    Уведомление пользователя о событии предложения (ads.notifications).
+    Текст сохраняется при создании: объявления могут быть удалены позже.
+    Ссылка на предложение без ограничения в базе — предложения удаляются
+    в обход ORM (ads.services).
+    """
+    KIND_CHOICES = [
+        ('created', 'Created'),
+        ('accepted', 'Accepted'),
+        ('rejected', 'Rejected'),
+        ('auto_rejected', 'Auto-rejected'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    proposal = models.ForeignKey(
+        ExchangeProposal, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    message = models.CharField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Страница уведомлений пользователя
+            models.Index(fields=['user', '-created_at', '-id'], name='ads_notif_user_created_idx'),
+            # Письма-дайджесты: еще не отправленные уведомления
+            models.Index(
+                fields=['user'], name='ads_notif_unemailed_idx', condition=Q(emailed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.message}'
@@ -0,0 +1,152 @@
+"""
+Уведомления о событиях предложений.
+
+В запросе событие стоит один INSERT задачи (``proposal_event``) независимо от
+числа получателей: при принятии предложения все автоматически отклоненные
+передаются одним списком id. Задача ``ads.notify_proposals`` (``create``)
+одним запросом читает предложения и одним bulk_create записывает уведомления
+всем получателям, после чего ставит письмо-дайджест.
+
+Дайджест (``ads.send_notification_digests``, ``send_digests``) ставится
+с ключом окна ``ADS_NOTIFICATION_DIGEST_SECONDS``: все события окна попадают
+в одну задачу, которая отправляет по письму каждому получателю через одно
+SMTP-соединение (``get_connection`` + ``send_messages``) и отмечает уведомления
+отправленными. Задача выполняется вне общей транзакции (``atomic=False``):
+каждая пачка получателей фиксируется сама, и ошибка в следующей пачке не
+откатывает отметки уже отправленных писем — повтор их не дублирует.
+Пользователи без адреса почты видят уведомления только на сайте.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import taskqueue
+from .models import ExchangeProposal, Notification
+
+# Кому уведомление и его текст по виду события
+MESSAGES = {
+    'created': ('receiver_user_id', 'Новое предложение: «{sender}» в обмен на ваше «{receiver}»'),
+    'accepted': ('user_id', 'Ваше предложение «{sender}» → «{receiver}» принято'),
+    'rejected': ('user_id', 'Ваше предложение «{sender}» → «{receiver}» отклонено'),
+    'auto_rejected': (
+        'user_id', 'Ваше предложение «{sender}» → «{receiver}» отклонено: одно из объявлений уже участвует в принятом обмене',
+    ),
+}
+INSERT_BATCH_SIZE = 1000
+# Скольким пользователям отправлять письма за одну выборку
+DIGEST_BATCH_SIZE = 200
+# Сколько уведомлений показывать на странице
+SHOWN_LIMIT = 50
+
+
+def proposal_event(events, key=None):
+    """
+    Ставит уведомления о событиях в очередь: events — {вид: [id предложений]}.
+    Вызывается в транзакции события; стоит один INSERT.
+    """
+    events = {kind: list(ids) for kind, ids in events.items() if ids}
+    if events:
+        taskqueue.enqueue('ads.notify_proposals', {'events': events}, key=key)
+
+
+def digest_window():
+    """Ключ текущего окна дайджеста и задержка до его конца"""
+    seconds = getattr(settings, 'ADS_NOTIFICATION_DIGEST_SECONDS', 300)
+    now = time.time()
+    start = int(now // seconds * seconds)
+    return f'notification-digest-{start}', timedelta(seconds=start + seconds - now)
+
+
+def create(events):
+    """Записывает уведомления всем получателям одним bulk_create и ставит дайджест"""
+    ids = {pk for kind_ids in events.values() for pk in kind_ids}
+    proposals = {
+        pk: rest for pk, *rest in ExchangeProposal.objects.filter(pk__in=ids).order_by().values_list(
+            'pk', 'user_id', 'receiver_user_id', 'ad_sender__title', 'ad_receiver__title',
+        )
+    }
+    notifications = []
+    for kind, kind_ids in events.items():
+        recipient, text = MESSAGES[kind]
+        for pk in kind_ids:
+            if pk not in proposals:
+                # Предложение удалено, пока задача ждала в очереди
+                continue
+            user_id, receiver_user_id, sender_title, receiver_title = proposals[pk]
+            notifications.append(Notification(
+                user_id=user_id if recipient == 'user_id' else receiver_user_id,
+                proposal_id=pk,
+                kind=kind,
+                message=text.format(sender=sender_title, receiver=receiver_title)[:500],
+            ))
+    Notification.objects.bulk_create(notifications, batch_size=INSERT_BATCH_SIZE)
+
+    if notifications:
+        key, delay = digest_window()
+        taskqueue.enqueue('ads.send_notification_digests', key=key, delay=delay)
+    return len(notifications)
+
+
+def send_digests():
+    """
+    Письма со всеми не отправленными уведомлениями, по одному на получателя,
+    через одно SMTP-соединение. Возвращает число писем.
+    """
+    sent = 0
+    last_user = 0
+    with get_connection() as connection:
+        while True:
+            users = list(
+                User.objects.filter(
+                    pk__gt=last_user, pk__in=Notification.objects.filter(emailed_at__isnull=True).values('user_id'),
+                ).order_by('pk').values_list('pk', 'username', 'email')[:DIGEST_BATCH_SIZE]
+            )
+            if not users:
+                return sent
+            last_user = users[-1][0]
+            sent += _send_batch(connection, users)
+
+
+def _send_batch(connection, users):
+    pending = Notification.objects.filter(user_id__in=[pk for pk, *_ in users], emailed_at__isnull=True)
+    by_user = {}
+    for notification in pending.order_by('user_id', 'created_at', 'id'):
+        by_user.setdefault(notification.user_id, []).append(notification)
+
+    messages = []
+    for pk, username, email in users:
+        if not email or pk not in by_user:
+            continue
+        messages.append(EmailMessage(
+            subject=f'Бартерная система: новых событий по предложениям — {len(by_user[pk])}',
+            body=render_to_string('ads/email/notification_digest.txt', {
+                'username': username, 'notifications': by_user[pk],
+                'site_url': getattr(settings, 'ADS_SITE_URL', ''),
+            }),
+            to=[email],
+            connection=connection,
+        ))
+
+    with transaction.atomic():
+        # Уведомления пользователей без почты тоже отмечаются: иначе они попадали бы в каждый дайджест
+        pending.filter(pk__in=[n.pk for items in by_user.values() for n in items]).update(emailed_at=timezone.now())
+        connection.send_messages(messages)
+    return len(messages)
+
+
+def for_user(user):
+    """Последние уведомления пользователя"""
+    return Notification.objects.filter(user=user).defer('emailed_at')[:SHOWN_LIMIT]
+
+
+def mark_read(user, notifications):
+    """Отмечает показанные уведомления прочитанными одним UPDATE"""
+    unread = [notification.pk for notification in notifications if notification.read_at is None]
+    if unread:
+        Notification.objects.filter(user=user, pk__in=unread).update(read_at=timezone.now())
@@ -0,0 +1,252 @@
+"""
+Курсорная (keyset) пагинация.
+
+В отличие от ``django.core.paginator.Paginator`` не выполняет ``COUNT(*)``
+и не использует ``OFFSET``: следующая страница выбирается условием
+``(created_at, id) < (последний created_at, последний id)``, поэтому стоимость
+запроса не зависит от глубины страницы. Позиция передается непрозрачным
+токеном ``cursor``.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Сохраняет микросекунды: DjangoJSONEncoder обрезает время до миллисекунд"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class InvalidCursor(Exception):
+    """Токен курсора не удалось разобрать"""
+
+
+class CursorPage:
+    """Страница курсорной пагинации; ведет себя как последовательность объектов"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Пагинатор по ключу сортировки.
+
+    ``ordering`` должен однозначно упорядочивать строки, поэтому последним
+    полем всегда идет первичный ключ.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def page(self, cursor=None):
+        queryset, direction = self._query(cursor)
+        return self._build(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        """Асинхронный вариант page() для async-представлений"""
+        queryset, direction = self._query(cursor)
+        return self._build([row async for row in queryset], direction)
+
+    def _query(self, cursor):
+        """QuerySet одной страницы (с лишней строкой-признаком продолжения) и направление"""
+        if not cursor:
+            return self._slice(self.queryset.order_by(*self.ordering)), None
+
+        direction, values = self.decode(cursor)
+        if direction == NEXT:
+            queryset = self.queryset.filter(self._after(values)).order_by(*self.ordering)
+        else:
+            # Назад: идем по обратной сортировке и разворачиваем результат
+            queryset = self.queryset.filter(self._before(values)).order_by(*self._reversed())
+        return self._slice(queryset), direction
+
+    def _build(self, rows, direction):
+        has_more = len(rows) > self.per_page
+        if direction is None:
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows,
+                next_cursor=self.encode(rows[-1], NEXT) if has_more else None,
+            )
+
+        if direction == NEXT:
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows,
+                next_cursor=self.encode(rows[-1], NEXT) if has_more else None,
+                previous_cursor=self.encode(rows[0], PREVIOUS) if rows else None,
+            )
+
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            next_cursor=self.encode(rows[-1], NEXT) if rows else None,
+            previous_cursor=self.encode(rows[0], PREVIOUS) if has_more else None,
+        )
+
+    def _slice(self, queryset):
+        return queryset[:self.per_page + 1]
+
+    def _fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def _reversed(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def _keyset(self, values, forward):
+        """
+        Условие "строго после ключа" в порядке сортировки:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _after(self, values):
+        return self._keyset(values, forward=True)
+
+    def _before(self, values):
+        return self._keyset(values, forward=False)
+
+    def encode(self, obj, direction):
+        # Строки .values() — словари, экземпляры моделей — атрибуты
+        if isinstance(obj, dict):
+            values = [obj[name] for name, _ in self._fields()]
+        else:
+            values = [getattr(obj, name) for name, _ in self._fields()]
+        payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError, binascii.Error) as e:
+            raise InvalidCursor(cursor) from e
+
+        fields = self._fields()
+        if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+
+        try:
+            return direction, [self._to_python(name, value) for (name, _), value in zip(fields, values)]
+        except ValidationError as e:
+            raise InvalidCursor(cursor) from e
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Аннотации (например, search_rank) сериализуются как есть
+            return value
+        return field.to_python(value)
+
+
+def paginate(request, queryset, per_page, ordering=None, count=None):
+    """
+    Возвращает страницу для запроса.
+
+    Если ``ordering`` не задан, берется явная сортировка QuerySet
+    или ``DEFAULT_ORDERING``. ``count`` — необязательная функция, возвращающая
+    уже известное количество строк, чтобы постраничный пагинатор не считал их сам.
+
+    По умолчанию используется курсорная пагинация (параметр ``cursor``).
+    Постраничная навигация с номерами (параметр ``page``) включается только
+    явно — она считает строки и подходит лишь для небольших выборок.
+    """
+    ordering = ordering or queryset.query.order_by or DEFAULT_ORDERING
+    page_number = request.GET.get('page')
+    if page_number is None:
+        paginator = CursorPaginator(queryset, per_page, ordering)
+        try:
+            return paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return paginator.page()
+
+    paginator = Paginator(queryset.order_by(*ordering), per_page)
+    if count is not None:
+        paginator.count = int(count())
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        # Если страница не является числом, показываем первую страницу
+        return paginator.page(1)
+    except EmptyPage:
+        # Если страница больше максимальной, показываем последнюю страницу
+        return paginator.page(paginator.num_pages)
+
+
+async def apaginate(request, queryset, per_page, ordering=None, count=None):
+    """
+    Асинхронный вариант paginate(). Курсорная страница читается асинхронным ORM;
+    постраничный режим (``?page=``) синхронный и выполняется в потоке.
+    """
+    ordering = ordering or queryset.query.order_by or DEFAULT_ORDERING
+    if request.GET.get('page') is not None:
+        return await sync_to_async(_evaluated_page)(request, queryset, per_page, ordering, count)
+
+    paginator = CursorPaginator(queryset, per_page, ordering)
+    try:
+        return await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        return await paginator.apage()
+
+
+def _evaluated_page(request, queryset, per_page, ordering, count):
+    # Строки страницы читаются здесь же, в потоке: ленивый QuerySet нельзя выполнить в event loop
+    page = paginate(request, queryset, per_page, ordering, count)
+    page.object_list = list(page.object_list)
+    return page
+
+
+def page_total(page):
+    """Общее количество строк, если страница построена постраничным пагинатором"""
+    if isinstance(page, CursorPage):
+        return None
+    return page.paginator.count
@@ -0,0 +1,90 @@
+"""
+Маршрутизация чтения на реплики базы данных.
+
+Реплики перечислены в ``settings.DATABASE_REPLICAS``. Читать с них разрешено
+только внутри ``replica_reads()`` — его включает ReplicaRoutingMiddleware для
+безопасных запросов (GET/HEAD/OPTIONS), все остальное идет в основную базу.
+
+Чтение своих записей: после первого INSERT/UPDATE/DELETE в основной базе
+оставшиеся чтения того же запроса идут туда же, а middleware
+выставляет cookie, закрепляющую следующие запросы за основной базой на
+``REPLICA_PIN_SECONDS`` секунд — пока реплики догоняют основную базу.
+Чтения внутри транзакции основной базы тоже не уходят на реплики.
+
+Реплика выбирается один раз на запрос: количество и строки страницы (или
+объявление и его список) читаются с одной реплики, а не с реплик с разным
+отставанием.
+"""
+import random
+import re
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_routing = ContextVar('ads_replica_routing', default=None)
+_WRITE_RE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+class _Routing:
+    """
+    Состояние маршрутизации одного запроса. Экземпляр — execute_wrapper
+    основной базы: отмечает выполненные INSERT/UPDATE/DELETE.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.wrote = False
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        self.replica = random.choice(replicas) if enabled and replicas else None
+
+    def __call__(self, execute, sql, params, many, context):
+        if _WRITE_RE.match(sql):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Разрешает (enabled=True) чтение с реплик. Возвращает состояние, флаг wrote
+    которого отмечает запись в базу в пределах блока.
+    """
+    state = _Routing(enabled)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def watch_writes(state):
+    """
+    Подключает state к основной базе текущего потока. Возвращает ExitStack,
+    закрытие которого отключает наблюдение.
+    """
+    stack = ExitStack()
+    stack.enter_context(connections[DEFAULT_DB_ALIAS].execute_wrapper(state))
+    return stack
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Объекты, прочитанные с реплики, сохраняются в основную базу
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
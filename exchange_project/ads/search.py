@@ -0,0 +1,219 @@
+"""
+Полнотекстовый поиск по объявлениям.
+
+PostgreSQL: колонка ``ads_ad.search_vector`` (tsvector) поддерживается триггером
+и индексируется GIN-индексом. Вектор строится сразу для русской и английской
+конфигураций, поэтому стемминг работает для обоих языков; заголовок весит
+больше описания. Результаты ранжируются через ``ts_rank``.
+
+SQLite (``config.test_settings``): виртуальная таблица FTS5 ``ads_ad_fts``
+с внешним содержимым, синхронизируемая триггерами, ранжирование через ``bm25``.
+Токенизатор ``porter unicode61`` стеммит английские слова, для русских
+используется поиск по префиксу.
+
+Прочие СУБД откатываются на ``icontains``.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_CONFIGS = ('russian', 'english')
+
+FTS_TABLE = 'ads_ad_fts'
+FTS_TRIGGERS = ('ads_ad_fts_ai', 'ads_ad_fts_ad', 'ads_ad_fts_au')
+
+# Веса колонок для bm25 (title, description) — аналог весов A/B в PostgreSQL
+FTS_WEIGHTS = (10.0, 1.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_ads(queryset, query):
+    """
+    Фильтрует QuerySet объявлений по поисковому запросу.
+
+    Возвращает QuerySet с аннотацией ``search_rank``, отсортированный
+    по релевантности, затем по дате создания.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        queryset = _search_postgresql(queryset, query)
+    elif vendor == 'sqlite':
+        queryset = _search_sqlite(queryset, query)
+    else:
+        return queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query)
+        )
+    return queryset.order_by('-search_rank', '-created_at', '-id')
+
+
+def _search_postgresql(queryset, query):
+    search_query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(query, config=config, search_type='websearch')
+        search_query = part if search_query is None else search_query | part
+
+    return queryset.filter(search_vector=search_query).annotate(
+        # float4 -> float8: значение ранга должно точно совпадать в токене курсора
+        search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    )
+
+
+def _search_sqlite(queryset, query):
+    match = fts_match_expression(query)
+    if not match:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.filter(
+        pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id',
+            (match,),
+        )
+    )
+
+
+def fts_match_expression(query):
+    """
+    Превращает пользовательский ввод в безопасное выражение FTS5:
+    каждое слово берется в кавычки и ищется по префиксу, слова объединяются по AND.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+# --- Установка поискового бэкенда (используется миграциями и post_migrate) ---
+
+POSTGRESQL_INSTALL_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION ads_ad_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.description, '')), 'B') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DROP TRIGGER IF EXISTS ads_ad_search_vector_trigger ON ads_ad
+    """,
+    # UPDATE OF: счетчики и прочие служебные UPDATE не пересчитывают вектор
+    """
+    CREATE TRIGGER ads_ad_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, search_vector ON ads_ad
+    FOR EACH ROW EXECUTE FUNCTION ads_ad_search_vector_update()
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ads_ad_search_vector_gin
+    ON ads_ad USING gin (search_vector)
+    """,
+    """
+    UPDATE ads_ad SET search_vector = NULL
+    """,
+]
+
+POSTGRESQL_UNINSTALL_SQL = [
+    'DROP INDEX IF EXISTS ads_ad_search_vector_gin',
+    'DROP TRIGGER IF EXISTS ads_ad_search_vector_trigger ON ads_ad',
+    'DROP FUNCTION IF EXISTS ads_ad_search_vector_update()',
+]
+
+SQLITE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description,
+        content='ads_ad', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+"""
+
+SQLITE_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ads_ad_fts_ai AFTER INSERT ON ads_ad BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ads_ad_fts_ad AFTER DELETE ON ads_ad BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ads_ad_fts_au AFTER UPDATE OF title, description ON ads_ad BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+SQLITE_REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+
+def install_search_backend(schema_editor):
+    """Создает триггеры и индексы полнотекстового поиска для текущей СУБД"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRESQL_INSTALL_SQL:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_TABLE_SQL)
+        for sql in SQLITE_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+        schema_editor.execute(SQLITE_REBUILD_SQL)
+
+
+def uninstall_search_backend(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRESQL_UNINSTALL_SQL:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for trigger in FTS_TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def ensure_search_backend(connection):
+    """
+    Восстанавливает триггеры FTS5 после миграций.
+
+    SQLite пересоздает таблицу ``ads_ad`` при многих ALTER-операциях,
+    и триггеры, навешанные на старую таблицу, при этом пропадают.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)"
+            % ', '.join(['%s'] * (len(FTS_TRIGGERS) + 1)),
+            (FTS_TABLE, *FTS_TRIGGERS),
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing or existing.issuperset(FTS_TRIGGERS):
+            return
+
+        for sql in SQLITE_TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(SQLITE_REBUILD_SQL)
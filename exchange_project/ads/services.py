@@ -0,0 +1,332 @@
+"""
+Операции над объявлениями и предложениями обмена, которые меняют несколько
+строк сразу.
+
+Принятие предложения выполняется в одной транзакции: объявления-участники
+блокируются ``SELECT ... FOR UPDATE`` (в порядке id, чтобы параллельные
+принятия не взаимоблокировались), после чего один UPDATE принимает
+предложение и отклоняет остальные ожидающие предложения по тому же
+объявлению-получателю и с тем же объявлением-отправителем. UPDATE выполняется
+только если принимаемое предложение все еще ожидает ответа, — иначе
+ProposalConflict. Отклонение конкурентов остается в этом UPDATE: иначе два
+предложения по одному объявлению могли бы быть приняты одновременно.
+
+На SQLite ``select_for_update`` ничего не делает; там запись сериализуется
+блокировкой базы (``transaction_mode: IMMEDIATE`` в OPTIONS).
+
+Удаление объявлений обходит сборщик каскадов Django: предложения и объявления
+удаляются двумя DELETE (прямой SQL, ``_delete_rows``) в одной транзакции,
+строки в Python не загружаются.
+Поэтому сигналы pre/post_delete не отправляются — их работа (сброс кэша
+количеств и карточек) выполняется здесь явно.
+
+Счетчики предложений объявлений (Ad.received_*_count, Ad.sent_count) и сводки
+предложений пользователей (ProposalSummary, ads.inbox) пересчитываются по
+таблице предложений для затронутых объявлений и пользователей
+(``reconcile_counters``, ``inbox.rebuild``). UPDATE увеличивает и версию
+объявления, поэтому карточки в кэше показывают новые значения. Пересчет, а не
+прибавление изменений, не зависит от порядка и повторов: правки в админке и
+команда reconcile_proposal_counters, выполненные до задачи, не учитывают
+событие дважды.
+
+Счетчики, сводки и цепочки обмена (BarterCycle, ads.cycles) обновляются
+в фоновой задаче (ads.tasks.apply_proposal_changes), которая ставится
+в очередь в той же транзакции, что и изменение предложений: запрос ждет
+только UPDATE предложений и INSERT задачи. Задача блокирует строки
+пересчитываемых объявлений и сводок, поэтому из двух параллельных пересчетов
+последний видит изменения обоих. Новое ожидающее предложение ищет
+циклы через себя, предложение, которое перестало ожидать ответа, удаляет
+содержащие его циклы. При удалении предложений цепочки удаляются сразу —
+они ссылаются на удаляемые строки. Так же, задачей, рассылаются уведомления
+участникам (ads.notifications). Открытые страницы участников получают
+новый статус через поток SSE (ads.events) после COMMIT.
+"""
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import counts, cycles, events, fragments, inbox, notifications, taskqueue
+from .models import RECEIVED_COUNTERS, Ad, ExchangeProposal
+
+# Сколько id объявлений подставлять в один DELETE ... WHERE id IN (...)
+DELETE_BATCH_SIZE = 500
+# Сколько объявлений пересчитывать одним UPDATE в reconcile_counters
+RECONCILE_BATCH_SIZE = 1000
+
+
+class ProposalConflict(Exception):
+    """Предложение уже не ожидает ответа (принято, отклонено или удалено)"""
+
+
+def create_proposal(proposal):
+    """Сохраняет новое предложение и увеличивает счетчики объявлений и сводки пользователей"""
+    with transaction.atomic():
+        proposal.save()
+        changes = _Changes()
+        changes.touch(proposal.ad_sender_id, proposal.ad_receiver_id, proposal.user_id, proposal.receiver_user_id)
+        changes.defer(f'proposal-{proposal.pk}-created', created=proposal.pk)
+        notifications.proposal_event({'created': [proposal.pk]}, key=f'proposal-{proposal.pk}-created-notify')
+        events.publish_proposals([(proposal.pk, proposal.status, proposal.user_id, proposal.receiver_user_id)])
+    return proposal
+
+
+def accept_proposal(proposal):
+    """
+    Принимает предложение и отклоняет конкурирующие ожидающие предложения.
+
+    Возвращает число автоматически отклоненных предложений.
+    """
+    with transaction.atomic():
+        list(
+            Ad.objects.select_for_update()
+            .filter(pk__in={proposal.ad_receiver_id, proposal.ad_sender_id})
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+
+        # Ожидающие предложения обоих объявлений блокируются до конца транзакции:
+        # по ним же меняются счетчики объявлений и сводки пользователей
+        pending = {
+            pk: rest for pk, *rest in (
+                ExchangeProposal.objects.select_for_update(of=('self',))
+                .filter(
+                    Q(ad_receiver_id=proposal.ad_receiver_id) | Q(ad_sender_id=proposal.ad_sender_id),
+                    status='P',
+                )
+                .order_by()
+                .values_list('pk', 'ad_sender_id', 'ad_receiver_id', 'user_id', 'receiver_user_id')
+            )
+        }
+        if proposal.pk not in pending:
+            raise ProposalConflict(proposal.pk)
+
+        ExchangeProposal.objects.filter(pk__in=pending).update(
+            status=Case(When(pk=proposal.pk, then=Value('A')), default=Value('R')),
+            updated_at=timezone.now(),
+        )
+
+        changes = _Changes()
+        for participants in pending.values():
+            changes.touch(*participants)
+        changes.defer(f'proposal-{proposal.pk}-accepted', closed=list(pending))
+        # Отправители автоматически отклоненных предложений узнают об этом из уведомлений
+        notifications.proposal_event(
+            {'accepted': [proposal.pk], 'auto_rejected': [pk for pk in pending if pk != proposal.pk]},
+            key=f'proposal-{proposal.pk}-accepted-notify',
+        )
+        events.publish_proposals(
+            (pk, 'A' if pk == proposal.pk else 'R', user_id, receiver_user_id)
+            for pk, (_, _, user_id, receiver_user_id) in pending.items()
+        )
+
+    proposal.status = 'A'
+    return len(pending) - 1
+
+
+def reject_proposal(proposal):
+    """Отклоняет ожидающее предложение"""
+    with transaction.atomic():
+        if not ExchangeProposal.objects.filter(pk=proposal.pk, status='P').update(
+            status='R', updated_at=timezone.now()
+        ):
+            raise ProposalConflict(proposal.pk)
+        changes = _Changes()
+        changes.touch(proposal.ad_sender_id, proposal.ad_receiver_id, proposal.user_id, proposal.receiver_user_id)
+        changes.defer(f'proposal-{proposal.pk}-rejected', closed=[proposal.pk])
+        notifications.proposal_event({'rejected': [proposal.pk]}, key=f'proposal-{proposal.pk}-rejected-notify')
+        events.publish_proposals([(proposal.pk, 'R', proposal.user_id, proposal.receiver_user_id)])
+    proposal.status = 'R'
+
+
+def remove_proposal(proposal):
+    """Удаляет предложение и уменьшает счетчики и сводки; False — уже удалено"""
+    with transaction.atomic():
+        # Статус перечитывается под блокировкой: он мог измениться после загрузки
+        row = (
+            ExchangeProposal.objects.select_for_update(of=('self',)).filter(pk=proposal.pk)
+            .values_list('status', 'receiver_user_id').first()
+        )
+        if row is None:
+            return False
+        status, receiver_user_id = row
+        # Сразу и при любом статусе: цепочки принятого или отклоненного предложения
+        # удаляет задача, которая могла еще не выполниться, а ссылки цепочек
+        # не дают удалить строку предложения
+        cycles.proposals_closed([proposal.pk])
+        # Ссылок на предложение больше нет, каскад не нужен
+        _delete_rows(ExchangeProposal, router.db_for_write(ExchangeProposal), id=[proposal.pk])
+
+        changes = _Changes()
+        changes.touch(proposal.ad_sender_id, proposal.ad_receiver_id, proposal.user_id, receiver_user_id)
+        changes.defer(f'proposal-{proposal.pk}-removed')
+        events.publish_proposals([(proposal.pk, None, proposal.user_id, receiver_user_id)])
+    return True
+
+
+def remove_ad(ad):
+    """
+    Удаляет объявление вместе со всеми предложениями, где оно отправитель
+    или получатель. Возвращает (число объявлений, число предложений).
+    """
+    return _remove([(ad.pk, ad.version)], using=router.db_for_write(Ad, instance=ad))
+
+
+def remove_ads(ads):
+    """
+    Массовое удаление объявлений queryset'а (модерация, удаление аккаунта).
+    Из базы читаются только пары (id, версия) для сброса кэша карточек.
+    """
+    return _remove(list(ads.order_by().values_list('pk', 'version')), using=router.db_for_write(Ad))
+
+
+def remove_user_ads(user):
+    """Удаляет все объявления пользователя; вызывается перед удалением аккаунта (ads.signals)"""
+    return remove_ads(Ad.objects.filter(user=user))
+
+
+def _remove(cards, using):
+    removed_ads = removed_proposals = 0
+    with transaction.atomic(using=using):
+        for start in range(0, len(cards), DELETE_BATCH_SIZE):
+            ids = [pk for pk, _ in cards[start:start + DELETE_BATCH_SIZE]]
+            proposals = ExchangeProposal.objects.using(using).filter(
+                Q(ad_sender_id__in=ids) | Q(ad_receiver_id__in=ids)
+            )
+            # Сводки обоих пользователей и счетчики оставшихся объявлений удаляемых
+            # предложений пересчитываются
+            changes = _Changes()
+            for participants in (
+                proposals.order_by()
+                .values_list('ad_sender_id', 'ad_receiver_id', 'user_id', 'receiver_user_id').distinct()
+            ):
+                changes.touch(*participants)
+
+            # Все удаляемые, а не только ожидающие: см. remove_proposal
+            cycles.proposals_closed(proposals, using)
+            removed_proposals += _delete_rows(ExchangeProposal, using, ad_sender=ids, ad_receiver=ids)
+            removed_ads += _delete_rows(Ad, using, id=ids)
+            changes.defer(using=using)
+
+    if removed_ads:
+        counts.invalidate()
+        fragments.invalidate_many(cards)
+    return removed_ads, removed_proposals
+
+
+def _delete_rows(model, using, **columns):
+    """
+    Один DELETE строк model, у которых значение хотя бы одного из полей columns
+    входит в его список; возвращает число удаленных строк. Без сборщика
+    каскадов и сигналов delete(): ссылки на строки удаляет вызывающий.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for name, values in columns.items():
+        conditions.append(f'{quote(model._meta.get_field(name).column)} IN ({", ".join(["%s"] * len(values))})')
+        params.extend(values)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {" OR ".join(conditions)}', params)
+        return cursor.rowcount
+
+
+class _Changes:
+    """
+    Объявления и пользователи, которых коснулись события предложений; apply()
+    пересчитывает их счетчики и сводки по таблице предложений, defer() — в фоновой задаче
+    """
+
+    def __init__(self):
+        self.ads = set()
+        self.users = set()
+
+    @classmethod
+    def from_payload(cls, ads, users):
+        changes = cls()
+        # Ключи JSON — строки; словари {id: изменения} — задачи, поставленные
+        # до перехода на пересчет, из них нужны только id
+        changes.ads.update(int(pk) for pk in ads)
+        changes.users.update(int(pk) for pk in users)
+        return changes
+
+    def touch(self, sender_ad, receiver_ad, sender, receiver):
+        self.ads.update((sender_ad, receiver_ad))
+        self.users.update(pk for pk in (sender, receiver) if pk is not None)
+
+    def apply(self, using=None):
+        using = using or router.db_for_write(Ad)
+        with transaction.atomic(using=using):
+            # Блокировки до пересчета: параллельная задача с теми же строками ждет
+            # и пересчитывает после COMMIT этой, уже видя ее изменения
+            ads = list(
+                Ad.objects.using(using).select_for_update().filter(pk__in=self.ads)
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            # Блокируются строки пользователей, а не сводок: строки сводки может
+            # не быть. Пользователю, удаленному до задачи, сводка не создается
+            users = list(
+                User.objects.using(using).select_for_update().filter(pk__in=self.users)
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            if ads:
+                reconcile_counters(Ad.objects.using(using).filter(pk__in=ads))
+            if users:
+                inbox.rebuild(users)
+
+    def defer(self, key=None, using=None, created=None, closed=()):
+        """
+        Ставит пересчет и обновление цепочек обмена в очередь
+        (ads.tasks.apply_proposal_changes) в текущей транзакции. created —
+        id нового предложения для поиска цепочек, closed — id предложений,
+        переставших ожидать ответа.
+        """
+        taskqueue.enqueue('ads.apply_proposal_changes', {
+            'ads': sorted(self.ads),
+            'users': sorted(self.users),
+            'using': using,
+            'created': created,
+            'closed': list(closed),
+        }, key=key)
+
+
+def _counter_expressions():
+    def count(field, **filters):
+        proposals = (
+            ExchangeProposal.objects.filter(**{field: OuterRef('pk')}, **filters)
+            .order_by().values(field).annotate(n=Count('pk')).values('n')
+        )
+        return Coalesce(Subquery(proposals), 0)
+
+    expressions = {name: count('ad_receiver', status=status) for status, name in RECEIVED_COUNTERS.items()}
+    expressions['sent_count'] = count('ad_sender')
+    return expressions
+
+
+def reconcile_counters(ads=None, batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    """
+    Пересчитывает счетчики предложений объявлений queryset'а ads (по умолчанию всех)
+    по таблице предложений. Объявления обходятся пачками по id; каждая пачка —
+    один UPDATE, который меняет только строки с расхождением.
+
+    Возвращает число исправленных (при dry_run — найденных) объявлений.
+    """
+    ads = Ad.objects.all() if ads is None else ads
+    expressions = _counter_expressions()
+    drift = Q()
+    for field, expression in expressions.items():
+        drift |= ~Q(**{field: expression})
+
+    fixed = 0
+    last = 0
+    while True:
+        ids = list(ads.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return fixed
+        last = ids[-1]
+        batch = Ad.objects.filter(pk__in=ids).filter(drift)
+        if dry_run:
+            fixed += batch.count()
+        else:
+            fixed += batch.update(version=F('version') + 1, **expressions)
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counts, services, thumbnails
+from .models import Ad, ProposalSummary
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+def invalidate_ad_counts(sender, **kwargs):
+    """Любое изменение объявлений сбрасывает кэш количеств ленты"""
+    counts.invalidate()
+
+
+@receiver(post_save, sender=Ad)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    """Миниатюры изображения объявления готовятся в фоне (ads.thumbnails)"""
+    if instance.image_url and not raw:
+        thumbnails.saved([instance.image_url])
+
+
+@receiver(post_save, sender=User)
+def create_proposal_summary(sender, instance, created, raw=False, **kwargs):
+    """У нового пользователя нет предложений — пустая сводка создается сразу"""
+    if created and not raw:
+        ProposalSummary.objects.bulk_create([ProposalSummary(user=instance)], ignore_conflicts=True)
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_ads(sender, instance, **kwargs):
+    """
+    Объявления удаляемого пользователя удаляются до каскада: services.remove_user_ads
+    пересчитывает счетчики и сводки вторых сторон его предложений, которые
+    каскадное удаление оставило бы устаревшими
+    """
+    services.remove_user_ads(instance)
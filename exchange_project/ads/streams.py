@@ -0,0 +1,146 @@
+"""
+Поток Server-Sent Events с изменениями предложений пользователя
+(``EVENTS_PATH``), обслуживаемый на уровне ASGI, до Django.
+
+Обычное представление Django держало бы на каждый открытый поток отдельный
+поток ОС (контекст sync_to_async запроса) и соединение с базой. Здесь
+соединение проверяется один раз — сессия и пользователь читаются асинхронным
+API (``aget_user``), — после чего поток SSE — это корутина и asyncio.Queue
+подписки (ads.events): тысячи простаивающих клиентов стоят памяти, а не
+потоков и соединений с базой.
+
+Клиент получает события ``proposal`` (JSON ads.events), комментарий-пинг
+раз в ``ADS_EVENTS_HEARTBEAT`` секунд (прокси не закрывают соединение)
+и ``reset``, если пропустил события и должен перечитать страницу.
+
+``router`` оборачивает ASGI-приложение Django (config/asgi.py): направляет
+сюда EVENTS_PATH и обрабатывает lifespan — запуск и остановку брокера.
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.http import HttpRequest
+
+from . import events
+
+EVENTS_PATH = '/proposals/events/'
+# Через сколько миллисекунд браузер переподключается после обрыва
+RETRY_MS = 5000
+
+
+def events_url():
+    """Адрес потока для страницы или '' — поток есть только под ASGI"""
+    return EVENTS_PATH if settings.ADS_ASYNC_VIEWS else ''
+
+
+def heartbeat():
+    return getattr(settings, 'ADS_EVENTS_HEARTBEAT', 15)
+
+
+async def authenticate(scope):
+    """id пользователя по cookie сессии или None"""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = await aget_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+
+async def events_app(scope, receive, send):
+    """ASGI-приложение потока SSE"""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, b'Method Not Allowed')
+        return
+    user_id = await authenticate(scope)
+    if user_id is None:
+        await _respond(send, 403, b'Forbidden')
+        return
+
+    broker = events.broker()
+    subscription = broker.subscribe(user_id)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                # nginx не буферизует ответ
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await _send_body(send, f'retry: {RETRY_MS}\n\n'.encode())
+
+        while not disconnected.done():
+            received = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({received, disconnected}, timeout=heartbeat(), return_when=asyncio.FIRST_COMPLETED)
+            if received not in done:
+                received.cancel()
+                if not disconnected.done():
+                    await _send_body(send, b': ping\n\n')
+                continue
+            if subscription.overflowed:
+                subscription.overflowed = False
+                await _send_body(send, format_event('reset', {}))
+            for event in received.result():
+                await _send_body(send, format_event('proposal', event))
+    except OSError:
+        # Клиент ушел во время отправки
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_body(send, body):
+    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await events.broker().start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await events.broker().stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def router(django_application):
+    """ASGI-приложение: поток SSE и lifespan здесь, остальное — Django"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            await events_app(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+    return application
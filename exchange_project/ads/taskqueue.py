@@ -0,0 +1,176 @@
+"""
+Очередь фоновых задач в базе данных (таблица ads_task); обработчики — ads.tasks.
+
+Задача — имя обработчика, зарегистрированного декоратором ``@task``, и его
+аргументы в JSON. ``enqueue`` — один INSERT в текущей транзакции: задача
+появляется вместе с изменением, которое ее породило, и пропадает при откате.
+Ключ идемпотентности (``key``) уникален: повторная постановка с тем же ключом
+ничего не делает (ON CONFLICT DO NOTHING).
+
+Воркеры (команда run_task_worker, несколько процессов) забирают задачи
+условным UPDATE ``status='Q' → 'R'`` — задачу получает один процесс и на
+PostgreSQL, и на SQLite. Обработчик выполняется в транзакции вместе с
+отметкой о выполнении, поэтому его изменения в базе применяются ровно один
+раз. Ошибка откатывает изменения обработчика; задача повторяется с
+экспоненциальной задержкой до ``max_attempts`` раз, затем помечается 'F'.
+Обработчик с ``atomic=False`` выполняется вне общей транзакции и сам
+фиксирует свои части (рассылка писем: отправленное не откатить) — при
+повторе он должен пропускать уже сделанное.
+Задачи, зависшие в 'R' дольше ``ADS_TASKS_LOCK_TIMEOUT`` (воркер упал),
+снова становятся доступны. Отсчет идет от начала выполнения задачи, а не от
+забора пачки: ``run`` обновляет ``locked_at``. Отметка о выполнении — условный
+UPDATE по ``locked_at``: если задачу тем временем забрал другой воркер,
+изменения обработчика откатываются (LockLost) и задача остается за ним.
+
+При ``ADS_TASKS_EAGER`` (config.test_settings) задачи выполняются сразу
+при постановке, без записи в таблицу.
+"""
+import contextvars
+import logging
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger('ads.tasks')
+
+# Задержка перед повтором: RETRY_DELAY * 2 ** (попытка - 1), не больше MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(seconds=10)
+MAX_RETRY_DELAY = timedelta(hours=1)
+# Сколько задач воркер забирает за один проход
+CLAIM_BATCH_SIZE = 20
+
+_handlers = {}
+
+
+class LockLost(Exception):
+    """Блокировка задачи истекла, и ее забрал другой воркер"""
+
+
+_eager = contextvars.ContextVar('ads_task_eager', default=False)
+
+
+def task(name, max_attempts=5, atomic=True):
+    """
+    Регистрирует обработчик задачи name; обработчик получает payload как
+    именованные аргументы. atomic=False — без общей транзакции задачи.
+    """
+    def register(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        func.atomic = atomic
+        _handlers[name] = func
+        return func
+    return register
+
+
+def handler(name):
+    try:
+        return _handlers[name]
+    except KeyError:
+        raise LookupError(f'Неизвестная задача: {name}') from None
+
+
+def is_eager():
+    return getattr(settings, 'ADS_TASKS_EAGER', False)
+
+
+def running_eager():
+    """Выполняется ли сейчас задача в eager-режиме (вне очереди, внутри запроса)"""
+    return _eager.get()
+
+
+def enqueue(name, payload=None, key=None, delay=None):
+    """
+    Ставит задачу в очередь (в eager-режиме — выполняет). Задача с уже
+    существующим ключом не ставится повторно.
+    """
+    payload = payload or {}
+    func = handler(name)
+    if is_eager():
+        token = _eager.set(True)
+        try:
+            func(**payload)
+        finally:
+            _eager.reset(token)
+        return
+    Task.objects.bulk_create(
+        [Task(
+            name=name, payload=payload, key=key, max_attempts=func.max_attempts,
+            run_at=timezone.now() + (delay or timedelta()),
+        )],
+        ignore_conflicts=key is not None,
+    )
+
+
+def claim(limit=CLAIM_BATCH_SIZE):
+    """Забирает до limit готовых задач; возвращает их, уже в статусе 'R'"""
+    now = timezone.now()
+    timeout = timedelta(seconds=getattr(settings, 'ADS_TASKS_LOCK_TIMEOUT', 600))
+    Task.objects.filter(status='R', locked_at__lt=now - timeout).update(status='Q')
+
+    candidates = list(
+        Task.objects.filter(status='Q', run_at__lte=now).order_by('run_at', 'id').values_list('pk', flat=True)[:limit]
+    )
+    claimed = []
+    for pk in candidates:
+        # Параллельный воркер мог забрать задачу между SELECT и UPDATE
+        if Task.objects.filter(pk=pk, status='Q').update(status='R', locked_at=now, attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at', 'id'))
+
+
+def run(task):
+    """Выполняет забранную задачу; True — успешно"""
+    # Задачи пачки ждут предыдущих: блокировка отсчитывается от начала выполнения
+    started = timezone.now()
+    if not Task.objects.filter(pk=task.pk, status='R', locked_at=task.locked_at).update(locked_at=started):
+        logger.warning('Задача %s (%s) уже забрана другим воркером', task.pk, task.name)
+        return False
+    task.locked_at = started
+    mine = Task.objects.filter(pk=task.pk, status='R', locked_at=started)
+    try:
+        func = handler(task.name)
+        with transaction.atomic() if func.atomic else nullcontext():
+            func(**task.payload)
+            if not mine.update(status='D', locked_at=None, last_error='', updated_at=timezone.now()):
+                raise LockLost(task.pk)
+        return True
+    except LockLost:
+        logger.warning('Задача %s (%s) выполнялась дольше блокировки и забрана другим воркером', task.pk, task.name)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            update = {'status': 'F'}
+            logger.error('Задача %s (%s) не выполнена за %s попыток', task.pk, task.name, task.attempts)
+        else:
+            delay = min(RETRY_DELAY * 2 ** (task.attempts - 1), MAX_RETRY_DELAY)
+            update = {'status': 'Q', 'run_at': timezone.now() + delay}
+            logger.warning('Задача %s (%s) будет повторена через %s', task.pk, task.name, delay)
+        mine.update(locked_at=None, last_error=error, updated_at=timezone.now(), **update)
+        return False
+
+
+def run_pending(limit=CLAIM_BATCH_SIZE):
+    """Один проход воркера; возвращает (выполнено, с ошибкой)"""
+    done = failed = 0
+    for task in claim(limit):
+        if run(task):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def purge(older_than):
+    """Удаляет выполненные задачи старше older_than (timedelta); возвращает их число"""
+    deleted, _ = Task.objects.filter(status='D', updated_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
@@ -0,0 +1,45 @@
+"""
+Обработчики фоновых задач (ads.taskqueue). Модуль импортируется при запуске
+приложения (AdsConfig.ready), чтобы задачи были зарегистрированы и в веб-процессах,
+и в воркерах.
+"""
+from . import cycles, notifications, thumbnails
+from .models import ExchangeProposal
+from .taskqueue import task
+
+
+@task('ads.apply_proposal_changes')
+def apply_proposal_changes(ads, users, using=None, created=None, closed=(), removed_ads=()):
+    """
+    Пересчет счетчиков объявлений и сводок пользователей и цепочки обмена после
+    событий предложений. removed_ads — из задач, поставленных до перехода на
+    пересчет: удаленные объявления и так не пересчитываются.
+    """
+    from .services import _Changes
+
+    _Changes.from_payload(ads, users).apply(using)
+    if closed:
+        cycles.proposals_closed(closed)
+    if created is not None:
+        # Предложение могли принять, отклонить или удалить, пока задача ждала в очереди
+        proposal = ExchangeProposal.objects.filter(pk=created, status='P').first()
+        if proposal is not None:
+            cycles.proposal_created(proposal)
+
+
+@task('ads.notify_proposals')
+def notify_proposals(events):
+    """Уведомления получателям событий {вид: [id предложений]}"""
+    notifications.create(events)
+
+
+@task('ads.send_notification_digests', atomic=False)
+def send_notification_digests():
+    """Письма-дайджесты с не отправленными уведомлениями"""
+    notifications.send_digests()
+
+
+@task('ads.make_thumbnails')
+def make_thumbnails(urls):
+    """Миниатюры изображений объявлений"""
+    thumbnails.make(urls)
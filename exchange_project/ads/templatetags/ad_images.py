@@ -0,0 +1,14 @@
+from django import template
+
+from ads import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(url, size):
+    """
+    Адреса миниатюры изображения: {% thumbnail ad.image_url 'card' as thumb %}
+    дает thumb.webp и thumb.jpg или None, если изображения нет
+    """
+    return thumbnails.thumbnail_urls(url, size)
@@ -0,0 +1,263 @@
+"""
+Миниатюры изображений объявлений (Ad.image_url).
+
+Изображение загружается один раз — фоновой задачей ``ads.make_thumbnails``,
+которую ставит сохранение объявления (ads.signals) и импорт, — и уменьшается
+до размеров ``ADS_THUMBNAIL_SIZES`` в WebP и JPEG. Варианты хранятся в
+хранилище Django ``ADS_THUMBNAIL_STORAGE`` (по умолчанию файлы на диске,
+settings.STORAGES) под ключом — хэшем адреса изображения, поэтому
+объявления с одним адресом делят миниатюры, а новый адрес — новые URL.
+
+Адрес варианта (``thumbnail_urls``) вычисляется без запросов к базе.
+Представление ads.views.thumbnail отдает готовый вариант с заголовком
+``Cache-Control: immutable`` на год; пока варианта нет — заглушку SVG,
+которую браузер не кэширует.
+
+Постановку задач при сохранении выключает ``ADS_THUMBNAIL_ON_SAVE = False``
+(config.test_settings: иначе фикстуры загружали бы изображения из сети).
+
+Загрузка ограничена схемами http/https, размером ``ADS_THUMBNAIL_MAX_BYTES``
+и таймаутом ``ADS_THUMBNAIL_TIMEOUT``. Адреса локальной сети отклоняются, если
+не включен ``ADS_THUMBNAIL_ALLOW_PRIVATE``: имя хоста разрешается один раз при
+соединении, и соединение открывается с проверенным адресом — повторное
+разрешение (DNS rebinding) не может подменить его. Так же проверяется каждое
+перенаправление; прокси из окружения не используются.
+"""
+import hashlib
+import http.client
+import ipaddress
+import logging
+import socket
+import ssl
+from io import BytesIO
+from urllib.parse import urlsplit
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, Request, build_opener
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from . import taskqueue
+
+logger = logging.getLogger('ads.thumbnails')
+
+# Форматы вариантов: расширение файла → (формат Pillow, content-type, параметры сохранения)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+DEFAULT_SIZES = {
+    # Карточка ленты: обрезка до 400×200
+    'card': (400, 200, True),
+    # Страница объявления: вписать в 800×800 без обрезки
+    'detail': (800, 800, False),
+}
+USER_AGENT = 'BarterSystem-Thumbnailer/1.0'
+# Сколько адресов обрабатывать одной задачей (make_thumbnails)
+SCHEDULE_BATCH_SIZE = 100
+
+
+class ThumbnailError(Exception):
+    """Изображение нельзя обработать: повтор задачи не поможет"""
+
+
+def sizes():
+    return getattr(settings, 'ADS_THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def storage():
+    return storages[getattr(settings, 'ADS_THUMBNAIL_STORAGE', 'thumbnails')]
+
+
+def source_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:40]
+
+
+def variant_name(key, size, ext):
+    """Имя файла варианта в хранилище"""
+    return f'{key[:2]}/{key}/{size}.{ext}'
+
+
+def parse_variant(key, variant):
+    """(размер, расширение) из 'card.webp' или None, если такого варианта нет"""
+    size, _, ext = variant.partition('.')
+    if len(key) != 40 or any(char not in '0123456789abcdef' for char in key):
+        return None
+    if size not in sizes() or ext not in FORMATS:
+        return None
+    return size, ext
+
+
+def thumbnail_urls(url, size):
+    """{'webp': адрес, 'jpg': адрес} варианта изображения url или None без изображения"""
+    if not url:
+        return None
+    key = source_key(url)
+    return {ext: reverse('thumbnail', kwargs={'key': key, 'variant': f'{size}.{ext}'}) for ext in FORMATS}
+
+
+def is_ready(url):
+    key = source_key(url)
+    return all(storage().exists(variant_name(key, size, ext)) for size in sizes() for ext in FORMATS)
+
+
+def saved(urls):
+    """Изображения сохраненных объявлений (ads.signals, импорт): ставит задачи, если включено"""
+    if getattr(settings, 'ADS_THUMBNAIL_ON_SAVE', True):
+        schedule(urls)
+
+
+def schedule(urls):
+    """
+    Ставит задачи обработки изображений urls: одна задача на пачку адресов.
+    Вызывается в транзакции сохранения объявлений.
+    """
+    urls = sorted({url for url in urls if url})
+    for start in range(0, len(urls), SCHEDULE_BATCH_SIZE):
+        batch = urls[start:start + SCHEDULE_BATCH_SIZE]
+        # Одиночный адрес — с ключом: повторные сохранения объявления не ставят задачу снова
+        key = f'thumbnails-{source_key(batch[0])}' if len(batch) == 1 else None
+        taskqueue.enqueue('ads.make_thumbnails', {'urls': batch}, key=key)
+
+
+def placeholder(size):
+    """Заглушка SVG размера варианта"""
+    width, height, _ = sizes()[size]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="#f8f9fa"/></svg>'
+    ).encode()
+
+
+def _check_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ThumbnailError(f'Неподдерживаемый адрес: {url}')
+
+
+def _connect(host, port, timeout):
+    """
+    Соединение с host: адреса разрешаются один раз, проверяются и используются
+    для соединения — второго разрешения имени, которое могло бы вернуть другой
+    адрес, нет
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as error:
+        raise ThumbnailError(f'Хост не найден: {host}') from error
+    if not getattr(settings, 'ADS_THUMBNAIL_ALLOW_PRIVATE', False):
+        for *_, sockaddr in addresses:
+            if not ipaddress.ip_address(sockaddr[0]).is_global:
+                raise ThumbnailError(f'Адрес локальной сети: {host}')
+    error = None
+    for family, kind, proto, _, sockaddr in addresses:
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            sock.close()
+            error = exc
+    raise error
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        self.sock = _connect(self.host, self.port, self.timeout)
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        sock = _connect(self.host, self.port, self.timeout)
+        # Сертификат проверяется для имени хоста, а не для адреса
+        self.sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+
+
+class _CheckedHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _CheckedHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req)
+
+
+class _CheckedRedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch(url):
+    """Загружает изображение; ThumbnailError — адрес недопустим или ответ слишком велик"""
+    _check_url(url)
+    limit = getattr(settings, 'ADS_THUMBNAIL_MAX_BYTES', 10 * 1024 * 1024)
+    opener = build_opener(
+        ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler, _CheckedRedirectHandler,
+    )
+    request = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': 'image/*'})
+    with opener.open(request, timeout=getattr(settings, 'ADS_THUMBNAIL_TIMEOUT', 10)) as response:
+        data = response.read(limit + 1)
+    if len(data) > limit:
+        raise ThumbnailError(f'Изображение больше {limit} байт: {url}')
+    return data
+
+
+def render(data):
+    """{(размер, расширение): байты} вариантов изображения data"""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError) as error:
+        raise ThumbnailError(f'Не удалось прочитать изображение: {error}') from error
+
+    variants = {}
+    for size, (width, height, crop) in sizes().items():
+        if crop:
+            variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            variant = image.copy()
+            variant.thumbnail((width, height), Image.LANCZOS)
+        for ext, (fmt, _, options) in FORMATS.items():
+            buffer = BytesIO()
+            variant.save(buffer, format=fmt, **options)
+            variants[size, ext] = buffer.getvalue()
+    return variants
+
+
+def generate(url):
+    """Загружает изображение url и сохраняет все его варианты"""
+    key = source_key(url)
+    target = storage()
+    for (size, ext), content in render(fetch(url)).items():
+        name = variant_name(key, size, ext)
+        if target.exists(name):
+            target.delete(name)
+        target.save(name, ContentFile(content))
+
+
+def make(urls):
+    """
+    Обрабатывает адреса, у которых еще нет миниатюр. Недопустимые изображения
+    пропускаются; сетевые ошибки — после обработки остальных адресов — повторяют
+    задачу (готовые адреса при повторе пропускаются).
+    """
+    made = 0
+    retry = []
+    for url in urls:
+        if is_ready(url):
+            continue
+        try:
+            generate(url)
+            made += 1
+        except ThumbnailError as error:
+            logger.warning('Миниатюры %s не созданы: %s', url, error)
+        except OSError as error:
+            retry.append((url, error))
+    if retry:
+        raise OSError(f'Не загружено изображений: {len(retry)}, первое: {retry[0][0]}: {retry[0][1]}')
+    return made
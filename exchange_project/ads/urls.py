@@ -1,20 +1,37 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
+from .decorators import query_budget
 from .views import SignUpView
 
+# Под ASGI страницы для чтения обслуживаются асинхронными представлениями
+read_views = async_views if getattr(settings, 'ADS_ASYNC_VIEWS', False) else views
+
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('search/', views.index, name='search'),  # Альтернативный URL для поиска
+    path('', read_views.index, name='index'),
+    path('search/', read_views.index, name='search'),  # Альтернативный URL для поиска
     # динамический параметр, который принимает целое число
-    path('ad/<int:pk>/', views.ad_detail, name='ad_detail'),
+    path('ad/<int:pk>/', read_views.ad_detail, name='ad_detail'),
     path('ad/<int:pk>/edit/', views.edit_ad, name='edit_ad'),
     path('ad/<int:pk>/delete/', views.delete_ad, name='delete_ad'),
     path('create_ad/', views.create_ad, name='create_ad'),
-    path('signup/', SignUpView.as_view(), name='signup'),
+    path('import/', views.import_ads, name='import_ads'),
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
+    path('ops/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('ops/metrics/', views.prometheus_metrics, name='prometheus_metrics'),
+    path('thumbnails/<str:key>/<str:variant>', views.thumbnail, name='thumbnail'),
+    path('signup/', query_budget(6)(SignUpView.as_view()), name='signup'),
     
     # Предложения обмена
-    path('proposals/', views.my_proposals, name='my_proposals'),
-    path('proposal/<int:pk>/', views.proposal_detail, name='proposal_detail'),
+    path('proposals/', read_views.my_proposals, name='my_proposals'),
+    path('proposal/<int:pk>/', read_views.proposal_detail, name='proposal_detail'),
     path('proposal/<int:pk>/update/', views.update_proposal_status, name='update_proposal_status'),
     path('proposal/<int:pk>/delete/', views.delete_proposal, name='delete_proposal'),
+    path('proposals/cycles/', views.barter_cycles, name='barter_cycles'),
+    path('notifications/', views.notification_list, name='notifications'),
+
+    # JSON API только для чтения
+    path('api/v1/ads/', api.ad_list, name='api_ad_list'),
+    path('api/v1/ads/<int:pk>/', api.ad_detail, name='api_ad_detail'),
+    path('api/v1/proposals/', api.proposal_list, name='api_proposal_list'),
 ]
\ No newline at end of file
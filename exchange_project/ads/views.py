@@ -1,15 +1,22 @@
+import io
+
 from django.shortcuts import render, get_object_or_404, redirect
 from .models import Ad, ExchangeProposal
-from .forms import AdForm, ProposalForm
+from .forms import AdForm, AdImportForm, ProposalForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.views import generic
 from django.urls import reverse_lazy
-from django.http import Http404
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from .decorators import ad_author_required
-from django.db.models import Q
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from .decorators import ad_author_required, proposal_role_required, query_budget
+from .pagination import paginate, page_total
+from .counts import count_ads
+from . import cycles, dbpool, exporter, fragments, importer, inbox, metrics, notifications, services, streams, thumbnails
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
 
 class SignUpView(generic.CreateView):
     form_class = UserCreationForm
@@ -17,6 +24,7 @@ class SignUpView(generic.CreateView):
     template_name = 'ads/signup.html'
 
 @login_required
+@query_budget(7, max_time_ms=250)
 def index(request):
     """
     Главная страница с поиском, фильтрацией и пагинацией объявлений
@@ -26,46 +34,25 @@ def index(request):
     category_filter = request.GET.get('category', '')
     condition_filter = request.GET.get('condition', '')
     
-    # Начинаем с базового QuerySet
-    ads = Ad.objects.all().order_by('-created_at')
-    
-    # Применяем поиск по ключевым словам
-    if search_query:
-        ads = ads.filter(
-            Q(title__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
+    # Поиск с ранжированием и фильтры по категории/состоянию
+    ads = Ad.objects.feed(search_query, category_filter, condition_filter)
     
-    # Применяем фильтр по категории
-    if category_filter:
-        ads = ads.filter(category=category_filter)
+    # Количество берется из кэша (или оценки планировщика), а не COUNT(*) на каждый запрос
+    total_results = count_ads(search_query, category_filter, condition_filter)
     
-    # Применяем фильтр по состоянию
-    if condition_filter:
-        ads = ads.filter(condition=condition_filter)
-    
-    # Пагинация
-    paginator = Paginator(ads, 10)  # 10 объявлений на страницу
-    page = request.GET.get('page')
-    
-    try:
-        ads_page = paginator.page(page)
-    except PageNotAnInteger:
-        # Если страница не является числом, показываем первую страницу
-        ads_page = paginator.page(1)
-    except EmptyPage:
-        # Если страница больше максимальной, показываем последнюю страницу
-        ads_page = paginator.page(paginator.num_pages)
+    # Пагинация: курсорная по умолчанию, по номерам страниц — если передан ?page=
+    ads_page = paginate(request, ads, 10, count=lambda: total_results)  # 10 объявлений на страницу
     
     # Подготавливаем контекст для фильтров
     context = {
         'ads': ads_page,
+        'ad_cards': fragments.render_cards(ads_page),
         'search_query': search_query,
         'category_filter': category_filter,
         'condition_filter': condition_filter,
         'categories': Ad.CATEGORIES,
         'conditions': Ad.CONDITIONS,
-        'total_results': ads.count(),
+        'total_results': total_results,
         'has_filters': bool(search_query or category_filter or condition_filter)
     }
     
@@ -74,9 +61,10 @@ def index(request):
 
 # В views.py - исправляем логику
 @login_required
+@query_budget(14, max_time_ms=250)
 def ad_detail(request, pk):
-    ad = get_object_or_404(Ad, pk=pk)
-    is_author = ad.user == request.user
+    ad = get_object_or_404(Ad.objects.select_related('user').defer('search_vector'), pk=pk)
+    is_author = ad.user_id == request.user.pk
 
     if request.method == 'POST':
         if is_author:
@@ -89,7 +77,7 @@ def ad_detail(request, pk):
             proposal.ad_receiver = ad  # Объявление, на которое хотят обменять
             proposal.ad_sender = form.cleaned_data['ad_sender']  # Объявление пользователя
             proposal.user = request.user
-            proposal.save()
+            services.create_proposal(proposal)
             messages.success(request, "Предложение обмена отправлено!")
             return redirect('ad_detail', pk=pk)
     else:
@@ -105,6 +93,7 @@ def ad_detail(request, pk):
     })
 
 @login_required
+@query_budget(6)
 def create_ad(request):
     if request.method == 'POST':
         form = AdForm(request.POST)
@@ -117,17 +106,140 @@ def create_ad(request):
         form = AdForm()
     return render(request, 'ads/create_ad.html', {'form': form})
 
+@staff_member_required
+@query_budget(4)
+def export_data(request, dataset):
+    """
+    Потоковая выгрузка объявлений или предложений обмена (только для персонала).
+    Параметры: format (csv/jsonl), since и field для инкрементальной выгрузки.
+    """
+    if dataset not in exporter.DATASETS:
+        raise Http404("Неизвестный набор данных.")
+    fmt = request.GET.get('format', 'jsonl')
+    field = request.GET.get('field', 'updated_at')
+    if fmt not in exporter.FORMATS or field not in exporter.WATERMARK_FIELDS:
+        return HttpResponseBadRequest("Неизвестный формат или поле отметки.")
+    try:
+        since = exporter.parse_watermark(request.GET.get('since'))
+    except exporter.InvalidWatermark:
+        return HttpResponseBadRequest("Некорректное значение since.")
+
+    # Строки читаются серверным курсором уже во время отдачи ответа
+    response = StreamingHttpResponse(
+        exporter.Exporter(dataset, fmt, since, field),
+        content_type=exporter.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+@staff_member_required
+@query_budget(2)
+def db_pool_stats(request):
+    """
+    Статистика пула соединений этого процесса (только для персонала).
+    Параметр reset=1 обнуляет счетчики после чтения.
+    """
+    return JsonResponse({
+        'pool': dbpool.pool_stats(reset=request.GET.get('reset') == '1'),
+        'options': dbpool.pool_options(),
+    })
+
+@staff_member_required
+@query_budget(2)
+def prometheus_metrics(request):
+    """Метрики запросов этого процесса в текстовом формате Prometheus (только для персонала)"""
+    return HttpResponse(metrics.registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@query_budget(0)
+def thumbnail(request, key, variant):
+    """
+    Миниатюра изображения объявления из хранилища (ads.thumbnails); пока она
+    не готова — заглушка, которую браузер не кэширует
+    """
+    parsed = thumbnails.parse_variant(key, variant)
+    if parsed is None:
+        raise Http404("Неизвестная миниатюра.")
+    size, ext = parsed
+    storage = thumbnails.storage()
+    name = thumbnails.variant_name(key, size, ext)
+    if not storage.exists(name):
+        response = HttpResponse(thumbnails.placeholder(size), content_type='image/svg+xml')
+        response['Cache-Control'] = 'no-cache'
+        return response
+    # Адрес варианта зависит от адреса изображения, поэтому содержимое по нему не меняется
+    response = FileResponse(storage.open(name), content_type=thumbnails.FORMATS[ext][1])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def _read_upload(upload, read):
+    """read(текстовый поток) над загруженным файлом с начала; файл остается открытым"""
+    upload.file.seek(0)
+    # Файл читается потоком: большие загрузки Django хранит во временном файле
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        return read(stream)
+    finally:
+        stream.detach()
+
+
+# Файл не длиннее ADS_IMPORT_MAX_ROWS (5000 строк): на PostgreSQL 5 пачек по одному INSERT,
+# на SQLite bulk_create делит пачку по лимиту параметров — около 75 INSERT;
+# большие файлы загружаются командой import_ads
+@login_required
+@query_budget(100)
+def import_ads(request):
+    """
+    Массовый импорт объявлений из файла CSV или JSONL. Файл проверяется
+    целиком до записи (кодировка, число строк); если импорт прерван ошибкой
+    базы данных, страница показывает, сколько объявлений уже сохранено.
+    """
+    result = None
+    if request.method == 'POST':
+        form = AdImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            max_rows = getattr(settings, 'ADS_IMPORT_MAX_ROWS', 5000)
+            progress = []
+            try:
+                fmt = importer.detect_format(upload.name, form.cleaned_data['format'])
+                rows = _read_upload(upload, lambda stream: importer.count_rows(stream, fmt))
+                if rows > max_rows:
+                    form.add_error('file', f"В файле {rows} строк, через сайт можно загрузить не больше {max_rows}.")
+                else:
+                    result = _read_upload(
+                        upload, lambda stream: importer.import_ads(stream, fmt, request.user, progress=progress.append),
+                    )
+            except importer.InvalidImportFormat:
+                form.add_error('format', "Не удалось определить формат файла, выберите его явно.")
+            except UnicodeDecodeError:
+                form.add_error('file', "Файл должен быть в кодировке UTF-8.")
+            except DatabaseError:
+                # Пачки, записанные до ошибки, уже зафиксированы
+                result = progress[-1] if progress else None
+                form.add_error(None, "Импорт прерван ошибкой базы данных. Объявления из итогов ниже уже сохранены.")
+
+            if result is not None and result.created:
+                messages.success(request, f"Импортировано объявлений: {result.created}.")
+    else:
+        form = AdImportForm()
+
+    return render(request, 'ads/import_ads.html', {'form': form, 'result': result})
+
 @login_required
+@query_budget(9)
 @ad_author_required
 def edit_ad(request, pk):
     """
     Редактирование объявления с проверкой прав через декоратор
     """
-    ad = Ad.objects.get(pk=pk)  # Уже проверено в декораторе
+    ad = request.ad  # Загружено и проверено в декораторе
     if request.method == 'POST':
         form = AdForm(request.POST, instance=ad)
         if form.is_valid():
-            form.save()
+            ad = form.save(commit=False)
+            # Новая версия — новый ключ карточки в кэше фрагментов
+            ad.version = F('version') + 1
+            ad.save()
             messages.success(request, "Объявление успешно обновлено!")
             return redirect('ad_detail', pk=pk)
         else:
@@ -138,30 +250,27 @@ def edit_ad(request, pk):
     return render(request, 'ads/edit_ad.html', {'form': form, 'ad': ad})
 
 @login_required
+@query_budget(13)
 @ad_author_required
 def delete_ad(request, pk):
     """
     Удаление объявления с проверкой прав через декоратор
     """
     try:
-        ad = Ad.objects.get(pk=pk)
+        ad = request.ad  # Загружено и проверено в декораторе
         ad_title = ad.title  # Сохраняем название для сообщения
         
         if request.method == 'POST':
-            # Подтверждение удаления
-            # Удаляем связанные предложения обмена
-            ExchangeProposal.objects.filter(ad_sender=ad).delete()
-            ExchangeProposal.objects.filter(ad_receiver=ad).delete()
-            
-            # Удаляем само объявление
-            ad.delete()
+            # Подтверждение удаления: объявление, его предложения обмена
+            # и закэшированная карточка удаляются одной транзакцией
+            services.remove_ad(ad)
             messages.success(request, f"Объявление '{ad_title}' и все связанные предложения обмена успешно удалены!")
             return redirect('index')
         else:
             # Показываем страницу подтверждения
-            # Подсчитываем количество связанных предложений
-            sent_proposals_count = ExchangeProposal.objects.filter(ad_sender=ad).count()
-            received_proposals_count = ExchangeProposal.objects.filter(ad_receiver=ad).count()
+            # Количество связанных предложений — из счетчиков объявления
+            sent_proposals_count = ad.sent_count
+            received_proposals_count = ad.received_count
             total_proposals = sent_proposals_count + received_proposals_count
             
             return render(request, 'ads/delete_ad.html', {
@@ -171,14 +280,12 @@ def delete_ad(request, pk):
                 'received_proposals_count': received_proposals_count
             })
             
-    except Ad.DoesNotExist:
-        messages.error(request, "Объявление не найдено.")
-        return redirect('index')
     except Exception as e:
         messages.error(request, f"Произошла ошибка при удалении объявления: {str(e)}")
         return redirect('ad_detail', pk=pk)
 
 @login_required
+@query_budget(7, max_time_ms=250)
 def my_proposals(request):
     """
     Просмотр предложений обмена пользователя
@@ -188,33 +295,23 @@ def my_proposals(request):
     proposal_type = request.GET.get('type', '')  # sent или received
     
     # Базовый QuerySet
+    proposals = ExchangeProposal.objects.for_user(request.user, proposal_type).for_listing()
     if proposal_type == 'sent':
-        proposals = ExchangeProposal.objects.filter(user=request.user)
         title = "Мои отправленные предложения"
     elif proposal_type == 'received':
-        proposals = ExchangeProposal.objects.filter(ad_receiver__user=request.user)
         title = "Полученные предложения"
     else:
-        # Показываем все предложения пользователя
-        proposals = ExchangeProposal.objects.filter(
-            Q(user=request.user) | Q(ad_receiver__user=request.user)
-        )
         title = "Все предложения обмена"
     
     # Фильтрация по статусу
     if status_filter:
         proposals = proposals.filter(status=status_filter)
     
-    # Пагинация
-    paginator = Paginator(proposals, 10)
-    page = request.GET.get('page')
-    
-    try:
-        proposals_page = paginator.page(page)
-    except PageNotAnInteger:
-        proposals_page = paginator.page(1)
-    except EmptyPage:
-        proposals_page = paginator.page(paginator.num_pages)
+    # Пагинация; общее число берется из сводки пользователя, без COUNT по OR-условию
+    proposals_page = paginate(
+        request, proposals, 10,
+        count=lambda: inbox.count(inbox.get_summary(request.user.pk), proposal_type, status_filter),
+    )
     
     context = {
         'proposals': proposals_page,
@@ -222,85 +319,101 @@ def my_proposals(request):
         'status_filter': status_filter,
         'proposal_type': proposal_type,
         'status_choices': ExchangeProposal.STATUS_CHOICES,
-        'total_proposals': proposals.count(),
+        'total_proposals': page_total(proposals_page),
+        'events_url': streams.events_url(),
     }
     
     return render(request, 'ads/my_proposals.html', context)
 
 @login_required
+@query_budget(5, max_time_ms=250)
+def notification_list(request):
+    """
+    Последние уведомления о предложениях; показанные отмечаются прочитанными
+    """
+    items = list(notifications.for_user(request.user))
+    notifications.mark_read(request.user, items)
+
+    return render(request, 'ads/notifications.html', {'notifications': items})
+
+@login_required
+@query_budget(5, max_time_ms=250)
+def barter_cycles(request):
+    """
+    Цепочки обмена с участием пользователя: каждый участник отдает свое
+    объявление следующему и получает объявление предыдущего
+    """
+    chains = []
+    for cycle in cycles.for_user(request.user)[:cycles.SHOWN_LIMIT]:
+        # Предложения по порядку цепочки, начиная с наименьшего объявления
+        by_sender = {proposal.ad_sender_id: proposal for proposal in cycle.proposals.all()}
+        chains.append((cycle, [by_sender[pk] for pk in cycle.ad_ids if pk in by_sender]))
+
+    return render(request, 'ads/barter_cycles.html', {'chains': chains})
+
+@login_required
+@query_budget(7, max_time_ms=250)
+@proposal_role_required(
+    'participant', "У вас нет прав для просмотра этого предложения.", redirect_to='my_proposals',
+    queryset=ExchangeProposal.objects.for_listing(with_text=True),
+)
 def proposal_detail(request, pk):
     """
     Детальный просмотр предложения обмена
     """
-    proposal = get_object_or_404(ExchangeProposal, pk=pk)
-    
-    # Проверяем права доступа
-    if proposal.user != request.user and proposal.ad_receiver.user != request.user:
-        messages.error(request, "У вас нет прав для просмотра этого предложения.")
-        return redirect('my_proposals')
+    proposal = request.proposal  # Загружено и проверено в декораторе
     
     context = {
         'proposal': proposal,
-        'is_sender': proposal.user == request.user,
-        'is_receiver': proposal.ad_receiver.user == request.user,
+        'is_sender': proposal.user_id == request.user.pk,
+        'is_receiver': proposal.receiver_user_id == request.user.pk,
     }
     
     return render(request, 'ads/proposal_detail.html', context)
 
 @login_required
+@query_budget(13)
+@proposal_role_required('receiver', "У вас нет прав для изменения статуса этого предложения.")
 def update_proposal_status(request, pk):
     """
     Обновление статуса предложения обмена
     """
-    proposal = get_object_or_404(ExchangeProposal, pk=pk)
-    
-    # Проверяем права доступа (только получатель может изменять статус)
-    if proposal.ad_receiver.user != request.user:
-        messages.error(request, "У вас нет прав для изменения статуса этого предложения.")
-        return redirect('proposal_detail', pk=pk)
+    proposal = request.proposal  # Только получатель, проверено в декораторе
     
     if request.method == 'POST':
         new_status = request.POST.get('status')
-        if new_status in ['A', 'R']:  # Accepted или Rejected
-            old_status = proposal.status
-            proposal.status = new_status
-            proposal.save()
-            
-            status_names = {
-                'A': 'принято',
-                'R': 'отклонено'
-            }
-            
-            messages.success(request, f"Предложение обмена {status_names[new_status]}!")
-            
-            # Если предложение принято, можно автоматически обновить статусы других предложений
+        try:
             if new_status == 'A':
-                # Отклоняем все остальные предложения для этого объявления
-                ExchangeProposal.objects.filter(
-                    ad_receiver=proposal.ad_receiver,
-                    status='P'
-                ).exclude(pk=proposal.pk).update(status='R')
-                
-                messages.info(request, "Все остальные предложения для этого объявления автоматически отклонены.")
+                # Принимаем предложение и в той же транзакции отклоняем
+                # остальные ожидающие предложения по обоим объявлениям
+                rejected = services.accept_proposal(proposal)
+                messages.success(request, "Предложение обмена принято!")
+                if rejected:
+                    messages.info(request, "Все остальные предложения для этого объявления автоматически отклонены.")
+            elif new_status == 'R':
+                services.reject_proposal(proposal)
+                messages.success(request, "Предложение обмена отклонено!")
+        except services.ProposalConflict:
+            messages.error(request, "Предложение уже обработано.")
         
         return redirect('proposal_detail', pk=pk)
     
     return redirect('proposal_detail', pk=pk)
 
 @login_required
+@query_budget(12)
+@proposal_role_required(
+    'sender', "У вас нет прав для удаления этого предложения.",
+    queryset=ExchangeProposal.objects.for_listing(),
+)
 def delete_proposal(request, pk):
     """
     Удаление предложения обмена
     """
-    proposal = get_object_or_404(ExchangeProposal, pk=pk)
-    
-    # Проверяем права доступа (только отправитель может удалить)
-    if proposal.user != request.user:
-        messages.error(request, "У вас нет прав для удаления этого предложения.")
-        return redirect('proposal_detail', pk=pk)
+    proposal = request.proposal  # Только отправитель, проверено в декораторе
     
     if request.method == 'POST':
-        proposal.delete()
+        services.remove_proposal(proposal)
         messages.success(request, "Предложение обмена удалено!")
         return redirect('my_proposals')
     
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Под ASGI страницы чтения обслуживаются асинхронными представлениями (ads/async_views.py)
+os.environ.setdefault('ADS_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Поток SSE изменений предложений обслуживается до Django, без потока на соединение
+from ads.streams import router  # noqa: E402
+
+application = router(django_application)
@@ -43,7 +43,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ads.middleware.MetricsMiddleware',
+    'ads.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'ads.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -55,7 +58,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Стандартный бэкенд, измеряющий время рендеринга (ads.metrics)
+        'BACKEND': 'ads.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
                     'OPTIONS': {
@@ -63,6 +67,7 @@ TEMPLATES = [
                     'django.template.context_processors.request',
                     'django.contrib.auth.context_processors.auth',
                     'django.contrib.messages.context_processors.messages',
+                    'ads.context_processors.proposal_inbox',
                 ],
             },
     },
@@ -84,9 +89,48 @@ DATABASES = {
         'PASSWORD': os.getenv('PASSWORD'),       # Пароль
         'HOST': 'localhost',     # Хост
         'PORT': '5432',          # Порт
+        # Перед выдачей соединение проверяется; разорванное заменяется новым
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул соединений psycopg (OPTIONS['pool'], пакет psycopg-pool). Пул свой в каждом
+# процессе: max_size должен покрывать WORKER_CONCURRENCY — число одновременных
+# запросов одного процесса (потоков воркера), иначе запросы ждут соединение
+# до DB_POOL_TIMEOUT секунд (проверка ads.W001). Статистика ожидания — /ops/db-pool/.
+# С DB_POOL=0 соединения переиспользуются CONN_MAX_AGE секунд.
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '1'))
+if os.getenv('DB_POOL', '1') == '1':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', '60'))
+
+# Реплики для чтения (ads.routers): DB_REPLICAS — через запятую хосты PostgreSQL
+# с теми же базой и учетными данными или, для локальной проверки, пути к файлам
+# SQLite (*.sqlite3). После записи пользователь на REPLICA_PIN_SECONDS секунд
+# закрепляется за основной базой cookie REPLICA_PIN_COOKIE.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    if replica.endswith('.sqlite3'):
+        DATABASES[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': replica}
+    else:
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': replica}
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['ads.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+REPLICA_PIN_COOKIE = 'ads_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,6 +177,104 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Бюджеты SQL-запросов представлений (ads.decorators.query_budget):
+# при True превышение бросает исключение, иначе пишется предупреждение в лог
+QUERY_BUDGET_RAISE = DEBUG
+
+# Асинхронные представления для страниц чтения (ads/async_views.py);
+# включаются config/asgi.py, под WSGI остаются синхронные
+ADS_ASYNC_VIEWS = os.getenv('ADS_ASYNC_VIEWS', '0') == '1'
+
+# Кэши: default — общий, fragments — отрендеренные карточки объявлений, сводки
+# предложений и количества ленты. При заданном REDIS_URL он хранится в Redis и
+# общий для всех воркеров
+REDIS_URL = os.getenv('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+    },
+}
+ADS_FRAGMENT_CACHE = 'fragments'
+ADS_FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Сводки предложений пользователей для шапки (ads.inbox): ключи удаляются
+# при изменениях, поэтому кэш должен быть общим для воркеров
+ADS_INBOX_CACHE = 'fragments'
+
+# Количество результатов ленты: кэш и порог, после которого лента без фильтров
+# и с фильтром по категории показывает оценку планировщика PostgreSQL. Поколение
+# ключей увеличивается при изменениях, поэтому кэш должен быть общим для воркеров
+ADS_COUNT_CACHE = 'fragments'
+ADS_COUNT_CACHE_TIMEOUT = 300
+ADS_COUNT_ESTIMATE_THRESHOLD = 100_000
+
+# Наибольшее число строк файла на странице импорта; большие файлы — командой import_ads
+ADS_IMPORT_MAX_ROWS = 5000
+
+# Профилирование запросов (ads.metrics): заголовок X-Ads-Profile с этим токеном
+# или доля запросов от 0 до 1; профили cProfile сохраняются в ADS_PROFILE_DIR
+ADS_PROFILE_TOKEN = os.getenv('ADS_PROFILE_TOKEN', '')
+ADS_PROFILE_SAMPLE_RATE = float(os.getenv('ADS_PROFILE_SAMPLE_RATE', '0'))
+ADS_PROFILE_DIR = os.getenv('ADS_PROFILE_DIR', BASE_DIR / 'profiles')
+
+# Фоновые задачи (ads.taskqueue): выполняет python manage.py run_task_worker.
+# ADS_TASKS_EAGER=1 — выполнять сразу при постановке, без воркера
+ADS_TASKS_EAGER = os.getenv('ADS_TASKS_EAGER', '0') == '1'
+# Через сколько секунд задача в работе считается брошенной упавшим воркером
+ADS_TASKS_LOCK_TIMEOUT = 600
+
+# Уведомления о предложениях (ads.notifications): письма-дайджесты собираются
+# за окно в ADS_NOTIFICATION_DIGEST_SECONDS и уходят через одно SMTP-соединение
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '0') == '1'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@barter.local')
+ADS_NOTIFICATION_DIGEST_SECONDS = 300
+# Адрес сайта для ссылок в письмах
+ADS_SITE_URL = os.getenv('ADS_SITE_URL', 'http://localhost:8000')
+
+# Поток изменений предложений (ads.events, ads.streams; только под ASGI).
+# ads.events.PostgresBroker — через LISTEN/NOTIFY, когда процессов несколько
+ADS_EVENTS_BROKER = os.getenv('ADS_EVENTS_BROKER', 'ads.events.InProcessBroker')
+# Интервал пинга открытых потоков, секунды
+ADS_EVENTS_HEARTBEAT = 15
+
+# Миниатюры изображений объявлений (ads.thumbnails): варианты
+# хранятся в хранилище ADS_THUMBNAIL_STORAGE из STORAGES и отдаются /thumbnails/
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'thumbnails': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.getenv('ADS_THUMBNAIL_ROOT', BASE_DIR / 'media' / 'thumbnails')},
+    },
+}
+ADS_THUMBNAIL_STORAGE = 'thumbnails'
+# Ставить задачу миниатюр при сохранении объявления и импорте
+ADS_THUMBNAIL_ON_SAVE = True
+# Размер → (ширина, высота, обрезать до точного размера)
+ADS_THUMBNAIL_SIZES = {
+    'card': (400, 200, True),
+    'detail': (800, 800, False),
+}
+ADS_THUMBNAIL_MAX_BYTES = 10 * 1024 * 1024
+ADS_THUMBNAIL_TIMEOUT = 10
+# Разрешить загрузку изображений с адресов локальной сети
+ADS_THUMBNAIL_ALLOW_PRIVATE = False
+
+# Наибольшая длина цепочки обмена (ads.cycles), считая объявления: A → B → C → A — 3
+ADS_CYCLE_MAX_LENGTH = 4
+
 LOGOUT_REDIRECT_URL = 'index'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
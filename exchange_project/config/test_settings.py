@@ -4,6 +4,8 @@
 
 from .settings import *
 
+import os
+
 # Используем SQLite для тестов (быстрее и проще)
 DATABASES = {
     'default': {
@@ -12,12 +14,38 @@ DATABASES = {
     }
 }
 
-# Отключаем кэширование для тестов
+# Тесты параллельных операций (ConcurrentAcceptTest в tests/test_services.py)
+# требуют базы, к которой могут одновременно подключиться несколько потоков:
+#   ADS_TEST_DATABASE=sqlite-file — файловая SQLite, транзакции BEGIN IMMEDIATE
+#   ADS_TEST_DATABASE=postgresql  — PostgreSQL из config/settings.py
+TEST_DATABASE = os.getenv('ADS_TEST_DATABASE', 'memory')
+if TEST_DATABASE == 'sqlite-file':
+    DATABASES['default'].update({
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+    })
+elif TEST_DATABASE == 'postgresql':
+    from .settings import DATABASES
+
+# Реплика для тестов маршрутизации — зеркало тестовой базы. По умолчанию реплики
+# выключены; тесты включают их через override_settings(DATABASE_REPLICAS=['replica'])
+DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = []
+
+# Отключаем кэширование для тестов; кэш фрагментов — в памяти процесса
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-fragments',
+    },
 }
+# Количества ленты не кэшируются: откат транзакции теста не сбрасывает их поколение
+# (кэш количеств проверяет tests/test_counts.py со своим CACHES)
+ADS_COUNT_CACHE = 'default'
 
 # Ускоряем тесты
 PASSWORD_HASHERS = [
@@ -47,17 +75,31 @@ STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
 # Настройки для медиа файлов в тестах
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'test_media'
+STORAGES['thumbnails'] = {**STORAGES['thumbnails'], 'OPTIONS': {'location': MEDIA_ROOT / 'thumbnails'}}
+# Фикстуры не загружают изображения из сети: задачи миниатюр включают сами тесты миниатюр
+ADS_THUMBNAIL_ON_SAVE = False
 
 # Отключаем отладку для тестов
 DEBUG = False
 
+# Превышение бюджета SQL-запросов в тестах — ошибка
+QUERY_BUDGET_RAISE = True
+
+# Профилирование запросов не зависит от окружения
+ADS_PROFILE_TOKEN = ''
+ADS_PROFILE_SAMPLE_RATE = 0
+
+# Фоновые задачи выполняются сразу, внутри запроса
+ADS_TASKS_EAGER = True
+
 # Настройки для сообщений
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
 # Переопределяем TEMPLATES для тестов (убираем несуществующий context_processor)
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Стандартный бэкенд, измеряющий время рендеринга (ads.metrics)
+        'BACKEND': 'ads.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -65,6 +107,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ads.context_processors.proposal_inbox',
             ],
         },
     },
@@ -73,7 +116,10 @@ TEMPLATES = [
 # Убеждаемся, что middleware для сообщений включен
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ads.middleware.MetricsMiddleware',
+    'ads.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'ads.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
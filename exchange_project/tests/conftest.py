@@ -134,4 +134,11 @@ def authenticated_client(client, user1):
 @pytest.fixture
 def unauthenticated_client(client):
     """Фикстура для неавторизованного клиента"""
-    return client 
\ No newline at end of file
+    return client 
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Очищает кэши между тестами: id объявлений повторяются после отката транзакций"""
+    from django.core.cache import caches
+    for cache in caches.all():
+        cache.clear()
@@ -0,0 +1,106 @@
+import pytest
+from django.contrib.auth.models import User
+from django.test import TestCase, Client
+from django.urls import reverse
+from ads.models import Ad, ExchangeProposal
+
+
+class JSONAPITest(TestCase):
+    """Тесты JSON API только для чтения"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+        self.ads = [
+            Ad.objects.create(
+                user=self.user1, title=f'Объявление {i}', description='Описание',
+                category='E' if i % 2 else 'B', condition='N'
+            )
+            for i in range(25)
+        ]
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='F', condition='U')
+        self.proposal = ExchangeProposal.objects.create(
+            user=self.user1, ad_sender=self.ads[0], ad_receiver=self.target, comment='Меняю'
+        )
+
+        self.client.login(username='user1', password='testpass123')
+
+    def test_requires_login(self):
+        """Без авторизации — 401 в JSON, а не редирект"""
+        self.client.logout()
+        response = self.client.get(reverse('api_ad_list'))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('error', response.json())
+
+    def test_feed_pages_and_filters(self):
+        """Лента листается курсором и фильтруется как главная"""
+        response = self.client.get(reverse('api_ad_list'))
+        data = response.json()
+
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0]['title'], 'Цель')
+        self.assertEqual(data['results'][0]['user'], {'id': self.user2.pk, 'username': 'user2'})
+
+        data = self.client.get(reverse('api_ad_list'), {'cursor': data['next']}).json()
+        self.assertEqual(len(data['results']), 6)
+        self.assertIsNone(data['next'])
+
+        data = self.client.get(reverse('api_ad_list'), {'category': 'E', 'search': 'Объявление'}).json()
+        self.assertEqual(len(data['results']), 12)
+        self.assertTrue(all(ad['category'] == 'E' for ad in data['results']))
+
+    def test_invalid_cursor(self):
+        """Испорченный курсор — 400"""
+        response = self.client.get(reverse('api_ad_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        """Совпадающий If-None-Match — 304 без тела; изменение меняет ETag"""
+        url = reverse('api_ad_list')
+        tag = self.client.get(url)['ETag']
+        self.assertTrue(tag.startswith('"'))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.target.title = 'Новая цель'
+        self.target.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tag)
+
+        tag = response['ETag']
+        self.ads[24].delete()
+        self.assertNotEqual(self.client.get(url)['ETag'], tag)
+
+    def test_ad_detail(self):
+        """Объявление по id и 304 по ETag"""
+        url = reverse('api_ad_detail', kwargs={'pk': self.target.pk})
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()['title'], 'Цель')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('api_ad_detail', kwargs={'pk': 99999})).status_code, 404)
+
+    def test_proposals(self):
+        """Предложения пользователя; переименование объявления меняет ETag"""
+        url = reverse('api_proposal_list')
+        response = self.client.get(url)
+        results = response.json()['results']
+
+        self.assertEqual([proposal['id'] for proposal in results], [self.proposal.pk])
+        self.assertEqual(results[0]['ad_receiver'], {'id': self.target.pk, 'title': 'Цель', 'user_id': self.user2.pk})
+        self.assertEqual(self.client.get(url, {'type': 'received'}).json()['results'], [])
+
+        self.target.title = 'Новая цель'
+        self.target.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_read_only(self):
+        """POST не поддерживается"""
+        self.assertEqual(self.client.post(reverse('api_ad_list')).status_code, 405)
@@ -0,0 +1,170 @@
+import importlib
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import clear_url_caches, reverse
+from ads.decorators import ad_author_required, query_budget
+from ads.middleware import QueryBudgetExceeded, QueryBudgetMiddleware
+from ads.models import Ad, ExchangeProposal
+
+
+def _reload_urls():
+    import ads.urls
+    import config.urls
+    importlib.reload(ads.urls)
+    importlib.reload(config.urls)
+    clear_url_caches()
+
+
+class AsyncViewsTest(TestCase):
+    """Асинхронные страницы чтения под ADS_ASYNC_VIEWS"""
+
+    def setUp(self):
+        """Настройка тестовых данных и URL с асинхронными представлениями"""
+        override = override_settings(ADS_ASYNC_VIEWS=True)
+        override.enable()
+        self.addCleanup(_reload_urls)
+        self.addCleanup(override.disable)
+        _reload_urls()
+
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.ads1 = [
+            Ad.objects.create(user=self.user1, title=f'Объявление {i}', description='Описание', category='E', condition='N')
+            for i in range(12)
+        ]
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='U')
+        self.proposal = ExchangeProposal.objects.create(
+            user=self.user1, ad_sender=self.ads1[0], ad_receiver=self.target, comment='Меняю'
+        )
+
+    async def _login(self, username):
+        await self.async_client.alogin(username=username, password='testpass123')
+
+    async def test_urls_use_async_views(self):
+        """Страницы чтения обслуживаются корутинами"""
+        await self._login('user1')
+        for name, kwargs in [
+            ('index', {}),
+            ('ad_detail', {'pk': self.target.pk}),
+            ('my_proposals', {}),
+            ('proposal_detail', {'pk': self.proposal.pk}),
+        ]:
+            with self.subTest(url=name):
+                response = await self.async_client.get(reverse(name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(iscoroutinefunction(response.resolver_match.func))
+
+    async def test_index_pages_with_cursor(self):
+        """Лента листается курсором и показывает количество"""
+        await self._login('user1')
+        response = await self.async_client.get(reverse('index'), {'category': 'E'})
+
+        page = response.context['ads']
+        self.assertEqual(len(page), 10)
+        self.assertEqual(response.context['total_results'], 12)
+        self.assertContains(response, 'Объявление 11')
+
+        response = await self.async_client.get(reverse('index'), {'category': 'E', 'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['ads']), 2)
+
+    async def test_index_page_numbers(self):
+        """Постраничный режим работает и в асинхронной ленте"""
+        await self._login('user1')
+        response = await self.async_client.get(reverse('index'), {'page': 2})
+        self.assertEqual(len(response.context['ads']), 3)
+
+    async def test_ad_detail_form_choices(self):
+        """Форма предложения содержит только объявления пользователя"""
+        await self._login('user1')
+        response = await self.async_client.get(reverse('ad_detail', kwargs={'pk': self.target.pk}))
+
+        self.assertContains(response, 'Объявление 3')
+        self.assertNotContains(response, '<option value="%d"' % self.target.pk)
+        self.assertFalse(response.context['is_author'])
+
+    async def test_ad_detail_post_delegates(self):
+        """POST в ad_detail создает предложение синхронным представлением"""
+        await self._login('user1')
+        response = await self.async_client.post(
+            reverse('ad_detail', kwargs={'pk': self.target.pk}), {'ad_sender': self.ads1[1].pk, 'comment': 'Еще'}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await ExchangeProposal.objects.filter(ad_receiver=self.target).acount(), 2)
+
+    async def test_proposal_detail_permissions(self):
+        """Чужое предложение — редирект на список"""
+        await User.objects.acreate(username='user3')
+        stranger = await User.objects.aget(username='user3')
+        await self.async_client.aforce_login(stranger)
+
+        response = await self.async_client.get(reverse('proposal_detail', kwargs={'pk': self.proposal.pk}))
+        self.assertRedirects(response, reverse('my_proposals'), fetch_redirect_response=False)
+
+    async def test_query_budgets_under_asgi(self):
+        """Бюджеты SQL-запросов проверяются и для асинхронных представлений"""
+        await self._login('user2')
+        for name, kwargs, params in [
+            ('index', {}, {'search': 'Цель'}),
+            ('my_proposals', {}, {'type': 'received'}),
+            ('proposal_detail', {'pk': self.proposal.pk}, {}),
+        ]:
+            with self.subTest(url=name):
+                response = await self.async_client.get(reverse(name, kwargs=kwargs), params)
+                self.assertEqual(response.status_code, 200)
+
+
+class AsyncDecoratorsTest(TestCase):
+    """Асинхронные формы декораторов и middleware"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.factory = RequestFactory()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.ad = Ad.objects.create(user=self.user1, title='Объявление', description='Описание', category='E', condition='N')
+
+    def _request(self, user):
+        request = self.factory.get('/')
+        request._messages = []
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        return request
+
+    async def test_ad_author_required_async(self):
+        """Асинхронная обертка пропускает автора и отказывает остальным"""
+        @ad_author_required
+        async def view(request, pk):
+            return request.ad
+
+        self.assertTrue(iscoroutinefunction(view))
+
+        self.assertEqual(await view(self._request(self.user1), self.ad.pk), self.ad)
+
+        request = self._request(self.user2)
+        request._messages = type('Messages', (), {'add': lambda *args, **kwargs: None})()
+        response = await view(request, self.ad.pk)
+        self.assertEqual(response.url, reverse('ad_detail', kwargs={'pk': self.ad.pk}))
+
+    async def test_middleware_records_async_queries(self):
+        """Async-ветка middleware считает запросы асинхронного ORM"""
+        @query_budget(1)
+        async def view(request):
+            return HttpResponse(await Ad.objects.acount() + await Ad.objects.acount())
+
+        async def get_response(request):
+            return await view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        request = self.factory.get('/')
+        middleware.process_view(request, view, (), {})
+        with self.assertRaises(QueryBudgetExceeded):
+            await middleware(request)
@@ -0,0 +1,136 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from ads import inbox
+from ads.models import Ad, ExchangeProposal, ProposalSummary
+from ads.services import (
+    accept_proposal, create_proposal, reconcile_counters, reject_proposal, remove_ad, remove_proposal,
+)
+from ads.taskqueue import run_pending
+
+
+def _counters(ad):
+    ad = Ad.objects.get(pk=ad.pk)
+    return (ad.received_pending_count, ad.received_accepted_count, ad.received_rejected_count, ad.sent_count)
+
+
+class ProposalCountersTest(TestCase):
+    """Денормализованные счетчики предложений объявлений"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+        self.offers = [
+            Ad.objects.create(user=self.user1, title=f'Мое {i}', description='Описание', category='E', condition='N')
+            for i in range(2)
+        ]
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='N')
+        self.other_target = Ad.objects.create(
+            user=self.user2, title='Другая цель', description='Описание', category='B', condition='N'
+        )
+
+    def _propose(self, sender, receiver):
+        return create_proposal(ExchangeProposal(user=sender.user, ad_sender=sender, ad_receiver=receiver))
+
+    def test_create_from_view(self):
+        """Отправка предложения увеличивает счетчики обеих сторон"""
+        self.client.login(username='user1', password='testpass123')
+        self.client.post(
+            reverse('ad_detail', kwargs={'pk': self.target.pk}), {'ad_sender': self.offers[0].pk, 'comment': 'Обмен'}
+        )
+
+        self.assertEqual(_counters(self.target), (1, 0, 0, 0))
+        self.assertEqual(_counters(self.offers[0]), (0, 0, 0, 1))
+
+    def test_accept_and_reject(self):
+        """Принятие переносит счетчики всех затронутых получателей"""
+        proposal = self._propose(self.offers[0], self.target)
+        self._propose(self.offers[1], self.target)
+        self._propose(self.offers[0], self.other_target)
+        rejected = self._propose(self.offers[1], self.other_target)
+
+        reject_proposal(rejected)
+        self.assertEqual(_counters(self.other_target), (1, 0, 1, 0))
+
+        accept_proposal(proposal)
+        self.assertEqual(_counters(self.target), (0, 1, 1, 0))
+        self.assertEqual(_counters(self.other_target), (0, 0, 2, 0))
+        self.assertEqual(_counters(self.offers[0]), (0, 0, 0, 2))
+
+    def test_remove(self):
+        """Удаление предложения и объявления уменьшает счетчики оставшихся объявлений"""
+        proposal = self._propose(self.offers[0], self.target)
+        self._propose(self.offers[1], self.target)
+        self._propose(self.target, self.offers[1])
+        accept_proposal(proposal)
+
+        self.assertTrue(remove_proposal(proposal))
+        self.assertFalse(remove_proposal(proposal))
+        self.assertEqual(_counters(self.target), (0, 0, 1, 1))
+
+        remove_ad(self.offers[1])
+        self.assertEqual(_counters(self.target), (0, 0, 0, 0))
+
+    def test_edit_keeps_counters(self):
+        """Сохранение формы не перезаписывает счетчики устаревшими значениями"""
+        ad = Ad.objects.get(pk=self.target.pk)
+        self._propose(self.offers[0], self.target)
+
+        ad.title = 'Новое название'
+        ad.save()
+
+        self.assertEqual(Ad.objects.get(pk=ad.pk).title, 'Новое название')
+        self.assertEqual(_counters(self.target), (1, 0, 0, 0))
+
+    def test_counters_update_cached_card(self):
+        """Изменение счетчиков меняет версию карточки в кэше ленты"""
+        self.client.login(username='user1', password='testpass123')
+        self.assertNotContains(self.client.get(reverse('index')), 'Ожидают ответа')
+
+        self._propose(self.offers[0], self.target)
+        self.assertContains(self.client.get(reverse('index')), 'Ожидают ответа')
+
+    def test_reconcile(self):
+        """Пересчет исправляет расхождения только у затронутых объявлений"""
+        self._propose(self.offers[0], self.target)
+        ExchangeProposal.objects.create(user=self.user1, ad_sender=self.offers[1], ad_receiver=self.target, status='A')
+        Ad.objects.filter(pk=self.other_target.pk).update(received_rejected_count=5)
+
+        self.assertEqual(reconcile_counters(dry_run=True), 3)
+        self.assertEqual(reconcile_counters(batch_size=2), 3)
+        self.assertEqual(reconcile_counters(), 0)
+
+        self.assertEqual(_counters(self.target), (1, 1, 0, 0))
+        self.assertEqual(_counters(self.offers[1]), (0, 0, 0, 1))
+        self.assertEqual(_counters(self.other_target), (0, 0, 0, 0))
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_reconcile_before_worker(self):
+        """Пересчет до выполнения задачи события не учитывает событие дважды"""
+        self._propose(self.offers[0], self.target)
+        reconcile_counters(Ad.objects.filter(pk=self.target.pk))
+        inbox.rebuild([self.user2.pk])
+        run_pending()
+
+        self.assertEqual(_counters(self.target), (1, 0, 0, 0))
+        self.assertEqual(_counters(self.offers[0]), (0, 0, 0, 1))
+        self.assertEqual(ProposalSummary.objects.get(pk=self.user2.pk).received_pending, 1)
+        self.assertEqual(ProposalSummary.objects.get(pk=self.user1.pk).sent_pending, 1)
+
+    def test_reconcile_command(self):
+        """Команда сообщает число исправленных объявлений"""
+        ExchangeProposal.objects.create(user=self.user1, ad_sender=self.offers[0], ad_receiver=self.target)
+        out = StringIO()
+
+        call_command('reconcile_proposal_counters', '--dry-run', stdout=out)
+        self.assertIn('Расхождения у 2 объявлений', out.getvalue())
+
+        call_command('reconcile_proposal_counters', stdout=out)
+        self.assertIn('Исправлено объявлений: 2', out.getvalue())
+        self.assertEqual(_counters(self.target), (1, 0, 0, 0))
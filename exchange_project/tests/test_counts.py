@@ -0,0 +1,96 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from ads import counts
+from ads.counts import ResultCount, count_ads, estimate_count
+from ads.models import Ad
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-counts',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CountCacheTest(TestCase):
+    """Тесты кэша количеств результатов ленты"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.ad = Ad.objects.create(
+            user=self.user, title='Велосипед', description='Горный', category='O', condition='U'
+        )
+        Ad.objects.create(user=self.user, title='Книга', description='Роман', category='B', condition='N')
+
+    def test_count_is_cached(self):
+        """Повторный подсчет с теми же фильтрами не обращается к БД"""
+        self.assertEqual(count_ads('велосипед'), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(count_ads('  ВЕЛОСИПЕД '), 1)
+
+    def test_save_and_delete_invalidate(self):
+        """Сохранение и удаление объявлений сбрасывают кэш"""
+        self.assertEqual(count_ads(category='B'), 1)
+
+        Ad.objects.create(user=self.user, title='Еще книга', description='Повесть', category='B', condition='U')
+        self.assertEqual(count_ads(category='B'), 2)
+
+        self.ad.category = 'B'
+        self.ad.save()
+        self.assertEqual(count_ads(category='B'), 3)
+
+        self.ad.delete()
+        self.assertEqual(count_ads(category='B'), 2)
+
+    def test_count_cached_before_commit_is_dropped(self):
+        """Количество, сохраненное в кэш до коммита изменения, сбрасывается после коммита"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Ad.objects.create(user=self.user, title='Еще книга', description='Повесть', category='B', condition='U')
+            count_ads(category='B')
+
+        with self.assertNumQueries(1):
+            count_ads(category='B')
+
+    def test_evicted_generation_is_not_reused(self):
+        """Поколение, вытесненное из кэша, не начинается заново со старых значений"""
+        count_ads(category='B')
+        generation = caches['default'].get(counts.GENERATION_KEY)
+
+        caches['default'].delete(counts.GENERATION_KEY)
+        counts.invalidate()
+
+        self.assertGreater(caches['default'].get(counts.GENERATION_KEY), generation)
+
+    def test_estimate_is_postgresql_only(self):
+        """На SQLite всегда используется точный COUNT"""
+        self.assertIsNone(estimate_count(Ad.objects.all(), filtered=False))
+        self.assertFalse(count_ads().estimated)
+
+
+class ResultCountDisplayTest(TestCase):
+    """Тесты отображения приблизительных количеств"""
+
+    def test_str(self):
+        """Оценка выводится с тильдой"""
+        self.assertEqual(str(ResultCount(120)), '120')
+        self.assertEqual(str(ResultCount(120000, estimated=True)), '~120000')
+
+    def test_index_shows_estimate(self):
+        """Главная страница показывает "~N результатов" для оценки"""
+        User.objects.create_user(username='user1', password='testpass123')
+        client = Client()
+        client.login(username='user1', password='testpass123')
+
+        with mock.patch('ads.views.count_ads', return_value=ResultCount(250000, estimated=True)):
+            response = client.get(reverse('index'))
+
+        self.assertContains(response, '~250000 результатов')
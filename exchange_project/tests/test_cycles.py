@@ -0,0 +1,212 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.urls import reverse
+from ads.cycles import WantsGraph, cycle_key
+from ads.models import Ad, BarterCycle, ExchangeProposal
+from ads.taskqueue import run_pending
+from ads.services import accept_proposal, create_proposal, reject_proposal, remove_ad, remove_proposal
+
+
+class WantsGraphTest(SimpleTestCase):
+    """Поиск циклов в графе предложений в памяти"""
+
+    def _graph(self, edges, owners=None):
+        graph = WantsGraph()
+        for pk, (sender, receiver) in enumerate(edges, start=1):
+            owners_of = owners or {}
+            graph.add(pk, sender, receiver, owners_of.get(sender, sender), owners_of.get(receiver, receiver))
+        return graph
+
+    def test_triangle_found_once(self):
+        """Цикл находится один раз, начиная с наименьшего объявления"""
+        graph = self._graph([(1, 2), (2, 3), (3, 1), (2, 1)])
+
+        self.assertEqual(list(graph.cycles(4)), [[1, 2, 3]])
+        self.assertEqual(graph.cycles_through(3, 1, 4), [[3, 1, 2]])
+
+    def test_counter_proposals_are_not_cycles(self):
+        """Встречные предложения (длина 2) — не цепочка"""
+        self.assertEqual(list(self._graph([(1, 2), (2, 1)]).cycles(4)), [])
+
+    def test_length_bound(self):
+        """Циклы длиннее max_length не ищутся"""
+        graph = self._graph([(1, 2), (2, 3), (3, 4), (4, 1)])
+
+        self.assertEqual(list(graph.cycles(3)), [])
+        self.assertEqual(list(graph.cycles(4)), [[1, 2, 3, 4]])
+        self.assertEqual(graph.cycles_through(4, 1, 3), [])
+
+    def test_distinct_owners(self):
+        """Два объявления одного автора в цикле — это не обмен между участниками"""
+        graph = self._graph([(1, 2), (2, 3), (3, 1)], owners={1: 10, 2: 20, 3: 10})
+        self.assertEqual(list(graph.cycles(4)), [])
+
+    def test_remove(self):
+        """Удаленное ребро больше не замыкает цикл"""
+        graph = self._graph([(1, 2), (2, 3), (3, 1)])
+        graph.remove(3, 3, 1)
+        self.assertEqual(list(graph.cycles(4)), [])
+
+    def test_key_is_rotation_invariant(self):
+        """Ключ не зависит от того, с какого объявления записан цикл"""
+        self.assertEqual(cycle_key([5, 2, 9]), '2-9-5')
+        self.assertEqual(cycle_key([9, 5, 2]), '2-9-5')
+
+
+class BarterCycleServicesTest(TestCase):
+    """Цепочки обмена обновляются вместе с предложениями"""
+
+    def setUp(self):
+        """Настройка тестовых данных: по объявлению у четырех пользователей"""
+        self.users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(1, 5)]
+        self.ads = [
+            Ad.objects.create(user=user, title=f'Объявление {user.username}', description='Описание',
+                              category='E', condition='N')
+            for user in self.users
+        ]
+
+    def _propose(self, sender, receiver):
+        return create_proposal(ExchangeProposal(
+            user=self.ads[sender].user, ad_sender=self.ads[sender], ad_receiver=self.ads[receiver],
+        ))
+
+    def _triangle(self):
+        return [self._propose(0, 1), self._propose(1, 2), self._propose(2, 0)]
+
+    def test_closing_proposal_creates_cycle(self):
+        """Предложение, замыкающее круг, создает цепочку с предложениями и участниками"""
+        proposals = self._triangle()
+
+        cycle = BarterCycle.objects.get()
+        self.assertEqual(cycle.length, 3)
+        self.assertEqual(cycle.ad_ids, [ad.pk for ad in self.ads[:3]])
+        self.assertEqual(set(cycle.proposals.all()), set(proposals))
+        self.assertEqual(set(cycle.users.all()), set(self.users[:3]))
+
+    def test_four_party_cycle(self):
+        """Цепочка из четырех участников находится обходом с двух сторон"""
+        for sender in range(4):
+            self._propose(sender, (sender + 1) % 4)
+
+        self.assertEqual(BarterCycle.objects.get().key, '-'.join(str(ad.pk) for ad in self.ads))
+
+    @override_settings(ADS_CYCLE_MAX_LENGTH=3)
+    def test_max_length_setting(self):
+        """Длинные цепочки не ищутся"""
+        for sender in range(4):
+            self._propose(sender, (sender + 1) % 4)
+        self.assertFalse(BarterCycle.objects.exists())
+
+    def test_reject_removes_cycle(self):
+        """Отклонение любого предложения цепочки удаляет ее"""
+        proposals = self._triangle()
+        reject_proposal(proposals[1])
+        self.assertFalse(BarterCycle.objects.exists())
+
+    def test_accept_removes_cycle(self):
+        """Принятое предложение больше не ожидает ответа — цепочка удаляется"""
+        proposals = self._triangle()
+        accept_proposal(proposals[0])
+        self.assertFalse(BarterCycle.objects.exists())
+
+    def test_remove_proposal_and_ad(self):
+        """Удаление предложения или объявления удаляет цепочки с ними"""
+        proposals = self._triangle()
+        remove_proposal(proposals[2])
+        self.assertFalse(BarterCycle.objects.exists())
+
+        self._propose(2, 0)
+        self.assertTrue(BarterCycle.objects.exists())
+        remove_ad(self.ads[1])
+        self.assertFalse(BarterCycle.objects.exists())
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_remove_closed_proposal_before_worker(self):
+        """
+        Отклоненное предложение удаляется до того, как воркер убрал его цепочку:
+        цепочка удаляется вместе с предложением, ссылки на удаленную строку не остается
+        """
+        proposals = self._triangle()
+        run_pending()
+        reject_proposal(proposals[1])
+        self.assertTrue(BarterCycle.objects.exists())
+
+        remove_proposal(proposals[1])
+        connection.check_constraints()
+        self.assertFalse(BarterCycle.objects.exists())
+
+        proposals = [proposals[0], proposals[2], self._propose(1, 2)]
+        run_pending()
+        self.assertTrue(BarterCycle.objects.exists())
+        reject_proposal(proposals[0])
+        reject_proposal(proposals[2])
+        remove_ad(self.ads[1])
+        connection.check_constraints()
+        self.assertFalse(BarterCycle.objects.exists())
+        run_pending()
+
+    def test_rebuild(self):
+        """Полный пересчет находит цепочки из предложений, созданных в обход сервисов, и удаляет устаревшие"""
+        for sender, receiver in ((0, 1), (1, 2), (2, 0)):
+            ExchangeProposal.objects.create(
+                user=self.users[sender], ad_sender=self.ads[sender], ad_receiver=self.ads[receiver],
+            )
+        BarterCycle.objects.create(key='1000-1001-1002', length=3)
+        out = StringIO()
+
+        call_command('find_barter_cycles', '--dry-run', stdout=out)
+        self.assertIn('Найдено цепочек: 1', out.getvalue())
+        self.assertEqual(BarterCycle.objects.get().key, '1000-1001-1002')
+
+        call_command('find_barter_cycles', stdout=out)
+        cycle = BarterCycle.objects.get()
+        self.assertEqual(cycle.ad_ids, [ad.pk for ad in self.ads[:3]])
+        self.assertEqual(cycle.proposals.count(), 3)
+
+
+class BarterCyclesViewTest(TestCase):
+    """Страница цепочек обмена"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(1, 5)]
+        ads = [
+            Ad.objects.create(user=user, title=f'Вещь {user.username}', description='Описание', category='E', condition='N')
+            for user in users
+        ]
+        for sender, receiver in ((0, 1), (1, 2), (2, 0)):
+            create_proposal(ExchangeProposal(user=users[sender], ad_sender=ads[sender], ad_receiver=ads[receiver]))
+
+    def test_participant_sees_chain(self):
+        """Участник видит цепочку по порядку обмена"""
+        self.client.login(username='user2', password='testpass123')
+        response = self.client.get(reverse('barter_cycles'))
+
+        [(cycle, proposals)] = response.context['chains']
+        self.assertEqual([proposal.ad_sender.title for proposal in proposals], ['Вещь user1', 'Вещь user2', 'Вещь user3'])
+        self.assertContains(response, 'Участников: 3')
+
+    def test_outsider_sees_nothing(self):
+        """Пользователь вне цепочки ее не видит"""
+        self.client.login(username='user4', password='testpass123')
+        response = self.client.get(reverse('barter_cycles'))
+
+        self.assertEqual(response.context['chains'], [])
+        self.assertContains(response, 'Цепочек пока нет')
+
+
+class BenchmarkCyclesCommandTest(SimpleTestCase):
+    """Команда измерения поиска цепочек"""
+
+    def test_small_graph(self):
+        """Инкрементальный поиск совпадает с полным перебором"""
+        out = StringIO()
+        call_command('benchmark_cycles', '--ads', '300', '--users', '200', '--edges', '2000', '--events', '200', stdout=out)
+
+        self.assertIn('incremental events=200', out.getvalue())
+        self.assertIn('full', out.getvalue())
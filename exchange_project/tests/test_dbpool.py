@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.urls import reverse
+from ads import dbpool
+
+
+def _databases(pool):
+    return {'default': {'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {'pool': pool}}}
+
+
+class PoolSizeCheckTest(SimpleTestCase):
+    """Системная проверка размера пула"""
+
+    @override_settings(WORKER_CONCURRENCY=16, DATABASES=_databases({'min_size': 2, 'max_size': 8}))
+    def test_warns_when_pool_is_smaller(self):
+        """Пул меньше числа потоков — предупреждение ads.W001"""
+        problems = dbpool.check_pool_size()
+        self.assertEqual([problem.id for problem in problems], ['ads.W001'])
+
+    @override_settings(WORKER_CONCURRENCY=8, DATABASES=_databases({'max_size': 8}))
+    def test_enough_connections(self):
+        """Достаточный пул — без предупреждений"""
+        self.assertEqual(dbpool.check_pool_size(), [])
+
+    @override_settings(WORKER_CONCURRENCY=8, DATABASES=_databases(True))
+    def test_default_pool_size(self):
+        """OPTIONS['pool'] = True — размер по умолчанию psycopg_pool (4)"""
+        self.assertEqual(len(dbpool.check_pool_size()), 1)
+
+    @override_settings(WORKER_CONCURRENCY=64)
+    def test_without_pool(self):
+        """Без пула проверять нечего"""
+        self.assertEqual(dbpool.check_pool_size(), [])
+
+
+class PoolStatsTest(TestCase):
+    """Статистика пула и страница для персонала"""
+
+    def setUp(self):
+        """Пул с накопленными счетчиками ожидания"""
+        self.pool = mock.Mock()
+        self.pool.get_stats.return_value = {'pool_size': 4, 'requests_queued': 4, 'requests_wait_ms': 10}
+        self.pool.pop_stats.return_value = {'pool_size': 4}
+
+    def test_without_pool(self):
+        """SQLite без пула — None"""
+        self.assertIsNone(dbpool.pool_stats())
+
+    def test_wait_average(self):
+        """Среднее ожидание соединения считается по ждавшим запросам"""
+        with mock.patch.object(connections['default'], 'pool', self.pool, create=True):
+            self.assertEqual(dbpool.pool_stats()['wait_ms_avg'], 2.5)
+            self.assertEqual(dbpool.pool_stats(reset=True)['wait_ms_avg'], 0.0)
+        self.pool.pop_stats.assert_called_once_with()
+
+    def test_staff_only_view(self):
+        """Статистику видит только персонал"""
+        User.objects.create_user(username='user1', password='testpass123')
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        client = Client()
+        url = reverse('db_pool_stats')
+
+        client.login(username='user1', password='testpass123')
+        self.assertEqual(client.get(url).status_code, 302)
+
+        client.login(username='admin', password='testpass123')
+        with mock.patch.object(connections['default'], 'pool', self.pool, create=True):
+            data = client.get(url).json()
+        self.assertEqual(data['pool']['pool_size'], 4)
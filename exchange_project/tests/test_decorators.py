@@ -5,8 +5,9 @@ from django.urls import reverse
 from django.contrib.messages import get_messages
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
-from ads.models import Ad
-from ads.decorators import ad_author_required
+from django.http import Http404
+from ads.models import Ad, ExchangeProposal
+from ads.decorators import ad_author_required, proposal_role_required
 
 
 class DecoratorsTest(TestCase):
@@ -168,4 +169,82 @@ class DecoratorsTest(TestCase):
         # Проверяем, что функция выполнилась успешно
         self.assertEqual(result['status'], 'success')
         self.assertEqual(result['pk'], self.ad.pk)
-        self.assertEqual(result['extra'], 'test_value') 
\ No newline at end of file
+        self.assertEqual(result['extra'], 'test_value') 
+    def test_ad_author_required_single_query(self):
+        """Декоратор делает один запрос и передает объявление в request.ad"""
+        def test_view(request, pk):
+            return request.ad
+
+        request = self._get_request_with_messages(self.user1)
+
+        with self.assertNumQueries(1):
+            ad = ad_author_required(test_view)(request, self.ad.pk)
+
+        self.assertEqual(ad, self.ad)
+
+
+class ProposalRoleRequiredTest(TestCase):
+    """Тесты декоратора прав на предложение обмена"""
+
+    _get_request_with_messages = DecoratorsTest._get_request_with_messages
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.factory = RequestFactory()
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.receiver = User.objects.create_user(username='receiver', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', password='testpass123')
+
+        ad_sender = Ad.objects.create(user=self.sender, title='Мое', description='Описание', category='E', condition='N')
+        ad_receiver = Ad.objects.create(user=self.receiver, title='Цель', description='Описание', category='B', condition='N')
+        self.proposal = ExchangeProposal.objects.create(user=self.sender, ad_sender=ad_sender, ad_receiver=ad_receiver)
+
+    def _call(self, role, user, pk=None, **kwargs):
+        request = self._get_request_with_messages(user)
+
+        @proposal_role_required(role, 'Нет прав', **kwargs)
+        def test_view(request, pk):
+            return request.proposal
+
+        return request, test_view(request, pk or self.proposal.pk)
+
+    def test_roles(self):
+        """Роли sender, receiver и participant"""
+        cases = [
+            ('sender', self.sender, True), ('sender', self.receiver, False),
+            ('receiver', self.receiver, True), ('receiver', self.sender, False),
+            ('participant', self.sender, True), ('participant', self.receiver, True),
+            ('participant', self.stranger, False),
+        ]
+        for role, user, allowed in cases:
+            with self.subTest(role=role, user=user.username):
+                request, result = self._call(role, user)
+                if allowed:
+                    self.assertEqual(result, self.proposal)
+                else:
+                    self.assertEqual(result.url, reverse('proposal_detail', kwargs={'pk': self.proposal.pk}))
+                    self.assertTrue(any('Нет прав' in str(message) for message in get_messages(request)))
+
+    def test_single_query_without_user_load(self):
+        """Проверка прав — один запрос, пользователи не загружаются"""
+        request = self._get_request_with_messages(self.receiver)
+
+        @proposal_role_required('receiver', 'Нет прав')
+        def test_view(request, pk):
+            return request.proposal.receiver_user_id
+
+        with self.assertNumQueries(1):
+            self.assertEqual(test_view(request, self.proposal.pk), self.receiver.pk)
+
+    def test_redirect_and_missing(self):
+        """Редирект на заданный URL и 404 для несуществующего предложения"""
+        _, result = self._call('participant', self.stranger, redirect_to='my_proposals')
+        self.assertEqual(result.url, reverse('my_proposals'))
+
+        with self.assertRaises(Http404):
+            self._call('participant', self.sender, pk=99999)
+
+    def test_unknown_role(self):
+        """Неизвестная роль — ошибка при объявлении"""
+        with self.assertRaises(ValueError):
+            proposal_role_required('owner', 'Нет прав')
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from ads.management.commands.explain_queries import sequential_scans
+
+
+class SequentialScanParsingTest(TestCase):
+    """Тесты распознавания последовательных сканирований в планах"""
+
+    def test_postgresql_plan(self):
+        """Seq Scan в плане PostgreSQL распознается, Index Scan — нет"""
+        plan = (
+            'Limit  (cost=0.29..1.02 rows=11 width=80)\n'
+            '  ->  Index Scan using ads_ad_created_idx on ads_ad\n'
+            '  ->  Seq Scan on ads_exchangeproposal  (cost=0.00..35.50 rows=10 width=8)'
+        )
+        self.assertEqual(sequential_scans(plan, 'postgresql'), ['ads_exchangeproposal'])
+
+    def test_sqlite_plan(self):
+        """SCAN без индекса распознается, SEARCH и SCAN USING INDEX — нет"""
+        plan = (
+            '5 0 0 SCAN ads_exchangeproposal\n'
+            '7 0 0 SEARCH ads_ad USING INTEGER PRIMARY KEY (rowid=?)\n'
+            '9 0 0 SCAN ads_ad USING INDEX ads_ad_created_idx\n'
+            '10 8 0 SCAN ads_ad_fts VIRTUAL TABLE INDEX 0:M2'
+        )
+        self.assertEqual(sequential_scans(plan, 'sqlite'), ['ads_exchangeproposal'])
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='Планы SQLite стабильны на пустых таблицах')
+class ExplainQueriesCommandTest(TestCase):
+    """Тесты команды explain_queries"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        User.objects.create_user(username='user1', password='testpass123')
+
+    def test_feed_and_filters_use_indexes(self):
+        """Лента, фильтры и запросы по статусу идут по индексам"""
+        out = io.StringIO()
+        call_command('explain_queries', user='user1', stdout=out)
+        lines = out.getvalue().splitlines()
+
+        for name in [
+            'index',
+            'index ?category',
+            'index ?condition',
+            'index ?category&condition',
+            'index ?search',
+            'my_proposals ?type=sent&status',
+            'update_proposal_status: ожидающие по объявлению',
+        ]:
+            self.assertIn(f'[OK] {name}', lines)
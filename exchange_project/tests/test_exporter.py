@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+from ads.exporter import Exporter, InvalidWatermark, parse_watermark
+from ads.models import Ad, ExchangeProposal
+
+
+class ExporterTest(TestCase):
+    """Тесты потоковой выгрузки"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.ads = [
+            Ad.objects.create(user=self.user, title=f'Объявление {i}', description='Описание, "в кавычках"',
+                              category='E', condition='N')
+            for i in range(5)
+        ]
+        self.proposal = ExchangeProposal.objects.create(
+            user=self.user, ad_sender=self.ads[0], ad_receiver=self.ads[1], comment='Меняю'
+        )
+        # Разносим отметки времени, чтобы проверить инкрементальную выгрузку
+        now = timezone.now()
+        for i, ad in enumerate(self.ads):
+            Ad.objects.filter(pk=ad.pk).update(updated_at=now - timedelta(days=5 - i))
+        self.now = now
+
+    def test_jsonl(self):
+        """JSONL: одна строка — один объект"""
+        lines = list(Exporter('ads', 'jsonl'))
+
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [ad.pk for ad in self.ads])
+        self.assertEqual(rows[0]['title'], 'Объявление 0')
+
+    def test_csv(self):
+        """CSV с заголовком разбирается обратно"""
+        rows = list(csv.DictReader(io.StringIO(''.join(Exporter('proposals', 'csv')))))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['ad_sender_id'], str(self.ads[0].pk))
+        self.assertEqual(rows[0]['status'], 'P')
+
+    def test_incremental(self):
+        """since отбирает строки начиная с отметки; watermark — отметка последней строки"""
+        exporter = Exporter('ads', 'jsonl', since=self.now - timedelta(days=2, hours=1))
+        rows = [json.loads(line) for line in exporter]
+
+        self.assertEqual([row['id'] for row in rows], [ad.pk for ad in self.ads[3:]])
+        self.assertEqual(exporter.rows, 2)
+        self.assertEqual(exporter.watermark, Ad.objects.get(pk=self.ads[4].pk).updated_at)
+
+        again = Exporter('ads', 'jsonl', since=exporter.watermark)
+        self.assertEqual([json.loads(line)['id'] for line in again], [self.ads[4].pk])
+
+    def test_uses_iterator(self):
+        """Строки читаются порциями iterator(), QuerySet не материализуется"""
+        exporter = Exporter('ads', 'jsonl', chunk_size=2)
+        self.assertEqual(len(list(exporter)), 5)
+        self.assertIsNone(exporter.queryset()._result_cache)
+
+    def test_parse_watermark(self):
+        """Отметка — ISO 8601, без пояса — в текущем поясе"""
+        self.assertTrue(timezone.is_aware(parse_watermark('2026-01-02T03:04:05')))
+        self.assertIsNone(parse_watermark(''))
+        with self.assertRaises(InvalidWatermark):
+            parse_watermark('вчера')
+
+    def test_command(self):
+        """Команда export_data пишет выгрузку и отметку"""
+        out, err = io.StringIO(), io.StringIO()
+        call_command('export_data', 'ads', format='csv', stdout=out, stderr=err)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+        self.assertIn('Выгружено строк: 5', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'ads', since='вчера', stdout=out, stderr=err)
+
+
+class ExportViewTest(TestCase):
+    """Тесты потоковой выгрузки через HTTP"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        Ad.objects.create(user=self.user, title='Объявление', description='Описание', category='E', condition='N')
+
+    def test_staff_only(self):
+        """Обычный пользователь не может выгружать данные"""
+        self.client.login(username='user1', password='testpass123')
+        response = self.client.get(reverse('export_data', kwargs={'dataset': 'ads'}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_streaming(self):
+        """Ответ потоковый, с именем файла"""
+        self.client.login(username='admin', password='testpass123')
+        response = self.client.get(reverse('export_data', kwargs={'dataset': 'ads'}), {'format': 'csv'})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="ads.csv"')
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Объявление', content)
+
+    def test_bad_parameters(self):
+        """Неизвестные набор, формат и отметка"""
+        self.client.login(username='admin', password='testpass123')
+        self.assertEqual(self.client.get(reverse('export_data', kwargs={'dataset': 'users'})).status_code, 404)
+        url = reverse('export_data', kwargs={'dataset': 'ads'})
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'вчера'}).status_code, 400)
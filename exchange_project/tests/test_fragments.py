@@ -0,0 +1,82 @@
+import io
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from ads import fragments
+from ads.models import Ad
+
+
+class AdCardFragmentCacheTest(TestCase):
+    """Тесты кэша отрендеренных карточек объявлений"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.ads = [
+            Ad.objects.create(
+                user=self.user, title=f'Объявление {i}', description='Описание', category='E', condition='N'
+            )
+            for i in range(3)
+        ]
+        self.client.login(username='user1', password='testpass123')
+
+    def test_cards_cached_between_requests(self):
+        """Второй показ ленты берет все карточки из кэша"""
+        self.client.get(reverse('index'))
+        self.assertEqual(fragments.stats(), {'hits': 0, 'misses': 3, 'hit_rate': 0.0})
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Объявление 2')
+        self.assertEqual(fragments.stats()['hits'], 3)
+        self.assertEqual(fragments.stats()['hit_rate'], 0.5)
+
+    def test_render_cards_skips_templates_on_hit(self):
+        """При попадании карточки не рендерятся заново"""
+        fragments.render_cards(self.ads)
+
+        with self.assertTemplateNotUsed(template_name=fragments.CARD_TEMPLATE):
+            cards = fragments.render_cards(self.ads)
+
+        self.assertEqual([ad for ad, _ in cards], self.ads)
+        self.assertIn('Объявление 0', cards[0][1])
+
+    def test_edit_bumps_version(self):
+        """Редактирование увеличивает версию и обновляет карточку"""
+        ad = self.ads[0]
+        self.client.get(reverse('index'))
+
+        self.client.post(reverse('edit_ad', kwargs={'pk': ad.pk}), {
+            'title': 'Новый заголовок', 'description': 'Описание', 'category': 'E', 'condition': 'N',
+        })
+
+        ad.refresh_from_db()
+        self.assertEqual(ad.version, 2)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Новый заголовок')
+        self.assertNotContains(response, 'Объявление 0')
+
+    def test_delete_removes_card(self):
+        """Удаление объявления удаляет его карточку из кэша"""
+        ad = self.ads[0]
+        fragments.render_cards([ad])
+        key = fragments.card_key(ad)
+        self.assertIsNotNone(fragments._cache().get(key))
+
+        self.client.post(reverse('delete_ad', kwargs={'pk': ad.pk}))
+
+        self.assertIsNone(fragments._cache().get(key))
+
+    def test_stats_command(self):
+        """Команда fragment_cache_stats выводит и сбрасывает счетчики"""
+        fragments.render_cards(self.ads)
+        fragments.render_cards(self.ads)
+
+        out = io.StringIO()
+        call_command('fragment_cache_stats', reset=True, stdout=out)
+
+        self.assertIn('hits=3 misses=3 hit_rate=50.00%', out.getvalue())
+        self.assertEqual(fragments.stats()['hits'], 0)
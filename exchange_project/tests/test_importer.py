@@ -0,0 +1,203 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+import pytest
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from ads import importer
+from ads.importer import InvalidImportFormat, detect_format, import_ads
+from ads.models import Ad
+
+CSV_DATA = (
+    'title,description,image_url,category,condition\n'
+    'Велосипед,Горный,https://example.com/bike.jpg,O,U\n'
+    'Книга,Роман,,B,N\n'
+    ',Без названия,,B,N\n'
+    'Стул,Деревянный,not-a-url,X,N\n'
+)
+
+
+def jsonl(*rows):
+    return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+class ImportAdsTest(TestCase):
+    """Тесты массового импорта объявлений"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+
+    def test_csv(self):
+        """Корректные строки создаются, ошибки привязаны к строкам файла"""
+        result = import_ads(io.StringIO(CSV_DATA), 'csv', self.user)
+
+        self.assertEqual((result.rows, result.created, result.failed), (4, 2, 2))
+        self.assertEqual(
+            list(Ad.objects.order_by('title').values_list('title', 'user__username')),
+            [('Велосипед', 'user1'), ('Книга', 'user1')],
+        )
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertEqual(set(result.errors[1][1]), {'image_url', 'category'})
+        self.assertGreater(result.rows_per_second, 0)
+
+    def test_jsonl_batches(self):
+        """JSONL вставляется пачками bulk_create; битые строки — ошибки"""
+        data = jsonl(*[
+            {'title': f'Товар {i}', 'description': 'Описание', 'category': 'E', 'condition': 'N'}
+            for i in range(5)
+        ]) + '{не json\n\n[1, 2]\n'
+        batches = []
+
+        with self.assertNumQueries(3 * 3):  # SAVEPOINT, INSERT, RELEASE на пачку
+            result = import_ads(io.StringIO(data), 'jsonl', self.user, batch_size=2,
+                                progress=lambda r: batches.append(r.created))
+
+        self.assertEqual((result.rows, result.created, result.failed), (7, 5, 2))
+        self.assertEqual(batches, [2, 4, 5])
+        self.assertEqual([line for line, _ in result.errors], [6, 8])
+
+    def test_errors_are_capped(self):
+        """Хранится не больше MAX_ERRORS ошибок"""
+        data = jsonl(*[{'title': ''}] * 5)
+        with mock.patch('ads.importer.MAX_ERRORS', 2):
+            result = import_ads(io.StringIO(data), 'jsonl', self.user)
+
+        self.assertEqual(result.failed, 5)
+        self.assertEqual(len(result.errors), 2)
+        self.assertTrue(result.errors_truncated)
+
+    def test_detect_format(self):
+        """Формат по расширению или явно"""
+        self.assertEqual(detect_format('ads.CSV'), 'csv')
+        self.assertEqual(detect_format('ads.ndjson'), 'jsonl')
+        self.assertEqual(detect_format('ads.txt', 'jsonl'), 'jsonl')
+        with self.assertRaises(InvalidImportFormat):
+            detect_format('ads.txt')
+
+    def test_command(self):
+        """Команда import_ads выводит итоги и ошибки"""
+        path = self._tmp_file('ads.csv', CSV_DATA)
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('import_ads', path, user='user1', stdout=out, stderr=err)
+
+        self.assertIn('создано 2, ошибок 2', out.getvalue())
+        self.assertIn('строка 5: category:', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_ads', path, user='nobody', stdout=out)
+
+    def _tmp_file(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+
+class ImportAdsViewTest(TestCase):
+    """Тесты страницы загрузки файла"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.client.login(username='user1', password='testpass123')
+
+    def test_requires_login(self):
+        """Страница импорта только для авторизованных"""
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('import_ads')).status_code, 302)
+
+    def test_upload(self):
+        """Загрузка CSV показывает итоги и ошибки"""
+        response = self.client.post(reverse('import_ads'), {
+            'file': SimpleUploadedFile('ads.csv', CSV_DATA.encode('utf-8-sig')),
+        })
+
+        self.assertEqual(Ad.objects.filter(user=self.user).count(), 2)
+        self.assertContains(response, 'создано объявлений: 2')
+        self.assertEqual(response.context['result'].failed, 2)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_large_upload_streams_from_disk(self):
+        """Большой файл читается из временного файла"""
+        data = jsonl(*[
+            {'title': f'Товар {i}', 'description': 'Описание', 'category': 'E', 'condition': 'N'}
+            for i in range(20)
+        ])
+        response = self.client.post(reverse('import_ads'), {
+            'file': SimpleUploadedFile('ads.jsonl', data.encode()),
+        })
+
+        self.assertEqual(response.context['result'].created, 20)
+
+    def test_unknown_format(self):
+        """Неизвестное расширение без явного формата — ошибка формы"""
+        response = self.client.post(reverse('import_ads'), {
+            'file': SimpleUploadedFile('ads.txt', b'title\n'),
+        })
+
+        self.assertContains(response, 'Не удалось определить формат файла')
+
+    def _rows(self, count):
+        return jsonl(*[
+            {'title': f'Товар {i}', 'description': 'Описание', 'category': 'E', 'condition': 'N'}
+            for i in range(count)
+        ])
+
+    def test_largest_upload_fits_budget(self):
+        """Файл наибольшего допустимого размера укладывается в бюджет запросов представления"""
+        response = self.client.post(reverse('import_ads'), {
+            'file': SimpleUploadedFile('ads.jsonl', self._rows(settings.ADS_IMPORT_MAX_ROWS).encode()),
+        })
+
+        self.assertEqual(response.context['result'].created, settings.ADS_IMPORT_MAX_ROWS)
+
+    @override_settings(ADS_IMPORT_MAX_ROWS=3)
+    def test_too_many_rows(self):
+        """Файл длиннее ADS_IMPORT_MAX_ROWS не импортируется"""
+        response = self.client.post(reverse('import_ads'), {
+            'file': SimpleUploadedFile('ads.jsonl', self._rows(4).encode()),
+        })
+
+        self.assertContains(response, 'через сайт можно загрузить не больше 3')
+        self.assertFalse(Ad.objects.exists())
+
+    def test_encoding_is_checked_before_import(self):
+        """Ошибка кодировки в конце файла не оставляет записанных пачек"""
+        data = self._rows(importer.BATCH_SIZE + 1).encode() + b'\xff\n'
+        response = self.client.post(reverse('import_ads'), {'file': SimpleUploadedFile('ads.jsonl', data)})
+
+        self.assertContains(response, 'Файл должен быть в кодировке UTF-8')
+        self.assertFalse(Ad.objects.exists())
+
+    def test_interrupted_import_reports_saved_ads(self):
+        """Если импорт прерван ошибкой базы, страница показывает, сколько объявлений уже сохранено"""
+        bulk_create = Ad.objects.bulk_create
+        calls = []
+
+        def failing(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) > 1:
+                raise DatabaseError('disk full')
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(Ad.objects, 'bulk_create', failing):
+            response = self.client.post(reverse('import_ads'), {
+                'file': SimpleUploadedFile('ads.jsonl', self._rows(importer.BATCH_SIZE + 1).encode()),
+            })
+
+        self.assertContains(response, 'Импорт прерван ошибкой базы данных')
+        self.assertContains(response, f'создано объявлений: {importer.BATCH_SIZE}')
+        self.assertEqual(Ad.objects.count(), importer.BATCH_SIZE)
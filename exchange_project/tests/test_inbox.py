@@ -0,0 +1,138 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ads import inbox
+from ads.context_processors import proposal_inbox
+from ads.models import Ad, ExchangeProposal, ProposalSummary
+from ads.services import accept_proposal, create_proposal, reject_proposal, remove_ad, remove_proposal
+from ads.taskqueue import run_pending
+
+
+def _summary(user):
+    summary = ProposalSummary.objects.get(pk=user.pk)
+    return (
+        summary.sent_pending, summary.sent_accepted, summary.sent_rejected,
+        summary.received_pending, summary.received_accepted, summary.received_rejected,
+    )
+
+
+class ProposalSummaryTest(TestCase):
+    """Сводка предложений пользователя"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.user3 = User.objects.create_user(username='user3', password='testpass123')
+
+        self.offers = [
+            Ad.objects.create(user=self.user1, title=f'Мое {i}', description='Описание', category='E', condition='N')
+            for i in range(2)
+        ]
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='N')
+
+    def _propose(self, sender, receiver):
+        return create_proposal(ExchangeProposal(user=sender.user, ad_sender=sender, ad_receiver=receiver))
+
+    def test_created_with_user(self):
+        """Новый пользователь сразу получает пустую сводку"""
+        self.assertEqual(_summary(self.user3), (0, 0, 0, 0, 0, 0))
+
+    def test_proposal_events(self):
+        """Создание, принятие, отклонение и удаление меняют сводки обеих сторон"""
+        proposal = self._propose(self.offers[0], self.target)
+        rejected = self._propose(self.offers[1], self.target)
+        self.assertEqual(_summary(self.user1), (2, 0, 0, 0, 0, 0))
+        self.assertEqual(_summary(self.user2), (0, 0, 0, 2, 0, 0))
+        self.assertIsNotNone(ProposalSummary.objects.get(pk=self.user2.pk).last_activity_at)
+
+        reject_proposal(rejected)
+        accept_proposal(proposal)
+        self.assertEqual(_summary(self.user1), (0, 1, 1, 0, 0, 0))
+        self.assertEqual(_summary(self.user2), (0, 0, 0, 0, 1, 1))
+
+        remove_proposal(proposal)
+        self.assertEqual(_summary(self.user2), (0, 0, 0, 0, 0, 1))
+
+        remove_ad(self.offers[1])
+        self.assertEqual(_summary(self.user1), (0, 0, 0, 0, 0, 0))
+        self.assertEqual(_summary(self.user2), (0, 0, 0, 0, 0, 0))
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_missing_row_is_not_counted_twice(self):
+        """
+        Сводка без строки не пересчитывается по таблице: изменения из очереди
+        применяются к пустой строке один раз, а чтение ничего не записывает
+        """
+        ProposalSummary.objects.filter(pk=self.user2.pk).delete()
+        self._propose(self.offers[0], self.target)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(inbox.get_summary(self.user2.pk)['received_pending'], 0)
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['SELECT'])
+
+        run_pending()
+        self.assertEqual(_summary(self.user2), (0, 0, 0, 1, 0, 0))
+
+    def test_precise_invalidation(self):
+        """Событие удаляет из кэша сводки только участников"""
+        for user in (self.user1, self.user2, self.user3):
+            inbox.get_summary(user.pk)
+
+        self._propose(self.offers[0], self.target)
+
+        cache = inbox._cache()
+        self.assertIsNone(cache.get(inbox._key(self.user1.pk)))
+        self.assertIsNone(cache.get(inbox._key(self.user2.pk)))
+        self.assertIsNotNone(cache.get(inbox._key(self.user3.pk)))
+
+    def test_count(self):
+        """Количество для фильтров my_proposals считается по сводке"""
+        self._propose(self.offers[0], self.target)
+        accept_proposal(self._propose(self.offers[1], self.target))
+        summary = inbox.get_summary(self.user1.pk)
+
+        self.assertEqual(inbox.count(summary), 2)
+        self.assertEqual(inbox.count(summary, 'sent', 'A'), 1)
+        self.assertEqual(inbox.count(summary, 'received'), 0)
+        self.assertEqual(inbox.count(summary, '', 'X'), 0)
+
+
+class ProposalInboxContextTest(TestCase):
+    """Значок ожидающих предложений в шапке"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        offer = Ad.objects.create(user=self.user1, title='Мое', description='Описание', category='E', condition='N')
+        target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='N')
+        create_proposal(ExchangeProposal(user=self.user1, ad_sender=offer, ad_receiver=target))
+
+    def test_badge_in_header(self):
+        """Получатель видит число ожидающих предложений на любой странице"""
+        self.client.login(username='user2', password='testpass123')
+        response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.context['total_pending_proposals'], 1)
+        self.assertContains(response, '<span class="badge bg-warning">1</span>', html=True)
+
+    def test_warm_cache_without_queries(self):
+        """С прогретым кэшем сводка не обращается к базе"""
+        request = RequestFactory().get('/')
+        request.user = self.user2
+        inbox.get_summary(self.user2.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(proposal_inbox(request)['total_pending_proposals'], 1)
+
+    def test_anonymous(self):
+        """Анонимному пользователю сводка не нужна"""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        self.assertEqual(proposal_inbox(request), {})
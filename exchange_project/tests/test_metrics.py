@@ -0,0 +1,111 @@
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.urls import reverse
+from ads import metrics
+from ads.models import Ad
+
+
+class RegistryTest(SimpleTestCase):
+    """Реестр метрик и формат Prometheus"""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_histogram_is_cumulative(self):
+        """Бакеты гистограммы накопительные, +Inf равен числу запросов"""
+        self.registry.add_request('index', 'GET', 200, 0.03, 4, 0.002, 0.01)
+        self.registry.add_request('index', 'GET', 200, 0.3, 6, 0.1, 0.05)
+
+        text = self.registry.exposition()
+
+        self.assertIn('ads_request_duration_seconds_bucket{view="index",le="0.025"} 0', text)
+        self.assertIn('ads_request_duration_seconds_bucket{view="index",le="0.05"} 1', text)
+        self.assertIn('ads_request_duration_seconds_bucket{view="index",le="+Inf"} 2', text)
+        self.assertIn('ads_request_duration_seconds_count{view="index"} 2', text)
+        self.assertIn('ads_sql_queries_total{view="index"} 10', text)
+        self.assertIn('ads_responses_total{view="index",method="GET",status="200"} 2', text)
+
+    def test_label_escaping(self):
+        """Кавычки и переводы строк в метках экранируются"""
+        self.registry.add_cache('a"b\nc', 1, 0)
+        self.assertIn('ads_cache_requests_total{cache="a\\"b\\nc",result="hit"} 1', self.registry.exposition())
+
+
+class MetricsMiddlewareTest(TestCase):
+    """Метрики запросов и страница для персонала"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        metrics.registry.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        Ad.objects.create(user=self.user, title='Объявление', description='Описание', category='E', condition='N')
+
+    def test_structured_log(self):
+        """Каждый запрос пишет запись с SQL, шаблонами и кэшами"""
+        self.client.login(username='user1', password='testpass123')
+        self.client.get(reverse('index'))
+
+        with self.assertLogs('ads.metrics', level=logging.INFO) as logs:
+            self.client.get(reverse('index'))
+
+        payload = logs.records[0].metrics
+        self.assertEqual(payload['view'], 'index')
+        self.assertEqual(payload['status'], 200)
+        self.assertGreater(payload['sql_queries'], 0)
+        self.assertGreater(payload['template_ms'], 0)
+        self.assertEqual(payload['cache']['cards_hit'], 1)
+        json.loads(logs.records[0].getMessage().split(': ', 1)[1])
+
+    def test_exposition_for_staff_only(self):
+        """Метрики отдаются только персоналу"""
+        self.client.login(username='user1', password='testpass123')
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('prometheus_metrics')).status_code, 302)
+
+        self.client.login(username='admin', password='testpass123')
+        response = self.client.get(reverse('prometheus_metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('ads_request_duration_seconds_count{view="index"} 1', text)
+        self.assertIn('ads_template_render_seconds_total{view="index"}', text)
+        self.assertIn('ads_cache_requests_total{cache="cards",result="miss"} 1', text)
+
+
+class ProfilingTest(TestCase):
+    """Профилирование запросов по заголовку и по выборке"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.client = Client()
+
+    def _profiles(self):
+        return sorted(path.suffix for path in Path(self.directory.name).iterdir())
+
+    def test_header_with_token(self):
+        """Заголовок с верным токеном сохраняет профиль и возвращает имя файла"""
+        with override_settings(ADS_PROFILE_DIR=self.directory.name, ADS_PROFILE_TOKEN='secret'):
+            self.client.get(reverse('index'), headers={metrics.PROFILE_HEADER: 'wrong'})
+            self.assertEqual(self._profiles(), [])
+
+            response = self.client.get(reverse('index'), headers={metrics.PROFILE_HEADER: 'secret'})
+
+        self.assertEqual(self._profiles(), ['.prof', '.txt'])
+        self.assertTrue(response[metrics.PROFILE_HEADER].endswith('.prof'))
+        report = (Path(self.directory.name) / response[metrics.PROFILE_HEADER]).with_suffix('.txt')
+        self.assertIn('cumulative', report.read_text(encoding='utf-8'))
+
+    def test_sample_rate(self):
+        """Выборка профилирует долю запросов без заголовка"""
+        with override_settings(ADS_PROFILE_DIR=self.directory.name, ADS_PROFILE_SAMPLE_RATE=1):
+            response = self.client.get(reverse('index'))
+
+        self.assertEqual(self._profiles(), ['.prof', '.txt'])
+        self.assertNotIn(metrics.PROFILE_HEADER, response)
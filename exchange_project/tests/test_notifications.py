@@ -0,0 +1,150 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from ads import notifications
+from ads.models import Ad, ExchangeProposal, Notification, Task
+from ads.services import accept_proposal, create_proposal, reject_proposal
+from ads.taskqueue import run_pending
+
+
+class CountingBackend(locmem.EmailBackend):
+    """Почтовый бэкенд, считающий открытые соединения"""
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Почтовый бэкенд, не доставляющий письма на адреса из failing"""
+    failing = set()
+
+    def send_messages(self, messages):
+        if any(message.to[0] in self.failing for message in messages):
+            raise ConnectionError('SMTP недоступен')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='tests.test_notifications.CountingBackend')
+class ProposalNotificationsTest(TestCase):
+    """Уведомления о событиях предложений"""
+
+    def setUp(self):
+        """Настройка тестовых данных: три отправителя предлагают обмен на одно объявление"""
+        CountingBackend.opened = 0
+        self.client = Client()
+        self.receiver = User.objects.create_user(username='receiver', password='testpass123', email='r@example.com')
+        self.target = Ad.objects.create(user=self.receiver, title='Велосипед', description='Описание', category='O', condition='U')
+        self.senders = [
+            User.objects.create_user(username=f'sender{i}', password='testpass123', email=f's{i}@example.com' if i else '')
+            for i in range(3)
+        ]
+        self.proposals = [
+            create_proposal(ExchangeProposal(
+                user=sender, ad_receiver=self.target,
+                ad_sender=Ad.objects.create(user=sender, title=f'Книга {i}', description='Описание', category='B', condition='N'),
+            ))
+            for i, sender in enumerate(self.senders)
+        ]
+        Notification.objects.all().delete()
+        mail.outbox.clear()
+        CountingBackend.opened = 0
+
+    def _messages(self, user):
+        return list(Notification.objects.filter(user=user).values_list('kind', 'message'))
+
+    def test_auto_rejected_senders_are_told(self):
+        """При принятии отправители остальных предложений узнают об автоматическом отклонении"""
+        accept_proposal(self.proposals[1])
+
+        self.assertEqual(self._messages(self.senders[1]), [('accepted', 'Ваше предложение «Книга 1» → «Велосипед» принято')])
+        for sender in (self.senders[0], self.senders[2]):
+            [(kind, message)] = self._messages(sender)
+            self.assertEqual(kind, 'auto_rejected')
+            self.assertIn('уже участвует в принятом обмене', message)
+
+    def test_fan_out_is_one_insert(self):
+        """Уведомления всем получателям записываются одним INSERT"""
+        events = {'accepted': [self.proposals[0].pk], 'auto_rejected': [p.pk for p in self.proposals[1:]]}
+        with override_settings(ADS_TASKS_EAGER=False), CaptureQueriesContext(connection) as queries:
+            notifications.create(events)
+
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "ads_notification"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Notification.objects.count(), 3)
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_request_path_enqueues_one_task(self):
+        """В запросе событие стоит одну задачу, сколько бы предложений ни было отклонено"""
+        accept_proposal(self.proposals[0])
+
+        task = Task.objects.get(name='ads.notify_proposals')
+        self.assertEqual(sorted(task.payload['events']['auto_rejected']), [p.pk for p in self.proposals[1:]])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_digest_over_one_connection(self):
+        """Дайджест: по письму на получателя с почтой, одно SMTP-соединение"""
+        with override_settings(ADS_TASKS_EAGER=False):
+            accept_proposal(self.proposals[1])
+            notifications.create(Task.objects.get(name='ads.notify_proposals').payload['events'])
+
+        self.assertEqual(notifications.send_digests(), 2)
+
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['s1@example.com', 's2@example.com'])
+        self.assertIn('принято', mail.outbox[0].body + mail.outbox[1].body)
+        # Уведомления без почты тоже отмечены, повторный дайджест пуст
+        self.assertFalse(Notification.objects.filter(emailed_at__isnull=True).exists())
+        self.assertEqual(notifications.send_digests(), 0)
+
+    @override_settings(ADS_TASKS_EAGER=False, EMAIL_BACKEND='tests.test_notifications.FailingBackend')
+    def test_failed_batch_keeps_sent_ones(self):
+        """Ошибка в пачке не откатывает отметки уже отправленных: повтор задачи не шлет их снова"""
+        accept_proposal(self.proposals[1])
+        notifications.create(Task.objects.get(name='ads.notify_proposals').payload['events'])
+        Task.objects.filter(name='ads.send_notification_digests').update(run_at=timezone.now())
+
+        with mock.patch.object(notifications, 'DIGEST_BATCH_SIZE', 1), \
+                mock.patch.object(FailingBackend, 'failing', {'s2@example.com'}):
+            run_pending()
+        digest = Task.objects.get(name='ads.send_notification_digests')
+        self.assertEqual((digest.status, digest.attempts), ('Q', 1))
+        self.assertEqual([message.to for message in mail.outbox], [['s1@example.com']])
+        self.assertFalse(Notification.objects.filter(user=self.senders[1], emailed_at__isnull=True).exists())
+
+        Task.objects.filter(name='ads.send_notification_digests').update(run_at=timezone.now())
+        run_pending()
+        self.assertEqual(Task.objects.get(name='ads.send_notification_digests').status, 'D')
+        self.assertEqual([message.to for message in mail.outbox], [['s1@example.com'], ['s2@example.com']])
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_digest_window(self):
+        """События одного окна собираются в одну задачу дайджеста"""
+        notifications.create({'rejected': [self.proposals[0].pk]})
+        notifications.create({'rejected': [self.proposals[1].pk]})
+
+        self.assertEqual(Task.objects.filter(name='ads.send_notification_digests').count(), 1)
+
+    def test_eager_mode_sends_digest(self):
+        """В тестовом (eager) режиме письмо уходит сразу"""
+        reject_proposal(self.proposals[2])
+
+        self.assertEqual([message.to for message in mail.outbox], [['s2@example.com']])
+
+    def test_page_marks_read(self):
+        """Страница уведомлений показывает их и отмечает прочитанными"""
+        reject_proposal(self.proposals[1])
+        self.client.login(username='sender1', password='testpass123')
+
+        response = self.client.get(reverse('notifications'))
+
+        self.assertContains(response, 'Ваше предложение «Книга 1» → «Велосипед» отклонено')
+        self.assertFalse(Notification.objects.filter(user=self.senders[1], read_at__isnull=True).exists())
@@ -0,0 +1,148 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from ads.models import Ad, ExchangeProposal
+from ads.pagination import CursorPaginator, InvalidCursor
+from ads.services import create_proposal
+
+
+class CursorPaginatorTest(TestCase):
+    """Тесты курсорной пагинации"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='testpass123'
+        )
+
+        for i in range(25):
+            Ad.objects.create(
+                user=self.user,
+                title=f'Объявление {i}',
+                description=f'Описание {i}',
+                category='E',
+                condition='N'
+            )
+
+        # Половина объявлений с одинаковой датой — порядок решает id
+        Ad.objects.filter(pk__in=list(Ad.objects.values_list('pk', flat=True)[:12])).update(
+            created_at=timezone.now()
+        )
+        self.expected = list(Ad.objects.order_by('-created_at', '-id'))
+
+    def test_walk_forward_and_back(self):
+        """Проход по всем страницам вперед и назад без пропусков и повторов"""
+        paginator = CursorPaginator(Ad.objects.all(), 10)
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([ad for page in pages for ad in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(list(previous), self.expected[10:20])
+        self.assertTrue(previous.has_previous())
+
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual(list(first), self.expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_no_count_and_no_offset(self):
+        """Курсорная страница — один запрос без COUNT и OFFSET"""
+        paginator = CursorPaginator(Ad.objects.all(), 10)
+        cursor = paginator.page().next_cursor
+
+        with CaptureQueriesContext(connection) as queries:
+            list(paginator.page(cursor))
+
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_invalid_cursor(self):
+        """Испорченный токен вызывает InvalidCursor"""
+        paginator = CursorPaginator(Ad.objects.all(), 10)
+
+        for cursor in ['abc', 'W10', 'WyJ4IixbXV0']:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_ranked_search_pagination(self):
+        """Курсор работает с сортировкой по релевантности"""
+        paginator = CursorPaginator(
+            Ad.objects.search('Объявление'), 10, ('-search_rank', '-created_at', '-id')
+        )
+
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+
+        seen = [ad.pk for page in (first, second, third) for ad in page]
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+
+class CursorPaginationViewsTest(TestCase):
+    """Тесты курсорной пагинации в представлениях"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+        self.target = Ad.objects.create(
+            user=self.user2, title='Цель', description='Описание', category='B', condition='N'
+        )
+        for i in range(12):
+            ad = Ad.objects.create(
+                user=self.user1, title=f'Объявление {i}', description='Описание', category='E', condition='N'
+            )
+            create_proposal(ExchangeProposal(user=self.user1, ad_sender=ad, ad_receiver=self.target))
+
+        self.client.login(username='user1', password='testpass123')
+
+    def test_index_uses_cursor_by_default(self):
+        """Главная страница по умолчанию отдает курсорные ссылки"""
+        response = self.client.get(reverse('index'), {'category': 'E'})
+
+        page = response.context['ads']
+        self.assertEqual(len(page), 10)
+        self.assertEqual(response.context['total_results'], 12)
+        self.assertContains(response, f'cursor={page.next_cursor}')
+        self.assertContains(response, 'category=E')
+
+        response = self.client.get(reverse('index'), {'category': 'E', 'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['ads']), 2)
+
+    def test_index_invalid_cursor_shows_first_page(self):
+        """Некорректный курсор показывает первую страницу"""
+        response = self.client.get(reverse('index'), {'cursor': 'garbage'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['ads']), 10)
+
+    def test_page_numbers_are_opt_in(self):
+        """Номера страниц включаются параметром page и дают общее количество"""
+        response = self.client.get(reverse('my_proposals'), {'page': 1})
+
+        self.assertEqual(response.context['total_proposals'], 12)
+        self.assertEqual(response.context['proposals'].paginator.num_pages, 2)
+
+    def test_my_proposals_cursor(self):
+        """Список предложений листается курсором"""
+        response = self.client.get(reverse('my_proposals'), {'type': 'sent'})
+        page = response.context['proposals']
+
+        response = self.client.get(reverse('my_proposals'), {'type': 'sent', 'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['proposals']), 2)
@@ -0,0 +1,169 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ads import inbox
+from ads.models import Ad, ExchangeProposal
+from ads.services import create_proposal
+
+
+class ProposalListingQueriesTest(TestCase):
+    """Тесты отсутствия N+1 запросов в списках предложений"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+
+        self.target = Ad.objects.create(
+            user=self.user2, title='Цель', description='Описание цели', category='B', condition='N'
+        )
+
+    def _create_proposals(self, count):
+        for i in range(count):
+            ad = Ad.objects.create(
+                user=self.user1, title=f'Объявление {i}', description='Описание', category='E', condition='N'
+            )
+            ExchangeProposal.objects.create(
+                user=self.user1, ad_sender=ad, ad_receiver=self.target, comment=f'Комментарий {i}'
+            )
+        inbox.rebuild([self.user1.pk, self.user2.pk])
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_for_listing_loads_related_in_one_query(self):
+        """for_listing загружает обе стороны и их авторов одним запросом"""
+        self._create_proposals(3)
+
+        with self.assertNumQueries(1):
+            rows = [
+                (p.ad_sender.title, p.ad_receiver.title, p.ad_sender.user.username,
+                 p.ad_receiver.user.username, p.comment_preview)
+                for p in ExchangeProposal.objects.for_listing()
+            ]
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][4], 'Комментарий 2')
+
+    def test_for_listing_defers_text(self):
+        """Большие текстовые колонки не загружаются"""
+        self._create_proposals(1)
+        proposal = ExchangeProposal.objects.for_listing().get()
+
+        deferred = proposal.get_deferred_fields()
+        self.assertIn('comment', deferred)
+        self.assertIn('description', proposal.ad_sender.get_deferred_fields())
+        self.assertNotIn('comment', ExchangeProposal.objects.for_listing(with_text=True).get().get_deferred_fields())
+
+    def test_my_proposals_query_count_is_constant(self):
+        """Число запросов my_proposals не зависит от числа предложений"""
+        self.client.login(username='user1', password='testpass123')
+
+        self._create_proposals(1)
+        one = self._count_queries(reverse('my_proposals'))
+
+        self._create_proposals(9)
+        ten = self._count_queries(reverse('my_proposals'))
+
+        self.assertEqual(one, ten)
+
+    def test_proposal_detail_query_count(self):
+        """Страница предложения не делает ленивых догрузок"""
+        self._create_proposals(1)
+        proposal = ExchangeProposal.objects.get()
+        self.client.login(username='user2', password='testpass123')
+        inbox.get_summary(self.user2.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('proposal_detail', kwargs={'pk': proposal.pk}))
+
+        self.assertContains(response, 'Комментарий 0')
+        proposal_queries = [q for q in queries if 'ads_' in q['sql']]
+        self.assertEqual(len(proposal_queries), 1)
+
+    def test_admin_changelist_query_count_is_constant(self):
+        """Список предложений в админке не делает запрос на каждую строку"""
+        self.client.login(username='admin', password='testpass123')
+        url = reverse('admin:ads_exchangeproposal_changelist')
+
+        self._create_proposals(1)
+        one = self._count_queries(url)
+
+        self._create_proposals(9)
+        ten = self._count_queries(url)
+
+        self.assertEqual(one, ten)
+
+
+class ProposalReceiverUserTest(TestCase):
+    """Автор объявления-получателя в самом предложении"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+
+        self.ad1 = Ad.objects.create(user=self.user1, title='Мое', description='Описание', category='E', condition='N')
+        self.ad2 = Ad.objects.create(user=self.user2, title='Чужое', description='Описание', category='B', condition='N')
+
+    def test_filled_on_save(self):
+        """receiver_user заполняется при создании и при смене объявления-получателя"""
+        proposal = ExchangeProposal.objects.create(user=self.user1, ad_sender_id=self.ad1.pk, ad_receiver_id=self.ad2.pk)
+        self.assertEqual(proposal.receiver_user_id, self.user2.pk)
+
+        proposal.ad_receiver = self.ad1
+        proposal.save()
+        self.assertEqual(ExchangeProposal.objects.get(pk=proposal.pk).receiver_user_id, self.user1.pk)
+
+    def test_my_proposals_all_pages(self):
+        """Все предложения листаются курсором в порядке даты без пропусков"""
+        for i in range(7):
+            create_proposal(ExchangeProposal(user=self.user1, ad_sender=self.ad1, ad_receiver=self.ad2))
+            create_proposal(ExchangeProposal(user=self.user2, ad_sender=self.ad2, ad_receiver=self.ad1))
+        self.client.login(username='user1', password='testpass123')
+
+        seen = []
+        params = {}
+        while True:
+            page = self.client.get(reverse('my_proposals'), params).context['proposals']
+            seen.extend(proposal.pk for proposal in page)
+            if not page.has_next():
+                break
+            params = {'cursor': page.next_cursor}
+
+        expected = ExchangeProposal.objects.order_by('-created_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_admin_reassigns_received(self):
+        """Смена автора объявления в админке переносит полученные предложения"""
+        create_proposal(ExchangeProposal(user=self.user1, ad_sender=self.ad1, ad_receiver=self.ad2))
+        self.client.login(username='admin', password='testpass123')
+
+        self.client.post(reverse('admin:ads_ad_change', args=[self.ad2.pk]), {
+            'user': self.admin.pk, 'title': 'Чужое', 'description': 'Описание', 'category': 'B', 'condition': 'N',
+        })
+
+        self.assertEqual(ExchangeProposal.objects.get().receiver_user_id, self.admin.pk)
+        self.assertEqual(inbox.get_summary(self.admin.pk)['received_pending'], 1)
+        self.assertEqual(inbox.get_summary(self.user2.pk)['received_pending'], 0)
+
+    def test_benchmark_command(self):
+        """Команда сравнения стратегий сверяет страницы и откатывает данные"""
+        out = StringIO()
+        call_command('benchmark_proposals', '--proposals', '300', '--users', '5', '--sample', '2', stdout=out)
+
+        self.assertIn('or_join', out.getvalue())
+        self.assertFalse(ExchangeProposal.objects.exists())
@@ -0,0 +1,187 @@
+import logging
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.urls import reverse
+from ads import thumbnails, urls as ads_urls
+from ads.decorators import query_budget
+from ads.middleware import QueryBudgetExceeded, QueryBudgetMiddleware, fingerprint
+from ads.models import Ad, ExchangeProposal
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    """Тесты middleware бюджета SQL-запросов"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        for i in range(5):
+            Ad.objects.create(user=self.user, title=f'Объявление {i}', description='Описание', category='E', condition='N')
+
+    def _run(self, max_queries, max_time_ms=None):
+        """Выполняет N+1-представление через middleware с заданным бюджетом"""
+        @query_budget(max_queries, max_time_ms)
+        def view(request):
+            titles = [ad.user.username for ad in Ad.objects.all()]
+            return HttpResponse(len(titles))
+
+        middleware = QueryBudgetMiddleware(lambda request: view(request))
+        request = self.factory.get('/')
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_within_budget(self):
+        """Представление в рамках бюджета отрабатывает"""
+        self.assertEqual(self._run(6).status_code, 200)
+
+    def test_exceeded_budget_raises_in_test_mode(self):
+        """В тестах превышение бюджета — исключение с отпечатками запросов"""
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            self._run(2)
+
+        self.assertIn('6 запросов при бюджете 2', str(context.exception))
+        self.assertIn('"count": 5', str(context.exception))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_exceeded_budget_logs_in_production(self):
+        """В продакшене превышение пишется структурированным предупреждением"""
+        with self.assertLogs('ads.query_budget', level=logging.WARNING) as logs:
+            response = self._run(2, max_time_ms=0)
+
+        self.assertEqual(response.status_code, 200)
+        payload = logs.records[0].query_budget
+        self.assertEqual(payload['queries'], 6)
+        self.assertEqual(payload['max_queries'], 2)
+        self.assertEqual(payload['fingerprints'][0]['count'], 5)
+
+    def test_fingerprint(self):
+        """Литералы и списки IN нормализуются"""
+        self.assertEqual(
+            fingerprint("SELECT *  FROM t WHERE a = 'x' AND b = 10 AND c IN (%s, %s, %s)"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)',
+        )
+
+
+class URLQueryBudgetsTest(TestCase):
+    """Каждый URL ads.urls объявляет бюджет и укладывается в него"""
+
+    def setUp(self):
+        """Настройка тестовых данных: по 15 объявлений и предложений"""
+        self.client = Client()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+
+        self.ads1 = [
+            Ad.objects.create(user=self.user1, title=f'Объявление {i}', description='Описание ' * 30,
+                              category='E', condition='N', image_url='https://example.com/a.jpg')
+            for i in range(15)
+        ]
+        self.ads2 = [
+            Ad.objects.create(user=self.user2, title=f'Товар {i}', description='Описание', category='C', condition='U')
+            for i in range(15)
+        ]
+        self.proposals = [
+            ExchangeProposal.objects.create(user=self.user1, ad_sender=ad, ad_receiver=self.ads2[0], comment='Давай')
+            for ad in self.ads1
+        ]
+
+    def _scenarios(self):
+        ad = self.ads1[0]
+        other = self.ads2[1]
+        proposal = self.proposals[0]
+        ad_data = {'title': 'Новое', 'description': 'Описание', 'category': 'F', 'condition': 'U'}
+        return {
+            'index': [
+                ('user1', 'get', reverse('index'), {}),
+                ('user1', 'get', reverse('index'), {'category': 'E', 'condition': 'N'}),
+                ('user1', 'get', reverse('index'), {'page': 2}),
+            ],
+            'search': [('user1', 'get', reverse('search'), {'search': 'Объявление'})],
+            'ad_detail': [
+                ('user1', 'get', reverse('ad_detail', kwargs={'pk': other.pk}), {}),
+                ('user1', 'post', reverse('ad_detail', kwargs={'pk': other.pk}), {'ad_sender': ad.pk, 'comment': 'Обмен'}),
+            ],
+            'create_ad': [
+                ('user1', 'get', reverse('create_ad'), {}),
+                ('user1', 'post', reverse('create_ad'), ad_data),
+            ],
+            'edit_ad': [
+                ('user1', 'get', reverse('edit_ad', kwargs={'pk': ad.pk}), {}),
+                ('user1', 'post', reverse('edit_ad', kwargs={'pk': ad.pk}), ad_data),
+            ],
+            'delete_ad': [
+                ('user1', 'get', reverse('delete_ad', kwargs={'pk': self.ads1[1].pk}), {}),
+                ('user1', 'post', reverse('delete_ad', kwargs={'pk': self.ads1[1].pk}), {}),
+            ],
+            'import_ads': [
+                ('user1', 'get', reverse('import_ads'), {}),
+                ('user1', 'post', reverse('import_ads'), {'file': SimpleUploadedFile(
+                    'ads.jsonl', b'{"title": "A", "description": "B", "category": "E", "condition": "N"}\n' * 3
+                )}),
+            ],
+            'export_data': [('admin', 'get', reverse('export_data', kwargs={'dataset': 'ads'}), {})],
+            'db_pool_stats': [('admin', 'get', reverse('db_pool_stats'), {})],
+            'prometheus_metrics': [('admin', 'get', reverse('prometheus_metrics'), {})],
+            'thumbnail': [
+                (None, 'get', reverse('thumbnail', kwargs={
+                    'key': thumbnails.source_key('https://example.com/a.jpg'), 'variant': 'card.webp',
+                }), {}),
+            ],
+            'signup': [
+                (None, 'get', reverse('signup'), {}),
+                (None, 'post', reverse('signup'), {
+                    'username': 'newuser', 'password1': 'Sl0zhnyi-parol', 'password2': 'Sl0zhnyi-parol',
+                }),
+            ],
+            'my_proposals': [
+                ('user1', 'get', reverse('my_proposals'), {}),
+                ('user1', 'get', reverse('my_proposals'), {'type': 'sent', 'status': 'P'}),
+                ('user2', 'get', reverse('my_proposals'), {'type': 'received'}),
+            ],
+            'proposal_detail': [
+                ('user2', 'get', reverse('proposal_detail', kwargs={'pk': proposal.pk}), {}),
+            ],
+            'delete_proposal': [
+                ('user1', 'get', reverse('delete_proposal', kwargs={'pk': self.proposals[2].pk}), {}),
+                ('user1', 'post', reverse('delete_proposal', kwargs={'pk': self.proposals[2].pk}), {}),
+            ],
+            'barter_cycles': [('user1', 'get', reverse('barter_cycles'), {})],
+            'notifications': [('user1', 'get', reverse('notifications'), {})],
+            'update_proposal_status': [
+                ('user2', 'post', reverse('update_proposal_status', kwargs={'pk': proposal.pk}), {'status': 'A'}),
+            ],
+            'api_ad_list': [
+                ('user1', 'get', reverse('api_ad_list'), {}),
+                ('user1', 'get', reverse('api_ad_list'), {'search': 'Объявление', 'category': 'E'}),
+            ],
+            'api_ad_detail': [('user1', 'get', reverse('api_ad_detail', kwargs={'pk': ad.pk}), {})],
+            'api_proposal_list': [
+                ('user1', 'get', reverse('api_proposal_list'), {}),
+                ('user2', 'get', reverse('api_proposal_list'), {'type': 'received', 'status': 'P'}),
+            ],
+        }
+
+    def test_every_url_declares_budget(self):
+        """У каждого представления ads.urls объявлен бюджет"""
+        for pattern in ads_urls.urlpatterns:
+            with self.subTest(url=pattern.name):
+                self.assertIsNotNone(getattr(pattern.callback, 'query_budget', None))
+
+    def test_every_url_within_budget(self):
+        """Все сценарии укладываются в бюджеты (превышение — QueryBudgetExceeded)"""
+        scenarios = self._scenarios()
+        self.assertEqual(set(scenarios), {pattern.name for pattern in ads_urls.urlpatterns})
+
+        for name, requests in scenarios.items():
+            for username, method, url, data in requests:
+                with self.subTest(url=name, method=method, data=data):
+                    self.client.logout()
+                    if username:
+                        self.client.login(username=username, password='testpass123')
+                    response = getattr(self.client, method)(url, data)
+                    self.assertIn(response.status_code, (200, 302))
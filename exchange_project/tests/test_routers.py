@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ads.models import Ad
+from ads.routers import ReplicaRouter, replica_reads, watch_writes
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    """Выбор базы для чтения"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_primary_outside_requests(self):
+        """Вне replica_reads (команды, фоновые задачи) чтение идет в основную базу"""
+        self.assertIsNone(self.router.db_for_read(Ad))
+
+    def test_primary_inside_transaction(self):
+        """Внутри транзакции основной базы (здесь — транзакция теста) реплики не используются"""
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Ad))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaChoiceTest(SimpleTestCase):
+    """Выбор реплики"""
+
+    def test_one_replica_per_request(self):
+        """Все чтения одного запроса идут на одну реплику"""
+        router = ReplicaRouter()
+        for _ in range(10):
+            with replica_reads():
+                reads = {router.db_for_read(Ad) for _ in range(10)}
+            self.assertEqual(len(reads), 1)
+            self.assertIn(reads.pop(), settings.DATABASE_REPLICAS)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    """Чтение с реплик и закрепление за основной базой после записи"""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.router = ReplicaRouter()
+        self.client = Client()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.ad = Ad.objects.create(user=self.user, title='Объявление', description='Описание', category='E', condition='N')
+        self.client.login(username='user1', password='testpass123')
+
+    def _get(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        return response, len(replica)
+
+    def test_router(self):
+        """Чтение с реплики, после записи — из основной базы"""
+        with replica_reads() as state, watch_writes(state):
+            self.assertEqual(self.router.db_for_read(Ad), 'replica')
+            ad = Ad.objects.get(pk=self.ad.pk)
+            self.assertEqual(ad._state.db, 'replica')
+            self.assertFalse(state.wrote)
+
+            ad.title = 'Новое название'
+            ad.save()
+            self.assertTrue(state.wrote)
+            self.assertIsNone(self.router.db_for_read(Ad))
+
+        with replica_reads(enabled=False):
+            self.assertIsNone(self.router.db_for_read(Ad))
+
+        with replica_reads(), transaction.atomic():
+            self.assertIsNone(self.router.db_for_read(Ad))
+
+    def test_safe_requests_read_replica(self):
+        """Страницы чтения идут на реплику и не закрепляют пользователя"""
+        for url in [reverse('index'), reverse('ad_detail', kwargs={'pk': self.ad.pk}), reverse('my_proposals')]:
+            with self.subTest(url=url):
+                response, replica_queries = self._get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(replica_queries, 0)
+                self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_to_primary(self):
+        """После записи следующие чтения идут в основную базу"""
+        response = self.client.post(reverse('edit_ad', kwargs={'pk': self.ad.pk}), {
+            'title': 'Новое название', 'description': 'Описание', 'category': 'E', 'condition': 'N',
+        })
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        response, replica_queries = self._get(reverse('ad_detail', kwargs={'pk': self.ad.pk}))
+        self.assertContains(response, 'Новое название')
+        self.assertEqual(replica_queries, 0)
+
+    def test_invalid_form_does_not_pin(self):
+        """Небезопасный запрос без записи не закрепляет пользователя"""
+        response = self.client.post(reverse('create_ad'), {'title': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
@@ -0,0 +1,97 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from ads.models import Ad
+from ads.search import FTS_TRIGGERS, ensure_search_backend, fts_match_expression
+
+
+class SearchTest(TestCase):
+    """Тесты полнотекстового поиска по объявлениям"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='testpass123'
+        )
+
+        self.title_match = Ad.objects.create(
+            user=self.user,
+            title='Велосипед горный',
+            description='Почти новый',
+            category='O',
+            condition='U'
+        )
+
+        self.description_match = Ad.objects.create(
+            user=self.user,
+            title='Шлем',
+            description='Подходит для велосипед прогулок',
+            category='O',
+            condition='N'
+        )
+
+        self.english = Ad.objects.create(
+            user=self.user,
+            title='Phones',
+            description='Two running phones',
+            category='E',
+            condition='U'
+        )
+
+    def test_search_ranks_title_above_description(self):
+        """Совпадение в заголовке ранжируется выше совпадения в описании"""
+        results = list(Ad.objects.search('велосипед'))
+
+        self.assertEqual(results, [self.title_match, self.description_match])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_search_english_stemming(self):
+        """Английские слова находятся по основе"""
+        self.assertEqual(list(Ad.objects.search('phone run')), [self.english])
+
+    def test_search_tracks_updates_and_deletes(self):
+        """Индекс поддерживается при изменении и удалении объявлений"""
+        self.english.title = 'Laptop'
+        self.english.description = 'Old laptop'
+        self.english.save()
+
+        self.assertEqual(list(Ad.objects.search('phones')), [])
+        self.assertEqual(list(Ad.objects.search('laptop')), [self.english])
+
+        self.english.delete()
+        self.assertEqual(list(Ad.objects.search('laptop')), [])
+
+    def test_search_ignores_query_syntax(self):
+        """Спецсимволы FTS в запросе не ломают поиск"""
+        self.assertEqual(fts_match_expression('"велосипед" OR (шлем*'), '"велосипед"* "OR"* "шлем"*')
+        self.assertEqual(list(Ad.objects.search('!!! ***')), [])
+        self.assertEqual(Ad.objects.search('').count(), 3)
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='FTS5 используется только в SQLite')
+class SQLiteSearchBackendTest(TestCase):
+    """Тесты восстановления FTS5-триггеров"""
+
+    def test_ensure_search_backend_restores_triggers(self):
+        """Пропавшие после пересоздания таблицы триггеры восстанавливаются"""
+        user = User.objects.create_user(username='user1', password='testpass123')
+
+        with connection.cursor() as cursor:
+            for trigger in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+
+        ad = Ad.objects.create(
+            user=user,
+            title='Комод',
+            description='Дубовый',
+            category='F',
+            condition='U'
+        )
+        self.assertEqual(list(Ad.objects.search('комод')), [])
+
+        ensure_search_backend(connection)
+
+        self.assertEqual(list(Ad.objects.search('комод')), [ad])
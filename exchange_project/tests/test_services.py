@@ -0,0 +1,254 @@
+import threading
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ads.models import Ad, ExchangeProposal
+from ads import fragments
+from ads.services import (
+    ProposalConflict, accept_proposal, create_proposal, reconcile_counters, reject_proposal,
+    remove_ad, remove_ads, remove_user_ads,
+)
+
+
+def _statuses(proposals):
+    return [ExchangeProposal.objects.get(pk=proposal.pk).status for proposal in proposals]
+
+
+class AcceptProposalTest(TestCase):
+    """Тесты принятия и отклонения предложений"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+        self.offer = Ad.objects.create(user=self.user1, title='Мое', description='Описание', category='E', condition='N')
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='N')
+        self.other_target = Ad.objects.create(
+            user=self.user2, title='Другая цель', description='Описание', category='B', condition='N'
+        )
+        self.other_offer = Ad.objects.create(
+            user=self.user1, title='Другое', description='Описание', category='E', condition='N'
+        )
+
+        self.proposal = ExchangeProposal.objects.create(user=self.user1, ad_sender=self.offer, ad_receiver=self.target)
+        # Конкуренты: то же объявление-получатель и то же объявление-отправитель
+        self.same_receiver = ExchangeProposal.objects.create(
+            user=self.user1, ad_sender=self.other_offer, ad_receiver=self.target
+        )
+        self.same_sender = ExchangeProposal.objects.create(
+            user=self.user1, ad_sender=self.offer, ad_receiver=self.other_target
+        )
+        self.unrelated = ExchangeProposal.objects.create(
+            user=self.user1, ad_sender=self.other_offer, ad_receiver=self.other_target
+        )
+
+    def test_accept_rejects_competitors(self):
+        """Принятие отклоняет ожидающие предложения по обоим объявлениям"""
+        rejected = accept_proposal(self.proposal)
+
+        self.assertEqual(rejected, 2)
+        self.assertEqual(
+            _statuses([self.proposal, self.same_receiver, self.same_sender, self.unrelated]),
+            ['A', 'R', 'R', 'P'],
+        )
+
+    @override_settings(ADS_TASKS_EAGER=False)
+    def test_accept_is_single_update(self):
+        """Блокировки, один UPDATE предложений и по INSERT задачи на счетчики и на уведомления"""
+        with CaptureQueriesContext(connection) as queries:
+            accept_proposal(self.proposal)
+
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'SELECT', 'UPDATE', 'INSERT', 'INSERT'])
+
+    def test_accept_applies_changes(self):
+        """Задача счетчиков блокирует строки и пересчитывает счетчики одним UPDATE, сводки — одним INSERT"""
+        with CaptureQueriesContext(connection) as queries:
+            accept_proposal(self.proposal)
+
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        # Запрос: блокировки и UPDATE предложений; задача: блокировки, пересчет счетчиков и сводок
+        self.assertEqual(statements[:3], ['SELECT', 'SELECT', 'UPDATE'])
+        self.assertEqual(
+            statements[3:11], ['SELECT', 'SELECT', 'SELECT', 'UPDATE', 'SELECT', 'SELECT', 'SELECT', 'INSERT'],
+        )
+
+    def test_accept_processed_proposal_conflicts(self):
+        """Отклоненное предложение нельзя принять, остальные не меняются"""
+        accept_proposal(self.same_receiver)
+
+        with self.assertRaises(ProposalConflict):
+            accept_proposal(self.proposal)
+
+        self.assertEqual(_statuses([self.proposal, self.same_sender]), ['R', 'P'])
+
+    def test_reject(self):
+        """Отклонение меняет только ожидающее предложение"""
+        reject_proposal(self.proposal)
+        self.assertEqual(_statuses([self.proposal, self.same_receiver]), ['R', 'P'])
+
+        with self.assertRaises(ProposalConflict):
+            reject_proposal(self.proposal)
+
+    def test_view_reports_conflict(self):
+        """Повторное принятие через представление показывает ошибку"""
+        client = Client()
+        client.login(username='user2', password='testpass123')
+        accept_proposal(self.same_receiver)
+
+        response = client.post(
+            reverse('update_proposal_status', kwargs={'pk': self.proposal.pk}), {'status': 'A'}, follow=True
+        )
+
+        self.assertContains(response, 'Предложение уже обработано.')
+        self.assertEqual(_statuses([self.proposal]), ['R'])
+
+
+
+class RemoveAdsTest(TestCase):
+    """Тесты удаления объявлений вместе с предложениями"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+        self.ads1 = [
+            Ad.objects.create(user=self.user1, title=f'Мое {i}', description='Описание', category='E', condition='N')
+            for i in range(3)
+        ]
+        self.ad2 = Ad.objects.create(user=self.user2, title='Чужое', description='Описание', category='B', condition='N')
+        self.other = Ad.objects.create(user=self.user2, title='Другое', description='Описание', category='B', condition='N')
+
+        for ad in self.ads1:
+            ExchangeProposal.objects.create(user=self.user1, ad_sender=ad, ad_receiver=self.ad2)
+        ExchangeProposal.objects.create(user=self.user2, ad_sender=self.ad2, ad_receiver=self.ads1[0])
+        self.kept = ExchangeProposal.objects.create(user=self.user2, ad_sender=self.other, ad_receiver=self.ad2)
+
+    def test_remove_ad(self):
+        """Объявление и его предложения удаляются двумя DELETE (цепочек обмена с ними нет), счетчики вторых сторон и сводки пересчитываются"""
+        fragments.render_cards([self.ads1[0]])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(remove_ad(self.ads1[0]), (1, 2))
+
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements[:4], ['SELECT', 'SELECT', 'DELETE', 'DELETE'])
+        self.assertEqual(statements[4:], ['SELECT', 'SELECT', 'SELECT', 'UPDATE', 'SELECT', 'SELECT', 'SELECT', 'INSERT'])
+        self.assertFalse(Ad.objects.filter(pk=self.ads1[0].pk).exists())
+        self.assertEqual(ExchangeProposal.objects.count(), 3)
+        self.assertIsNone(fragments._cache().get(fragments.card_key(self.ads1[0])))
+
+    def test_remove_user_ads(self):
+        """Массовое удаление всех объявлений пользователя"""
+        self.assertEqual(remove_user_ads(self.user1), (3, 4))
+
+        self.assertEqual(list(Ad.objects.order_by('pk')), [self.ad2, self.other])
+        self.assertEqual(list(ExchangeProposal.objects.all()), [self.kept])
+
+    def test_delete_user(self):
+        """Удаление пользователя удаляет его объявления и пересчитывает счетчики второй стороны"""
+        reconcile_counters()
+        self.assertEqual(Ad.objects.get(pk=self.ad2.pk).received_pending_count, 4)
+
+        self.user1.delete()
+
+        self.assertEqual(list(Ad.objects.order_by('pk')), [self.ad2, self.other])
+        self.assertEqual(list(ExchangeProposal.objects.all()), [self.kept])
+        ad2 = Ad.objects.get(pk=self.ad2.pk)
+        self.assertEqual((ad2.received_pending_count, ad2.sent_count), (1, 0))
+
+    def test_remove_ads_in_batches(self):
+        """Большие наборы удаляются пачками"""
+        with mock.patch('ads.services.DELETE_BATCH_SIZE', 2):
+            self.assertEqual(remove_ads(Ad.objects.exclude(pk=self.other.pk)), (4, 5))
+
+        self.assertEqual(list(Ad.objects.all()), [self.other])
+        self.assertFalse(ExchangeProposal.objects.exists())
+
+
+def run_concurrently(func, args_list):
+    """
+    Запускает func(*args) в отдельных потоках одновременно (через барьер).
+    Возвращает список результатов или исключений в порядке args_list.
+    """
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def worker(index, args):
+        try:
+            barrier.wait()
+            results[index] = func(*args)
+        except Exception as exc:
+            results[index] = exc
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.mark.integration
+class ConcurrentAcceptTest(TransactionTestCase):
+    """
+    Параллельные принятия предложений.
+
+    Нужна база с настоящими параллельными подключениями:
+    ADS_TEST_DATABASE=sqlite-file или ADS_TEST_DATABASE=postgresql.
+    """
+
+    THREADS = 8
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('нужна файловая SQLite или PostgreSQL (ADS_TEST_DATABASE)')
+
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+
+    def _ad(self, user, title):
+        return Ad.objects.create(user=user, title=title, description='Описание', category='E', condition='N')
+
+    def _accept(self, pk):
+        accept_proposal(ExchangeProposal.objects.get(pk=pk))
+        return 'A'
+
+    def _assert_single_winner(self, proposals):
+        results = run_concurrently(self._accept, [(proposal.pk,) for proposal in proposals])
+
+        self.assertEqual(results.count('A'), 1, results)
+        self.assertTrue(all(isinstance(result, ProposalConflict) for result in results if result != 'A'), results)
+        self.assertEqual(sorted(_statuses(proposals)), ['A'] + ['R'] * (len(proposals) - 1))
+        # Счетчики объявлений совпадают с таблицей предложений
+        self.assertEqual(reconcile_counters(dry_run=True), 0)
+
+    def test_same_receiver(self):
+        """Из предложений на одно объявление принимается ровно одно"""
+        target = self._ad(self.user2, 'Цель')
+        proposals = [
+            create_proposal(ExchangeProposal(user=self.user1, ad_sender=self._ad(self.user1, f'Мое {i}'), ad_receiver=target))
+            for i in range(self.THREADS)
+        ]
+
+        self._assert_single_winner(proposals)
+
+    def test_same_sender(self):
+        """Одно объявление-отправитель не обменивается дважды"""
+        offer = self._ad(self.user1, 'Мое')
+        proposals = [
+            create_proposal(ExchangeProposal(user=self.user1, ad_sender=offer, ad_receiver=self._ad(self.user2, f'Цель {i}')))
+            for i in range(self.THREADS)
+        ]
+
+        self._assert_single_winner(proposals)
@@ -0,0 +1,265 @@
+import asyncio
+import json
+from io import StringIO
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from ads import events, streams
+from ads.models import Ad, ExchangeProposal
+from ads.services import accept_proposal, create_proposal, remove_proposal
+
+
+class RecordingBroker(events.InProcessBroker):
+    """Брокер, запоминающий опубликованные события"""
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, messages):
+        self.published.append(messages)
+        super().publish(messages)
+
+
+class BrokerTestMixin:
+    def setUp(self):
+        super().setUp()
+        events._broker = None
+        self.addCleanup(setattr, events, '_broker', None)
+
+
+@override_settings(ADS_EVENTS_BROKER='tests.test_streams.RecordingBroker')
+class ProposalEventsTest(BrokerTestMixin, TestCase):
+    """Публикация изменений предложений"""
+
+    def setUp(self):
+        """Настройка тестовых данных: два отправителя предлагают обмен на одно объявление"""
+        super().setUp()
+        self.receiver = User.objects.create_user(username='receiver', password='testpass123')
+        self.target = Ad.objects.create(user=self.receiver, title='Велосипед', description='Описание', category='O', condition='U')
+        self.senders = [User.objects.create_user(username=f'sender{i}', password='testpass123') for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.proposals = [
+                create_proposal(ExchangeProposal(
+                    user=sender, ad_receiver=self.target,
+                    ad_sender=Ad.objects.create(user=sender, title=f'Книга {i}', description='Описание', category='B', condition='N'),
+                ))
+                for i, sender in enumerate(self.senders)
+            ]
+        self.broker = events.broker()
+
+    def test_created_proposal_is_published_to_both_users(self):
+        """Новое предложение видят отправитель и получатель"""
+        event = {'proposal': self.proposals[0].pk, 'status': 'P'}
+        self.assertEqual(self.broker.published[0], {self.senders[0].pk: [event], self.receiver.pk: [event]})
+
+    def test_accept_is_published_after_commit(self):
+        """Принятие и автоматическое отклонение публикуются одной пачкой после COMMIT"""
+        self.broker.published.clear()
+        with self.captureOnCommitCallbacks() as callbacks:
+            accept_proposal(self.proposals[1])
+            self.assertEqual(self.broker.published, [])
+        for callback in callbacks:
+            callback()
+
+        [messages] = self.broker.published
+        accepted = {'proposal': self.proposals[1].pk, 'status': 'A'}
+        rejected = {'proposal': self.proposals[0].pk, 'status': 'R'}
+        self.assertEqual(messages[self.senders[1].pk], [accepted])
+        self.assertEqual(messages[self.senders[0].pk], [rejected])
+        self.assertCountEqual(messages[self.receiver.pk], [accepted, rejected])
+
+    def test_removed_proposal_has_no_status(self):
+        """Удаленное предложение публикуется со статусом null"""
+        self.broker.published.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_proposal(self.proposals[0])
+        self.assertEqual(self.broker.published[0][self.receiver.pk], [{'proposal': self.proposals[0].pk, 'status': None}])
+
+    def test_rolled_back_change_is_not_published(self):
+        """Откаченное изменение не публикуется"""
+        self.broker.published.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    accept_proposal(self.proposals[0])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.broker.published, [])
+
+    def test_page_subscribes_only_under_asgi(self):
+        """Страница предложений подписывается на поток, только когда он обслуживается"""
+        client = Client()
+        client.force_login(self.receiver)
+        self.assertNotContains(client.get(reverse('my_proposals')), 'EventSource')
+        with override_settings(ADS_ASYNC_VIEWS=True):
+            response = client.get(reverse('my_proposals'))
+        self.assertContains(response, f"new EventSource('{streams.EVENTS_PATH}')")
+        self.assertContains(response, f'data-proposal-status="{self.proposals[0].pk}"')
+
+
+class InProcessBrokerTest(TestCase):
+    """Доставка событий подписчикам в памяти процесса"""
+
+    def test_publish_from_another_thread(self):
+        """События из потока запроса попадают в очередь подписчика в его event loop"""
+        async def scenario():
+            broker = events.InProcessBroker()
+            subscription = broker.subscribe(1)
+            other = broker.subscribe(2)
+            await sync_to_async(broker.publish, thread_sensitive=False)({'1': [{'proposal': 5, 'status': 'A'}]})
+            received = await asyncio.wait_for(subscription.get(), 1)
+            broker.unsubscribe(subscription)
+            return received, other.queue.qsize(), broker.subscriber_count()
+
+        received, other, count = async_to_sync(scenario)()
+        self.assertEqual(received, [{'proposal': 5, 'status': 'A'}])
+        self.assertEqual(other, 0)
+        self.assertEqual(count, 1)
+
+    def test_full_queue_marks_overflow(self):
+        """Медленный подписчик теряет события и получает отметку о переполнении"""
+        async def scenario():
+            subscription = events.Subscription(1, asyncio.get_running_loop())
+            for number in range(events.QUEUE_SIZE + 1):
+                subscription.put([number])
+            return subscription
+
+        subscription = async_to_sync(scenario)()
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(subscription.queue.qsize(), events.QUEUE_SIZE)
+
+    def test_notify_payloads_are_limited(self):
+        """Пачки NOTIFY не превышают ограничения и содержат все события"""
+        messages = {user_id: [{'proposal': user_id, 'status': 'R'}] * 5 for user_id in range(200)}
+        chunks = list(events._chunks(messages, 1000))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        merged = {}
+        for chunk in chunks:
+            merged.update(json.loads(chunk))
+        self.assertEqual(merged, {str(user_id): value for user_id, value in messages.items()})
+
+
+class FakeConnection:
+    """Клиент ASGI-приложения потока"""
+
+    def __init__(self, cookie=None):
+        headers = [(b'cookie', cookie.encode())] if cookie else []
+        self.scope = {'type': 'http', 'method': 'GET', 'path': streams.EVENTS_PATH, 'headers': headers}
+        self.messages = []
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+
+    def body(self):
+        return b''.join(message.get('body', b'') for message in self.messages[1:])
+
+    async def wait_for(self, text):
+        while text not in self.body():
+            await asyncio.sleep(0.001)
+
+
+@override_settings(ADS_EVENTS_BROKER='ads.events.InProcessBroker')
+class EventStreamTest(BrokerTestMixin, TestCase):
+    """ASGI-приложение потока SSE"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        client = Client()
+        client.force_login(self.user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def test_anonymous_is_forbidden(self):
+        """Без сессии поток не открывается"""
+        connection = FakeConnection('sessionid=unknown')
+        async_to_sync(streams.events_app)(connection.scope, connection.receive, connection.send)
+        self.assertEqual(connection.messages[0]['status'], 403)
+
+    def test_stream_delivers_events_until_disconnect(self):
+        """Поток получает события своего пользователя и закрывается при отключении клиента"""
+        async def scenario():
+            connection = FakeConnection(self.cookie)
+            task = asyncio.ensure_future(streams.events_app(connection.scope, connection.receive, connection.send))
+            await asyncio.wait_for(connection.wait_for(b'retry:'), 5)
+            events.broker().publish({self.user.pk + 1: [{'proposal': 1, 'status': 'A'}]})
+            events.broker().publish({self.user.pk: [{'proposal': 2, 'status': 'R'}]})
+            await asyncio.wait_for(connection.wait_for(b'event: proposal'), 5)
+            connection.disconnected.set()
+            await asyncio.wait_for(task, 5)
+            return connection
+
+        connection = async_to_sync(scenario)()
+        start = connection.messages[0]
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(
+            connection.body(),
+            f'retry: {streams.RETRY_MS}\n\nevent: proposal\ndata: {{"proposal": 2, "status": "R"}}\n\n'.encode(),
+        )
+        self.assertEqual(events.broker().subscriber_count(), 0)
+
+    @override_settings(ADS_EVENTS_HEARTBEAT=0.01)
+    def test_idle_stream_is_pinged(self):
+        """Простаивающий поток получает пинги"""
+        async def scenario():
+            connection = FakeConnection(self.cookie)
+            task = asyncio.ensure_future(streams.events_app(connection.scope, connection.receive, connection.send))
+            await asyncio.wait_for(connection.wait_for(b': ping'), 5)
+            connection.disconnected.set()
+            await asyncio.wait_for(task, 5)
+
+        async_to_sync(scenario)()
+
+    def test_router(self):
+        """Поток и lifespan обслуживает router, остальные запросы — Django"""
+        passed = []
+
+        async def django_application(scope, receive, send):
+            passed.append(scope['path'])
+
+        async def scenario():
+            application = streams.router(django_application)
+            lifespan = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+            sent = []
+
+            async def receive():
+                return next(lifespan)
+
+            async def send(message):
+                sent.append(message['type'])
+
+            await application({'type': 'lifespan'}, receive, send)
+            await application({'type': 'http', 'path': '/proposals/', 'method': 'GET'}, None, None)
+            connection = FakeConnection()
+            await application(connection.scope, connection.receive, connection.send)
+            return sent, connection
+
+        sent, connection = async_to_sync(scenario)()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(passed, ['/proposals/'])
+        self.assertEqual(connection.messages[0]['status'], 403)
+
+    def test_benchmark_command(self):
+        """Нагрузочная команда открывает потоки, доставляет события и убирает сессии"""
+        User.objects.create_user(username='other', password='testpass123')
+        out = StringIO()
+        call_command('benchmark_events', streams=20, users=2, events=5, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Открыто потоков: 20', output)
+        self.assertIn('Доставлено событий:', output)
+        self.assertIn('Подписчиков после закрытия: 0', output)
+        self.assertEqual(Session.objects.count(), 1)
@@ -0,0 +1,229 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ads import inbox, taskqueue
+from ads.models import Ad, ExchangeProposal, ProposalSummary, Task
+from ads.management.commands import run_task_worker
+from ads.services import accept_proposal, create_proposal
+
+calls = []
+
+
+@taskqueue.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@taskqueue.task('tests.fail', max_attempts=2)
+def fail(username):
+    # Изменение в базе должно откатиться вместе с ошибкой
+    User.objects.create_user(username=username)
+    raise RuntimeError('Сбой обработчика')
+
+
+@taskqueue.task('tests.locked')
+def locked():
+    calls.extend(Task.objects.filter(status='R').values_list('locked_at', flat=True))
+
+
+@taskqueue.task('tests.slow')
+def slow(username):
+    # Пока обработчик работает, блокировка истекает и задачу забирает другой воркер
+    User.objects.create_user(username=username)
+    Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+    taskqueue.claim()
+
+
+@override_settings(ADS_TASKS_EAGER=False)
+class TaskQueueTest(TestCase):
+    """Очередь фоновых задач в базе данных"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Задача выполняется воркером и помечается выполненной"""
+        taskqueue.enqueue('tests.record', {'value': 1})
+        self.assertEqual(calls, [])
+
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+
+        self.assertEqual(calls, [1])
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), ('D', 1))
+        self.assertEqual(taskqueue.run_pending(), (0, 0))
+
+    def test_idempotency_key(self):
+        """Задача с тем же ключом ставится один раз"""
+        taskqueue.enqueue('tests.record', {'value': 1}, key='once')
+        taskqueue.enqueue('tests.record', {'value': 2}, key='once')
+        taskqueue.run_pending()
+
+        self.assertEqual(calls, [1])
+
+    def test_unknown_task(self):
+        """Опечатка в имени задачи видна при постановке, а не в воркере"""
+        with self.assertRaises(LookupError):
+            taskqueue.enqueue('tests.missing')
+
+    def test_retry_then_fail(self):
+        """Ошибка откатывает изменения обработчика, задача повторяется с задержкой, затем помечается 'F'"""
+        taskqueue.enqueue('tests.fail', {'username': 'ghost'})
+
+        with self.assertLogs('ads.tasks', 'WARNING'):
+            self.assertEqual(taskqueue.run_pending(), (0, 1))
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), ('Q', 1))
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertIn('Сбой обработчика', task.last_error)
+        self.assertFalse(User.objects.filter(username='ghost').exists())
+        self.assertEqual(taskqueue.run_pending(), (0, 0))
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('ads.tasks', 'ERROR'):
+            taskqueue.run_pending()
+        self.assertEqual(Task.objects.get().status, 'F')
+
+    def test_stale_running_task_is_reclaimed(self):
+        """Задача упавшего воркера снова доступна после ADS_TASKS_LOCK_TIMEOUT"""
+        taskqueue.enqueue('tests.record', {'value': 1})
+        Task.objects.update(status='R', attempts=1, locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_lock_counts_from_task_start(self):
+        """Блокировка отсчитывается от начала задачи; забранная другим воркером задача не выполняется"""
+        taskqueue.enqueue('tests.locked')
+        [task] = taskqueue.claim()
+        # Предыдущие задачи пачки выполнялись почти ADS_TASKS_LOCK_TIMEOUT
+        task.locked_at = timezone.now() - timedelta(seconds=590)
+        Task.objects.update(locked_at=task.locked_at)
+
+        self.assertTrue(taskqueue.run(task))
+        self.assertGreater(calls[0], timezone.now() - timedelta(seconds=5))
+
+        taskqueue.enqueue('tests.record', {'value': 1})
+        [stale] = taskqueue.claim()
+        Task.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        taskqueue.claim()
+        with self.assertLogs('ads.tasks', 'WARNING'):
+            self.assertFalse(taskqueue.run(stale))
+        self.assertEqual(len(calls), 1)
+
+    def test_reclaimed_task_is_not_marked_done(self):
+        """Задача, забранная другим воркером во время выполнения, откатывается и остается за ним"""
+        taskqueue.enqueue('tests.slow', {'username': 'twice'})
+        [task] = taskqueue.claim()
+
+        with self.assertLogs('ads.tasks', 'WARNING'):
+            self.assertFalse(taskqueue.run(task))
+
+        self.assertFalse(User.objects.filter(username='twice').exists())
+        self.assertEqual(Task.objects.get().status, 'R')
+
+    def test_worker_command(self):
+        """run_task_worker --once выполняет очередь и выходит, --purge-days удаляет выполненные"""
+        for value in range(3):
+            taskqueue.enqueue('tests.record', {'value': value})
+        out = StringIO()
+
+        call_command('run_task_worker', '--once', '--batch-size', '2', stdout=out)
+        self.assertIn('Выполнено задач: 3, с ошибкой: 0', out.getvalue())
+        self.assertEqual(calls, [0, 1, 2])
+
+        Task.objects.update(updated_at=timezone.now() - timedelta(days=8))
+        call_command('run_task_worker', '--purge-days', '7', stdout=out)
+        self.assertFalse(Task.objects.exists())
+
+    def test_worker_survives_database_errors(self):
+        """Ошибка базы в воркере записывается в лог, воркер ждет и продолжает работу"""
+        stop = []
+        results = iter([OperationalError('server closed the connection unexpectedly'), (1, 0)])
+
+        def run_pending(limit):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            # После успешного прохода воркер получает SIGTERM
+            stop[0]()
+            return result
+
+        def register(number, handler):
+            stop.append(handler)
+
+        with mock.patch('signal.signal', register), \
+                mock.patch.object(taskqueue, 'run_pending', run_pending), \
+                mock.patch.object(run_task_worker.time, 'sleep') as sleep, \
+                self.assertLogs('ads.tasks', 'ERROR') as logs:
+            run_task_worker._work(0.5, 20)
+
+        sleep.assert_called_once_with(0.5)
+        self.assertIn('server closed the connection', logs.output[0])
+
+    @override_settings(ADS_TASKS_EAGER=True)
+    def test_eager(self):
+        """В eager-режиме задача выполняется сразу и не записывается"""
+        taskqueue.enqueue('tests.record', {'value': 1})
+
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(ADS_TASKS_EAGER=False)
+class DeferredProposalChangesTest(TestCase):
+    """Счетчики и сводки после событий предложений обновляются воркером"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.offers = [
+            Ad.objects.create(user=self.user1, title=f'Мое {i}', description='Описание', category='E', condition='N')
+            for i in range(2)
+        ]
+        self.target = Ad.objects.create(user=self.user2, title='Цель', description='Описание', category='B', condition='N')
+
+    def _pending_count(self):
+        return Ad.objects.get(pk=self.target.pk).received_pending_count
+
+    def test_accept(self):
+        """Принятие меняет предложения сразу, а счетчики — в задаче"""
+        proposal = create_proposal(ExchangeProposal(user=self.user1, ad_sender=self.offers[0], ad_receiver=self.target))
+        create_proposal(ExchangeProposal(user=self.user1, ad_sender=self.offers[1], ad_receiver=self.target))
+        taskqueue.run_pending()
+        self.assertEqual(self._pending_count(), 2)
+
+        self.assertEqual(accept_proposal(proposal), 1)
+
+        self.assertEqual(sorted(ExchangeProposal.objects.values_list('status', flat=True)), ['A', 'R'])
+        self.assertEqual(self._pending_count(), 2)
+        self.assertEqual(
+            set(Task.objects.filter(status='Q', key__startswith='proposal-').values_list('key', flat=True)),
+            {f'proposal-{proposal.pk}-accepted', f'proposal-{proposal.pk}-accepted-notify'},
+        )
+
+        taskqueue.run_pending()
+        target = Ad.objects.get(pk=self.target.pk)
+        self.assertEqual(
+            (target.received_pending_count, target.received_accepted_count, target.received_rejected_count), (0, 1, 1)
+        )
+
+    def test_user_deleted_before_worker(self):
+        """Задача удаленного пользователя пересчитывает вторую сторону и не создает его сводку"""
+        create_proposal(ExchangeProposal(user=self.user1, ad_sender=self.offers[0], ad_receiver=self.target))
+        taskqueue.run_pending()
+
+        self.user1.delete()
+        self.assertEqual(self._pending_count(), 1)
+
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertEqual(self._pending_count(), 0)
+        self.assertEqual(inbox.get_summary(self.user2.pk)['received_pending'], 0)
+        self.assertFalse(ProposalSummary.objects.filter(pk=self.user1.pk).exists())
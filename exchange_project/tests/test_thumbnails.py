@@ -0,0 +1,216 @@
+import shutil
+import socket
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ads import thumbnails
+from ads.models import Ad
+from PIL import Image
+
+
+class ImageServer:
+    """HTTP-сервер с изображениями для тестов загрузки; считает запросы"""
+
+    def __init__(self, files):
+        self.files = files
+        self.hits = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits.append(self.path)
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+                body = server.files[self.path]
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ThumbnailTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        storages = {**settings.STORAGES, 'thumbnails': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': location},
+        }}
+        override = override_settings(STORAGES=storages, ADS_THUMBNAIL_ALLOW_PRIVATE=True)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ThumbnailViewTest(ThumbnailTestCase):
+    """Отдача миниатюр"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.key = thumbnails.source_key('https://example.com/a.jpg')
+
+    def _get(self, variant, key=None):
+        return self.client.get(reverse('thumbnail', kwargs={'key': key or self.key, 'variant': variant}))
+
+    def test_placeholder_until_ready(self):
+        """Пока миниатюры нет, отдается заглушка её размера, которую браузер не кэширует"""
+        response = self._get('card.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn(b'width="400" height="200"', response.content)
+
+    def test_ready_variant_is_cached_for_a_year(self):
+        """Готовая миниатюра отдается из хранилища с долгим кэшированием"""
+        thumbnails.storage().save(thumbnails.variant_name(self.key, 'card', 'webp'), ContentFile(b'RIFF-webp'))
+        response = self._get('card.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(b''.join(response.streaming_content), b'RIFF-webp')
+
+    def test_unknown_variant(self):
+        """Неизвестный размер, формат или ключ — 404"""
+        self.assertEqual(self._get('huge.webp').status_code, 404)
+        self.assertEqual(self._get('card.png').status_code, 404)
+        self.assertEqual(self._get('card.webp', key='z' * 40).status_code, 404)
+
+    def test_not_scheduled_in_tests(self):
+        """С ADS_THUMBNAIL_ON_SAVE = False сохранение объявления не загружает изображение"""
+        user = User.objects.create_user(username='user', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            Ad.objects.create(user=user, title='Велосипед', description='Описание', category='O', condition='U',
+                              image_url='http://127.0.0.1:9/a.jpg')
+        self.assertFalse(any('ads_task' in query['sql'] for query in queries))
+
+
+class FetchTest(ThumbnailTestCase):
+    """Загрузка исходных изображений"""
+
+    def setUp(self):
+        super().setUp()
+        self.server = ImageServer({'/big.jpg': b'x' * 2000, '/small.jpg': b'x' * 100})
+        self.addCleanup(self.server.close)
+
+    def test_only_http_urls(self):
+        """Загружаются только адреса http и https"""
+        with self.assertRaises(thumbnails.ThumbnailError):
+            thumbnails.fetch('file:///etc/passwd')
+
+    @override_settings(ADS_THUMBNAIL_ALLOW_PRIVATE=False)
+    def test_private_addresses_are_rejected(self):
+        """Адреса локальной сети не загружаются"""
+        with self.assertRaises(thumbnails.ThumbnailError):
+            thumbnails.fetch(self.server.url('/small.jpg'))
+        self.assertEqual(self.server.hits, [])
+        with self.assertRaises(thumbnails.ThumbnailError):
+            thumbnails.fetch(f'http://localhost:{self.server.httpd.server_port}/small.jpg')
+        self.assertEqual(self.server.hits, [])
+
+    @override_settings(ADS_THUMBNAIL_ALLOW_PRIVATE=False)
+    def test_connection_uses_checked_address(self):
+        """Соединение открывается с проверенным адресом: имя хоста повторно не разрешается"""
+        resolved = []
+        real = socket.getaddrinfo
+
+        def rebinding(host, *args, **kwargs):
+            # Первый ответ — внешний адрес, следующие — локальный
+            resolved.append(host)
+            if len(resolved) == 1:
+                return real('93.184.216.34', *args, **kwargs)
+            return real('127.0.0.1', *args, **kwargs)
+
+        with mock.patch('socket.getaddrinfo', rebinding), \
+                mock.patch('socket.socket.connect', side_effect=ConnectionRefusedError) as connect:
+            with self.assertRaises(OSError):
+                thumbnails.fetch('http://rebind.example/small.jpg')
+        self.assertEqual(resolved, ['rebind.example'])
+        self.assertEqual(connect.call_args.args[0][0], '93.184.216.34')
+        self.assertEqual(self.server.hits, [])
+
+    @override_settings(ADS_THUMBNAIL_MAX_BYTES=1000)
+    def test_size_limit(self):
+        """Слишком большие изображения отклоняются"""
+        self.assertEqual(thumbnails.fetch(self.server.url('/small.jpg')), b'x' * 100)
+        with self.assertRaises(thumbnails.ThumbnailError):
+            thumbnails.fetch(self.server.url('/big.jpg'))
+
+    def test_network_errors_retry_the_task(self):
+        """Сетевая ошибка повторяет задачу"""
+        with self.assertRaises(OSError):
+            thumbnails.make([self.server.url('/missing.jpg')])
+
+
+@override_settings(ADS_THUMBNAIL_ON_SAVE=True)
+class ThumbnailPipelineTest(ThumbnailTestCase):
+    """Создание миниатюр при сохранении объявлений"""
+
+    def setUp(self):
+        super().setUp()
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), 'red').save(buffer, format='PNG')
+        self.server = ImageServer({'/photo.png': buffer.getvalue(), '/text.png': b'not an image'})
+        self.addCleanup(self.server.close)
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        self.client = Client()
+
+    def _ad(self, url):
+        return Ad.objects.create(user=self.user, title='Велосипед', description='Описание', category='O',
+                                 condition='U', image_url=url)
+
+    def test_variants_are_made_once(self):
+        """Изображение загружается один раз; варианты нужных размеров в обоих форматах"""
+        url = self.server.url('/photo.png')
+        self._ad(url)
+        self._ad(url)
+        self.assertEqual(self.server.hits, ['/photo.png'])
+        self.assertTrue(thumbnails.is_ready(url))
+
+        urls = thumbnails.thumbnail_urls(url, 'card')
+        for ext, fmt in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            response = self.client.get(urls[ext])
+            with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+                self.assertEqual((image.format, image.size), (fmt, (400, 200)))
+        with Image.open(BytesIO(b''.join(self.client.get(thumbnails.thumbnail_urls(url, 'detail')['jpg']).streaming_content))) as image:
+            self.assertEqual(image.size, (800, 600))
+
+    def test_invalid_image_is_skipped(self):
+        """Не изображение — миниатюр нет, страница показывает заглушку"""
+        url = self.server.url('/text.png')
+        self._ad(url)
+        self.assertFalse(thumbnails.is_ready(url))
+        response = self.client.get(thumbnails.thumbnail_urls(url, 'card')['webp'])
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+
+    def test_card_uses_thumbnails(self):
+        """Карточка ленты ссылается на миниатюру, а не на исходное изображение"""
+        url = self.server.url('/photo.png')
+        self._ad(url)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnails.thumbnail_urls(url, 'card')['webp'])
+        self.assertNotContains(response, f'src="{url}"')